@@ -5,19 +5,98 @@ import signal
 import logging
 import threading
 import time
-from typing import Dict, Any, Optional, Tuple, List
+import selectors
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Optional, Tuple, List
+
+from common.output import OUTPUT_CHUNK_SIZE, STDERR, STDOUT
 
 logger = logging.getLogger(__name__)
 
+# How long a timed-out process group gets to exit after SIGTERM before SIGKILL
+KILL_GRACE_SECONDS = 5.0
+
+# on_output(stream, offset, data): one chunk of a stream, in order
+OutputCallback = Callable[[str, int, bytes], None]
+
+class _OutputBuffer:
+    """
+    One output stream of a running command.
+
+    Reads accumulate until a full chunk or ``flush_interval`` has passed,
+    so a tool printing a line at a time does not turn into a frame per
+    line. Only the last ``tail_bytes`` are kept after that.
+    """
+
+    def __init__(self, stream: str, chunk_size: int, tail_bytes: int, on_output: Optional[OutputCallback]):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.tail_bytes = tail_bytes
+        self.on_output = on_output
+        self.pending = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.sent = 0
+        self.last_flush = time.monotonic()
+
+    def feed(self, data: bytes) -> None:
+        self.total += len(data)
+        self.tail += data
+        if len(self.tail) > self.tail_bytes:
+            del self.tail[:len(self.tail) - self.tail_bytes]
+        if self.on_output is None:
+            return
+        self.pending += data
+        while len(self.pending) >= self.chunk_size:
+            self._emit(bytes(self.pending[:self.chunk_size]))
+            del self.pending[:self.chunk_size]
+
+    def flush_due(self, now: float, interval: float) -> None:
+        if now - self.last_flush >= interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if self.pending:
+            self._emit(bytes(self.pending))
+            self.pending.clear()
+
+    def _emit(self, data: bytes) -> None:
+        try:
+            self.on_output(self.stream, self.sent, data)
+        except Exception as e:
+            logger.error(f"Error forwarding {self.stream} output: {e}")
+        self.sent += len(data)
+
+    def text(self) -> str:
+        return self.tail.decode(errors="replace")
+
 class CommandExecutor:
-    def __init__(self):
+    """
+    Runs commands in their own process group, one monitoring thread each.
+
+    Output is streamed in chunks of up to ``chunk_size`` bytes, at least
+    every ``flush_interval`` seconds while a stream has new data. Results
+    carry the last ``tail_bytes`` of each stream.
+    """
+
+    def __init__(self, chunk_size: int = OUTPUT_CHUNK_SIZE, flush_interval: float = 0.5,
+                 tail_bytes: int = 64 * 1024):
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.tail_bytes = tail_bytes
         self.processes = {}
         self.results = {}
+        self.futures: Dict[str, Future] = {}
         self.lock = threading.Lock()
     
-    def execute(self, command_id: str, command: str, timeout: Optional[int] = None) -> Dict[str, Any]:
+    def execute(self, command_id: str, command: str, timeout: Optional[int] = None,
+                on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
         """
         Execute a command and return the result
+
+        ``on_output`` receives the output as it is produced, on the
+        monitoring thread.
         """
         with self.lock:
             if command_id in self.processes:
@@ -32,17 +111,17 @@ class CommandExecutor:
                 args,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
                 preexec_fn=os.setsid
             )
             
             with self.lock:
                 self.processes[command_id] = process
+                self.futures[command_id] = Future()
             
             # Start monitoring thread
             threading.Thread(
                 target=self._monitor_process,
-                args=(command_id, process, timeout),
+                args=(command_id, process, timeout, on_output),
                 daemon=True
             ).start()
             
@@ -52,39 +131,79 @@ class CommandExecutor:
             logger.error(f"Error executing command {command_id}: {e}")
             return {"status": "error", "message": str(e)}
     
-    def _monitor_process(self, command_id: str, process: subprocess.Popen, timeout: Optional[int] = None):
+    def _monitor_process(self, command_id: str, process: subprocess.Popen, timeout: Optional[int] = None,
+                         on_output: Optional[OutputCallback] = None):
         """
         Monitor process execution and collect results
+
+        Both pipes are read in bounded chunks as the process writes them, so
+        memory stays flat however much it prints. Chunks go to ``on_output``
+        and only the tail of each stream is kept for the result.
         """
         start_time = time.time()
+        deadline = start_time + timeout if timeout else None
+        status = "completed"
+        buffers = {
+            process.stdout.fileno(): _OutputBuffer(STDOUT, self.chunk_size, self.tail_bytes, on_output),
+            process.stderr.fileno(): _OutputBuffer(STDERR, self.chunk_size, self.tail_bytes, on_output),
+        }
         try:
-            stdout, stderr = process.communicate(timeout=timeout)
-            
-            result = {
-                "status": "completed",
-                "command_id": command_id,
-                "exit_code": process.returncode,
-                "stdout": stdout,
-                "stderr": stderr,
-                "execution_time": time.time() - start_time
-            }
-            
-        except subprocess.TimeoutExpired:
-            # Kill the process group
+            with selectors.DefaultSelector() as selector:
+                for fd in buffers:
+                    selector.register(fd, selectors.EVENT_READ)
+
+                while selector.get_map():
+                    wait = self.flush_interval
+                    if deadline is not None and status != "timeout":
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            # Kill the process group, then drain what it wrote
+                            status = "timeout"
+                            self._kill(process)
+                        else:
+                            wait = min(wait, remaining)
+
+                    for key, _ in selector.select(wait):
+                        data = os.read(key.fd, self.chunk_size)
+                        if data:
+                            buffers[key.fd].feed(data)
+                        else:
+                            selector.unregister(key.fd)
+
+                    now = time.monotonic()
+                    for buffer in buffers.values():
+                        buffer.flush_due(now, self.flush_interval)
+
+            for buffer in buffers.values():
+                buffer.flush()
+            # The pipes can close while the process keeps running: the
+            # timeout still applies
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
             try:
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                process.terminate()
-            except:
-                pass
-            
-            stdout, stderr = process.communicate()
-            
+                process.wait(timeout=remaining)
+            except subprocess.TimeoutExpired:
+                status = "timeout"
+                self._kill(process)
+                try:
+                    process.wait(timeout=KILL_GRACE_SECONDS)
+                except subprocess.TimeoutExpired:
+                    try:
+                        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+                    except OSError:
+                        pass
+                    process.wait()
+            process.stdout.close()
+            process.stderr.close()
+
+            stdout, stderr = buffers.values()
             result = {
-                "status": "timeout",
+                "status": status,
                 "command_id": command_id,
-                "exit_code": -1,
-                "stdout": stdout,
-                "stderr": stderr,
+                "exit_code": process.returncode if status == "completed" else -1,
+                "stdout": stdout.text(),
+                "stderr": stderr.text(),
+                "stdout_bytes": stdout.total,
+                "stderr_bytes": stderr.total,
                 "execution_time": time.time() - start_time
             }
             
@@ -103,6 +222,56 @@ class CommandExecutor:
             self.results[command_id] = result
             if command_id in self.processes:
                 del self.processes[command_id]
+            future = self.futures.pop(command_id, None)
+
+        # Outside the lock: callbacks run here and may call back into the executor
+        if future is not None:
+            future.set_result(result)
+
+    @staticmethod
+    def _kill(process: subprocess.Popen) -> None:
+        try:
+            os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+            process.terminate()
+        except:
+            pass
+
+    def completion(self, command_id: str) -> Optional[Future]:
+        """
+        A future resolving to the command's result when its process exits
+
+        None if the command is not running; its result, if any, is then
+        available from get_result.
+        """
+        with self.lock:
+            return self.futures.get(command_id)
+
+    def when_complete(self, command_id: str, callback: Callable[[Dict[str, Any]], None]) -> bool:
+        """
+        Call ``callback`` with the command's result as soon as its process exits
+
+        The callback runs on the monitoring thread, or right away on this one
+        if the command has already finished. Returns False for an unknown
+        command.
+        """
+        with self.lock:
+            future = self.futures.get(command_id)
+            result = self.results.get(command_id)
+
+        if future is not None:
+            future.add_done_callback(lambda done: callback(done.result()))
+        elif result is not None:
+            callback(result)
+        else:
+            return False
+        return True
+
+    def running(self) -> int:
+        """
+        Number of commands whose process has not exited yet
+        """
+        with self.lock:
+            return len(self.processes)
     
     def get_result(self, command_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -0,0 +1,409 @@
+import asyncio
+import itertools
+import logging
+import ssl
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from common.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "do-control-agent"
+
+# Replaced by the request's sequence number in a template's path and body
+REQUEST_NUMBER = "{n}"
+
+# Statuses whose responses never have a body, like responses to HEAD
+_NO_BODY_STATUSES = (204, 304)
+
+class RequestTemplate:
+    """
+    One kind of request a load test sends.
+
+    The request is encoded once up front; only templates whose path or body
+    contain ``{n}`` are re-rendered per request, with ``{n}`` replaced by the
+    request's sequence number. ``weight`` sets how often it is picked
+    relative to the other templates.
+    """
+
+    def __init__(self, url: str, method: str = "GET", headers: Optional[Dict[str, str]] = None,
+                 body: Optional[str] = None, weight: int = 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported load test URL: {url}")
+        self.url = url
+        self.method = method.upper()
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.headers = headers or {}
+        self.body = body
+        self.weight = weight
+        self.dynamic = REQUEST_NUMBER in self.path or (body is not None and REQUEST_NUMBER in body)
+        self._encoded = self._encode(self.path, body)
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "RequestTemplate":
+        return cls(spec["url"], spec.get("method", "GET"), spec.get("headers"), spec.get("body"), spec.get("weight", 1))
+
+    @property
+    def origin(self) -> Tuple[str, str, int]:
+        return self.scheme, self.host, self.port
+
+    def _encode(self, path: str, body: Optional[str]) -> bytes:
+        payload = body.encode() if body is not None else b""
+        host = self.host if self.port in (80, 443) else f"{self.host}:{self.port}"
+        lines = [f"{self.method} {path} HTTP/1.1", f"Host: {host}", f"User-Agent: {USER_AGENT}"]
+        lines += [f"{name}: {value}" for name, value in self.headers.items()]
+        if body is not None or self.method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(payload)}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode() + payload
+
+    def render(self, n: int) -> bytes:
+        if not self.dynamic:
+            return self._encoded
+        number = str(n)
+        body = self.body.replace(REQUEST_NUMBER, number) if self.body is not None else None
+        return self._encode(self.path.replace(REQUEST_NUMBER, number), body)
+
+class _Connection:
+    """A keep-alive HTTP/1.1 connection"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.responded = False
+
+    async def request(self, data: bytes, head: bool) -> Tuple[int, int, bool]:
+        """Send a request and read the whole response; returns (status, body bytes, keep-alive)"""
+        self.responded = False
+        self.writer.write(data)
+        await self.writer.drain()
+
+        reader = self.reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before the response")
+        self.responded = True
+        version, status = status_line.split(None, 2)[:2]
+        status = int(status)
+
+        length = None
+        chunked = False
+        keep_alive = version == b"HTTP/1.1"
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value.lower()
+            elif name == b"connection":
+                keep_alive = value.strip().lower() == b"keep-alive"
+
+        if head or status in _NO_BODY_STATUSES or 100 <= status < 200:
+            return status, 0, keep_alive
+        if chunked:
+            return status, await self._read_chunked(), keep_alive
+        if length is not None:
+            await reader.readexactly(length)
+            return status, length, keep_alive
+        # Delimited by the server closing the connection
+        return status, len(await reader.read()), False
+
+    async def _read_chunked(self) -> int:
+        reader = self.reader
+        total = 0
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0], 16)
+            if size == 0:
+                # Trailers end with an empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return total
+            await reader.readexactly(size + 2)
+            total += size
+
+    def close(self) -> None:
+        self.writer.close()
+
+class ConnectionPool:
+    """Idle keep-alive connections to one origin, reused most recent first"""
+
+    def __init__(self, scheme: str, host: str, port: int, ssl_context: Optional[ssl.SSLContext] = None):
+        self.host = host
+        self.port = port
+        self.ssl = (ssl_context or ssl.create_default_context()) if scheme == "https" else None
+        self.idle: List[_Connection] = []
+        self.opened = 0
+
+    async def acquire(self) -> Tuple[_Connection, bool]:
+        """A connection and whether it was reused"""
+        if self.idle:
+            return self.idle.pop(), True
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        self.opened += 1
+        return _Connection(reader, writer), False
+
+    def release(self, connection: _Connection, reusable: bool) -> None:
+        if reusable:
+            self.idle.append(connection)
+        else:
+            connection.close()
+
+    def close(self) -> None:
+        for connection in self.idle:
+            connection.close()
+        self.idle.clear()
+
+class LoadStats:
+    """
+    Counters for a stretch of a load test: one second of it, or the whole
+    run, which is the sum of its seconds
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.statuses: Dict[str, int] = {}
+        self.error_types: Dict[str, int] = {}
+        self.latency = LatencyHistogram()
+
+    def record(self, status: int, size: int, latency_ms: float) -> None:
+        self.requests += 1
+        self.bytes += size
+        key = str(status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        self.latency.record(latency_ms)
+
+    def record_error(self, error: BaseException) -> None:
+        self.errors += 1
+        key = type(error).__name__
+        self.error_types[key] = self.error_types.get(key, 0) + 1
+
+    def merge(self, other: "LoadStats") -> None:
+        self.requests += other.requests
+        self.errors += other.errors
+        self.bytes += other.bytes
+        for key, count in other.statuses.items():
+            self.statuses[key] = self.statuses.get(key, 0) + count
+        for key, count in other.error_types.items():
+            self.error_types[key] = self.error_types.get(key, 0) + count
+        self.latency.merge(other.latency)
+
+    def summary(self, ended: float) -> Dict[str, Any]:
+        elapsed = max(ended - self.started, 1e-9)
+        return {
+            "start": self.started,
+            "duration": elapsed,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rps": self.requests / elapsed,
+            "bytes": self.bytes,
+            "statuses": dict(self.statuses),
+            "error_types": dict(self.error_types),
+            "latency": self.latency.summary(),
+            # Mergeable across agents and seconds, unlike the percentiles above
+            "latency_histogram": self.latency.to_dict(),
+        }
+
+def _optional(convert: Callable[[Any], Any], value: Any) -> Any:
+    """``value`` converted, or None"""
+    return None if value is None else convert(value)
+
+class LoadEngine:
+    """
+    Closed- or open-loop HTTP load generator on one event loop.
+
+    ``concurrency`` workers each keep one request in flight over pooled
+    keep-alive connections, until ``duration`` seconds have passed or
+    ``max_requests`` were sent. With ``rate``, requests are instead started
+    on a fixed schedule of ``rate`` per second (still at most
+    ``concurrency`` in flight), and latency counts from the scheduled time,
+    so a slow server cannot hide queueing delay. Every second's stats go to
+    ``on_second``, histogram included; ``run`` returns the totals with the
+    last ``timeline_seconds`` of them, without their histograms.
+    """
+
+    def __init__(self, templates: List[RequestTemplate], concurrency: int = 10, duration: Optional[float] = 10.0,
+                 max_requests: Optional[int] = None, rate: Optional[float] = None, timeout: float = 10.0,
+                 on_second: Optional[Callable[[Dict[str, Any]], None]] = None, timeline_seconds: int = 3600,
+                 clock: Callable[[], float] = time.time):
+        if not templates:
+            raise ValueError("A load test needs at least one request template")
+        if duration is None and max_requests is None:
+            raise ValueError("A load test needs a duration or max_requests")
+        # Zero or negative values would spin forever or divide by zero
+        for name, value in (("concurrency", concurrency), ("duration", duration), ("max_requests", max_requests),
+                            ("rate", rate), ("timeout", timeout)):
+            if value is not None and not value > 0:
+                raise ValueError(f"A load test's {name} must be positive, got {value}")
+        self.templates = templates
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = max_requests
+        self.rate = rate
+        self.timeout = timeout
+        self.on_second = on_second
+        self.timeline_seconds = timeline_seconds
+        self.clock = clock
+        # Weighted round-robin: each template appears weight times
+        self._schedule = [t for t in templates for _ in range(max(1, t.weight))]
+        self._pools: Dict[Tuple[str, str, int], ConnectionPool] = {}
+        self._stopped: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_requested = False
+        self._numbers = itertools.count()
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any], **kwargs) -> "LoadEngine":
+        """An engine for a load command's spec: a ``url`` or a list of ``requests`` plus run options"""
+        requests = spec.get("requests") or [{key: spec[key] for key in ("url", "method", "headers", "body") if key in spec}]
+        return cls(
+            [RequestTemplate.from_dict(request) for request in requests],
+            concurrency=int(spec.get("concurrency", 10)),
+            duration=_optional(float, spec.get("duration", 10.0 if "max_requests" not in spec else None)),
+            max_requests=_optional(int, spec.get("max_requests")),
+            rate=_optional(float, spec.get("rate")),
+            timeout=float(spec.get("timeout", 10.0)),
+            **kwargs
+        )
+
+    def stop(self) -> None:
+        """End the run early; safe to call from any thread, even before the run starts"""
+        self._stop_requested = True
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def run(self) -> Dict[str, Any]:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self._stop_requested:
+            self._stopped.set()
+        started = self.clock()
+        self.total = LoadStats(started)
+        self.second = LoadStats(started)
+        self.timeline: Deque[Dict[str, Any]] = deque(maxlen=self.timeline_seconds)
+        self._started_perf = time.perf_counter()
+
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        ticker = asyncio.create_task(self._tick())
+        try:
+            waiting = [asyncio.create_task(self._stopped.wait())]
+            if self.duration is not None:
+                waiting.append(asyncio.create_task(asyncio.sleep(self.duration)))
+            await asyncio.wait(waiting + [asyncio.gather(*workers)], return_when=asyncio.FIRST_COMPLETED)
+            for task in waiting:
+                task.cancel()
+        finally:
+            self._stopped.set()
+            for worker in workers:
+                worker.cancel()
+            ticker.cancel()
+            await asyncio.gather(*workers, ticker, return_exceptions=True)
+            for pool in self._pools.values():
+                pool.close()
+
+        ended = self.clock()
+        self._rotate(ended)
+        result = self.total.summary(ended)
+        result["connections"] = sum(pool.opened for pool in self._pools.values())
+        result["timeline"] = list(self.timeline)
+        return result
+
+    def _pool(self, template: RequestTemplate) -> ConnectionPool:
+        pool = self._pools.get(template.origin)
+        if pool is None:
+            pool = self._pools[template.origin] = ConnectionPool(*template.origin)
+        return pool
+
+    async def _worker(self) -> None:
+        schedule = self._schedule
+        while not self._stopped.is_set():
+            n = next(self._numbers)
+            if self.max_requests is not None and n >= self.max_requests:
+                return
+            template = schedule[n % len(schedule)]
+
+            if self.rate:
+                # Open loop: request n starts at its slot, whether or not earlier ones finished
+                due = self._started_perf + n / self.rate
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                begun = due
+            else:
+                begun = time.perf_counter()
+
+            try:
+                status, size = await asyncio.wait_for(self._send(template, n), self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.second.record_error(e)
+                continue
+            latency_ms = (time.perf_counter() - begun) * 1000
+            self.second.record(status, size, latency_ms)
+
+    async def _send(self, template: RequestTemplate, n: int) -> Tuple[int, int]:
+        pool = self._pool(template)
+        data = template.render(n)
+        head = template.method == "HEAD"
+        while True:
+            connection, reused = await pool.acquire()
+            try:
+                status, size, keep_alive = await connection.request(data, head)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                connection.close()
+                # The server closed an idle keep-alive connection; try another
+                if reused and not connection.responded:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            pool.release(connection, keep_alive)
+            return status, size
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            self._rotate(self.clock())
+
+    def _rotate(self, now: float) -> None:
+        """Close the current second of stats and start the next"""
+        second, self.second = self.second, LoadStats(now)
+        self.total.merge(second)
+        summary = second.summary(now)
+        self.timeline.append({key: value for key, value in summary.items() if key != "latency_histogram"})
+        if self.on_second:
+            try:
+                self.on_second(summary)
+            except Exception as e:
+                logger.error(f"Error reporting load stats: {e}")
+
+def run_load_in_thread(engine: LoadEngine, on_complete: Callable[[Dict[str, Any]], None]) -> threading.Thread:
+    """Run a load engine on its own event loop in a daemon thread"""
+
+    def run() -> None:
+        try:
+            result = asyncio.run(engine.run())
+            result["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Load test failed: {e}")
+            result = {"status": "error", "message": str(e)}
+        on_complete(result)
+
+    thread = threading.Thread(target=run, name="load-engine", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,228 @@
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# (name, path under the proc root); all are opened once and re-read in place
+PROC_FILES = (
+    ("stat", "stat"),
+    ("meminfo", "meminfo"),
+    ("net_dev", "net/dev"),
+    ("snmp", "net/snmp"),
+    ("sockstat", "net/sockstat"),
+    ("self_stat", "self/stat"),
+)
+
+MEMINFO_FIELDS = (b"MemTotal:", b"MemAvailable:", b"Cached:", b"SwapTotal:", b"SwapFree:")
+
+# Columns of /proc/net/dev after the interface name, and the ones we report
+NET_DEV_FIELDS = {"rx_bytes": 0, "rx_packets": 1, "rx_errors": 2, "rx_drops": 3,
+                  "tx_bytes": 8, "tx_packets": 9, "tx_errors": 10, "tx_drops": 11}
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _percent(part: float, whole: float) -> float:
+    return round(part / whole * 100.0, 2) if whole > 0 else 0.0
+
+def _rate(current: int, previous: Optional[int], elapsed: float) -> float:
+    if previous is None or elapsed <= 0 or current < previous:
+        return 0.0
+    return round((current - previous) / elapsed, 2)
+
+class ProcSampler:
+    """
+    System metrics read straight from /proc.
+
+    Every file is opened once and re-read with a single ``pread`` per sample,
+    and only the fields we report are parsed, so sampling several times a
+    second costs a few hundred microseconds. Counters are turned into rates
+    and percentages over the time since the previous sample; the first
+    sample is measured from when the sampler was created.
+    """
+
+    def __init__(self, root: str = "/proc", disk_path: str = "/", clock: Callable[[], float] = time.monotonic):
+        self.root = root
+        self.disk_path = disk_path
+        self.clock = clock
+        self._fds: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        try:
+            for name, path in PROC_FILES:
+                self._fds[name] = os.open(os.path.join(root, path), os.O_RDONLY)
+                self._sizes[name] = 4096
+        except OSError:
+            self.close()
+            raise
+        self._previous = self._counters()
+
+    @staticmethod
+    def available(root: str = "/proc") -> bool:
+        return all(os.path.exists(os.path.join(root, path)) for _, path in PROC_FILES)
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def _read(self, name: str) -> bytes:
+        """The whole file; the read buffer grows until one pread gets all of it"""
+        fd, size = self._fds[name], self._sizes[name]
+        while True:
+            data = os.pread(fd, size, 0)
+            if len(data) < size:
+                return data
+            size *= 2
+            self._sizes[name] = size
+
+    def _counters(self) -> Dict[str, Any]:
+        """Raw cumulative counters, for computing the next sample's rates"""
+        cpus: Dict[str, Tuple[int, int, List[int]]] = {}
+        for line in self._read("stat").split(b"\n"):
+            if not line.startswith(b"cpu"):
+                break
+            name, *values = line.split()
+            ticks = [int(value) for value in values[:8]]
+            # Idle time includes waiting on I/O
+            cpus[name.decode()] = (sum(ticks), ticks[3] + ticks[4], ticks)
+
+        interfaces: Dict[str, List[int]] = {}
+        for line in self._read("net_dev").split(b"\n")[2:]:
+            name, _, values = line.partition(b":")
+            name = name.strip()
+            if name and name != b"lo":
+                columns = values.split()
+                interfaces[name.decode()] = [int(columns[index]) for index in NET_DEV_FIELDS.values()]
+
+        tcp = {}
+        header = None
+        for line in self._read("snmp").split(b"\n"):
+            if line.startswith(b"Tcp:"):
+                if header is None:
+                    header = line.split()
+                else:
+                    tcp = dict(zip(header, line.split()))
+                    break
+
+        process = self._read("self_stat").rpartition(b")")[2].split()
+        return {
+            "time": self.clock(),
+            "cpus": cpus,
+            "interfaces": interfaces,
+            "retrans_segs": int(tcp.get(b"RetransSegs", 0)),
+            "out_segs": int(tcp.get(b"OutSegs", 0)),
+            "curr_estab": int(tcp.get(b"CurrEstab", 0)),
+            # utime + stime, then threads and resident pages
+            "process_ticks": int(process[11]) + int(process[12]),
+            "process_threads": int(process[17]),
+            "process_rss_pages": int(process[21]),
+        }
+
+    def _memory(self) -> Dict[str, Any]:
+        values = {}
+        for line in self._read("meminfo").split(b"\n"):
+            if line.startswith(MEMINFO_FIELDS):
+                name, value = line.split()[:2]
+                values[name] = int(value) * 1024
+        return {
+            "total_bytes": values.get(b"MemTotal:", 0),
+            "available_bytes": values.get(b"MemAvailable:", 0),
+            "cached_bytes": values.get(b"Cached:", 0),
+            "swap_used_bytes": values.get(b"SwapTotal:", 0) - values.get(b"SwapFree:", 0),
+        }
+
+    def _sockets(self) -> Dict[str, int]:
+        sockets = {}
+        for line in self._read("sockstat").split(b"\n"):
+            protocol, _, values = line.partition(b":")
+            if protocol in (b"TCP", b"UDP"):
+                fields = values.split()
+                counts = dict(zip(fields[::2], fields[1::2]))
+                prefix = protocol.decode().lower()
+                sockets[f"{prefix}_inuse"] = int(counts.get(b"inuse", 0))
+                if protocol == b"TCP":
+                    sockets["tcp_time_wait"] = int(counts.get(b"tw", 0))
+                    sockets["tcp_orphan"] = int(counts.get(b"orphan", 0))
+        return sockets
+
+    def _disk_percent(self) -> float:
+        try:
+            stats = os.statvfs(self.disk_path)
+        except OSError:
+            return 0.0
+        total = stats.f_blocks * stats.f_frsize
+        used = (stats.f_blocks - stats.f_bfree) * stats.f_frsize
+        # Like df: blocks reserved for root count as neither used nor available
+        usable = used + stats.f_bavail * stats.f_frsize
+        return _percent(used, usable or total)
+
+    def sample(self) -> Dict[str, Any]:
+        """Current metrics; rates cover the time since the previous call"""
+        previous, current = self._previous, self._counters()
+        self._previous = current
+        elapsed = current["time"] - previous["time"]
+
+        cpu_percent = 0.0
+        cores = {}
+        cpu = {}
+        for name, (total, idle, ticks) in current["cpus"].items():
+            before = previous["cpus"].get(name)
+            if before is None:
+                continue
+            delta_total = total - before[0]
+            busy = _percent(delta_total - (idle - before[1]), delta_total)
+            if name == "cpu":
+                deltas = [now - then for now, then in zip(ticks, before[2])]
+                cpu = {
+                    "user": _percent(deltas[0] + deltas[1], delta_total),
+                    "system": _percent(deltas[2] + deltas[5] + deltas[6], delta_total),
+                    "iowait": _percent(deltas[4], delta_total),
+                    "steal": _percent(deltas[7], delta_total),
+                }
+                cpu_percent = busy
+            else:
+                cores[name[3:]] = busy
+        cpu["cores"] = cores
+
+        network: Dict[str, Any] = {"bytes_sent": 0, "bytes_recv": 0}
+        totals = dict.fromkeys(NET_DEV_FIELDS, 0.0)
+        interfaces = {}
+        for name, counters in current["interfaces"].items():
+            before = previous["interfaces"].get(name, [None] * len(counters))
+            rates = {
+                f"{field}_per_s": _rate(now, then, elapsed)
+                for field, now, then in zip(NET_DEV_FIELDS, counters, before)
+            }
+            interfaces[name] = rates
+            for field in NET_DEV_FIELDS:
+                totals[field] += rates[f"{field}_per_s"]
+            network["bytes_recv"] += counters[0]
+            network["bytes_sent"] += counters[4]
+        network.update({f"{field}_per_s": round(value, 2) for field, value in totals.items()})
+        network["interfaces"] = interfaces
+
+        out_segs = current["out_segs"] - previous["out_segs"]
+        retrans = current["retrans_segs"] - previous["retrans_segs"]
+        tcp = {
+            "retrans_segs_per_s": _rate(current["retrans_segs"], previous["retrans_segs"], elapsed),
+            "retrans_percent": _percent(retrans, out_segs),
+            "established": current["curr_estab"],
+        }
+        tcp.update(self._sockets())
+
+        process_ticks = current["process_ticks"] - previous["process_ticks"]
+        memory = self._memory()
+        return {
+            "cpu_percent": cpu_percent,
+            "memory_percent": _percent(memory["total_bytes"] - memory["available_bytes"], memory["total_bytes"]),
+            "disk_percent": self._disk_percent(),
+            "cpu": cpu,
+            "memory": memory,
+            "network": network,
+            "tcp": tcp,
+            "process": {
+                "cpu_percent": _percent(process_ticks / CLOCK_TICKS, elapsed),
+                "threads": current["process_threads"],
+                "rss_bytes": current["process_rss_pages"] * PAGE_SIZE,
+            },
+            "interval": round(elapsed, 3),
+        }
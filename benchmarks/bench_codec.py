@@ -0,0 +1,110 @@
+"""
+Microbenchmark for the message codecs.
+
+Compares encode/decode time and bytes per message for the payloads the
+agents actually send: 5-second system metrics, status updates and command
+results (with a large stdout).
+
+    python -m benchmarks.bench_codec [iterations]
+"""
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from common.codecs import MessageCodec, CODECS, COMPRESSORS, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE
+
+AGENT_ID = str(uuid.uuid4())
+
+def metrics_payload() -> Dict[str, Any]:
+    return {
+        "agent_id": AGENT_ID,
+        "timestamp": time.time(),
+        "metrics": {
+            "cpu_percent": 37.5,
+            "memory_percent": 61.2,
+            "disk_percent": 44.0,
+            "network": {"bytes_sent": 18234512, "bytes_recv": 99182731},
+            "time_sync": {
+                "last_sync": time.time() - 120,
+                "offset": 0.000183,
+                "drift_rate": 1.2e-07,
+                "sync_error": None,
+                "using_ntp": True
+            }
+        }
+    }
+
+def status_payload() -> Dict[str, Any]:
+    return {
+        "agent_id": AGENT_ID,
+        "hostname": "load-gen-nyc1-042",
+        "ip_address": "10.116.0.42",
+        "status": "busy",
+        "timestamp": time.time(),
+        "details": {
+            "execution_id": str(uuid.uuid4()),
+            "command_id": str(uuid.uuid4()),
+            "execution_status": "started"
+        }
+    }
+
+def result_payload() -> Dict[str, Any]:
+    line = "Requests/sec:  12873.44  Transfer/sec:  4.21MB  Latency  7.41ms  12.02ms 184.30ms  91.2%\n"
+    return {
+        "agent_id": AGENT_ID,
+        "command_id": str(uuid.uuid4()),
+        "timestamp": time.time(),
+        "result": {
+            "status": "completed",
+            "command_id": str(uuid.uuid4()),
+            "exit_code": 0,
+            "stdout": line * 2000,
+            "stderr": "",
+            "execution_time": 3600.42
+        }
+    }
+
+def codecs_under_test() -> List[Tuple[str, MessageCodec]]:
+    variants = []
+    for content_type, name in ((JSON_CONTENT_TYPE, "json"), (MSGPACK_CONTENT_TYPE, "msgpack")):
+        if content_type not in CODECS:
+            continue
+        variants.append((name, MessageCodec(content_type)))
+        for encoding in COMPRESSORS:
+            variants.append((f"{name}+{encoding}", MessageCodec(content_type, compression=encoding,
+                                                               compression_threshold=1024)))
+    return variants
+
+def bench(codec: MessageCodec, message: Dict[str, Any], iterations: int) -> Tuple[float, float, int]:
+    body, content_type, content_encoding = codec.encode(message)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(message)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(body, content_type, content_encoding)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+
+    return encode_us, decode_us, len(body)
+
+def main(iterations: int = 2000) -> None:
+    payloads = {
+        "metrics": metrics_payload(),
+        "status": status_payload(),
+        "result": result_payload(),
+    }
+
+    print(f"{'payload':<8} {'codec':<16} {'encode us':>10} {'decode us':>10} {'bytes':>9}")
+    for payload_name, message in payloads.items():
+        # Large results are much slower; keep total runtime reasonable
+        n = iterations if payload_name != "result" else max(1, iterations // 20)
+        for codec_name, codec in codecs_under_test():
+            encode_us, decode_us, size = bench(codec, message, n)
+            print(f"{payload_name:<8} {codec_name:<16} {encode_us:>10.2f} {decode_us:>10.2f} {size:>9}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
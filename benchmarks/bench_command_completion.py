@@ -0,0 +1,65 @@
+"""
+Benchmark for agent command completion-to-report latency.
+
+Runs short commands through CommandExecutor and measures the time from the
+process's last action (printing a timestamp on its way out) to the moment
+the agent would publish the result: with the completion callback the agent
+uses now, and with the 1-second get_result polling it used before.
+
+    python -m benchmarks.bench_command_completion [--runs 200] [--poll-runs 10]
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from agent.executor.command import CommandExecutor
+
+# Prints the time and exits; the result is complete once its pipes close
+COMMAND = "date +%s.%N"
+
+def report_latency(result, reported: float) -> float:
+    return reported - float(result["stdout"])
+
+def callback_run(executor: CommandExecutor, command_id: str) -> float:
+    reported = {}
+    done = threading.Event()
+
+    def on_complete(result):
+        reported["latency"] = report_latency(result, time.time())
+        done.set()
+
+    executor.execute(command_id, COMMAND)
+    executor.when_complete(command_id, on_complete)
+    done.wait()
+    return reported["latency"]
+
+def polling_run(executor: CommandExecutor, command_id: str) -> float:
+    # Real commands end at any point between two polls
+    executor.execute(command_id, f"sh -c 'sleep {random.random():.3f}; {COMMAND}'")
+    while True:
+        time.sleep(1)
+        result = executor.get_result(command_id)
+        if result:
+            return report_latency(result, time.time())
+
+def summarize(name: str, latencies) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<10} {len(latencies):>4} runs  mean {statistics.mean(latencies) * 1e3:8.3f} ms  "
+          f"p50 {statistics.median(latencies) * 1e3:8.3f} ms  p99 {p99 * 1e3:8.3f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--poll-runs", type=int, default=10, help="each polling run takes at least a second")
+    args = parser.parse_args()
+
+    executor = CommandExecutor()
+    summarize("callback", [callback_run(executor, f"callback-{i}") for i in range(args.runs)])
+    if args.poll_runs:
+        summarize("polling 1s", [polling_run(executor, f"poll-{i}") for i in range(args.poll_runs)])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark for the mergeable latency histogram (common.histogram).
+
+Times recording values, then builds one histogram per agent, each with
+its own latency profile, and times what the console does with them at the
+end of a test: decoding every agent's serialized histogram and merging them
+into the fleet's. The merged p99 is compared with the exact p99 of all
+samples and with the (wrong) average of the per-agent p99s.
+
+    python -m benchmarks.bench_histogram [--agents 1000] [--samples 5000]
+"""
+import argparse
+import json
+import math
+import random
+import time
+from array import array
+
+from common.latency import LatencyHistogram
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=5000, help="latencies recorded per agent")
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    values = [rng.lognormvariate(1, 1) for _ in range(1_000_000)]
+    histogram = LatencyHistogram()
+    started = time.perf_counter()
+    for value in values:
+        histogram.record(value)
+    record_ns = (time.perf_counter() - started) / len(values) * 1e9
+    print(f"record          {record_ns:.0f} ns per value ({len(histogram.counts)} buckets spanned)")
+
+    # Most agents are healthy; a few sit behind a slow path
+    payloads = []
+    # An array rather than a list, so the garbage collector does not walk it during the timings
+    samples = array("d")
+    for i in range(args.agents):
+        histogram = LatencyHistogram()
+        mu = 1.0 if i % 50 else 4.0
+        for _ in range(args.samples):
+            value = rng.lognormvariate(mu, 0.8)
+            histogram.record(value)
+            samples.append(value)
+        payloads.append(json.dumps(histogram.to_dict()))
+    sizes = [len(payload) for payload in payloads]
+    print(f"serialized      {sum(sizes) / len(sizes):.0f} bytes mean, {max(sizes)} max, "
+          f"for {args.samples} values per agent")
+
+    started = time.perf_counter()
+    histograms = [LatencyHistogram.from_dict(json.loads(payload)) for payload in payloads]
+    decode_ms = (time.perf_counter() - started) * 1e3
+    started = time.perf_counter()
+    fleet = LatencyHistogram.merged(histograms)
+    merge_ms = (time.perf_counter() - started) * 1e3
+    print(f"decode          {decode_ms:.1f} ms for {args.agents} agents")
+    print(f"merge           {merge_ms:.1f} ms for {args.agents} agents ({merge_ms / args.agents * 1e3:.0f} µs each)")
+
+    exact = sorted(samples)[math.ceil(len(samples) * 0.99) - 1]
+    averaged = sum(h.percentile(99) for h in histograms) / len(histograms)
+    print(f"fleet p99       merged {fleet.percentile(99):.2f} ms, exact {exact:.2f} ms, "
+          f"average of agent p99s {averaged:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for metrics store snapshots (warm restart of the console).
+
+Builds a store holding an hour of 1-second samples per agent plus full
+rollup tiers, then times writing a snapshot, restoring it into an empty
+store (what a restarted console does before it starts consuming), and the
+first queries after the restore, which fault in the mapped pages.
+
+    python -m benchmarks.bench_metrics_snapshot [--agents 800] [--samples 3600]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_codec import metrics_payload
+from console.monitoring.fleet import fleet_frame
+from console.monitoring.snapshot import restore_snapshot, write_snapshot
+from console.monitoring.store import DEFAULT_ROLLUPS, ROLLUP_STATS, AgentSeries, MetricsStore, RollupTier, flatten_metrics
+
+def build_store(agents: int, samples: int, now: float) -> MetricsStore:
+    """A full store built from synthetic arrays; appending sample by sample takes minutes"""
+    names = list(flatten_metrics(metrics_payload()["metrics"]))
+    rng = np.random.default_rng(0)
+    store = MetricsStore(capacity=samples, retention_seconds=samples)
+    timestamps = now - samples + np.arange(samples, dtype=np.float64)
+    for i in range(agents):
+        agent_id = f"agent-{i:04d}"
+        columns = {name: rng.random(samples) * 100 for name in names}
+        store.series[agent_id] = AgentSeries.adopt(samples, timestamps.copy(), columns)
+        tiers = []
+        for interval, capacity in DEFAULT_ROLLUPS:
+            tier = RollupTier(interval, capacity)
+            starts = now - interval * capacity + interval * np.arange(capacity, dtype=np.float64)
+            stats = {(name, stat): rng.random(capacity, dtype=np.float32) for name in names for stat in ROLLUP_STATS}
+            tier.buckets = AgentSeries.adopt(capacity, starts, stats, dtype=np.float32)
+            tier.open_bucket = now - now % interval
+            tiers.append(tier)
+        store.tiers[agent_id] = tiers
+    return store
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agents", type=int, default=800)
+    parser.add_argument("--samples", type=int, default=3600, help="raw samples per agent (1 per second)")
+    args = parser.parse_args()
+
+    now = time.time()
+    store = build_store(args.agents, args.samples, now)
+    agents = store.agents()
+    print(f"store           {args.agents} agents x {args.samples} samples, {store.nbytes() / 2**20:.0f} MiB in memory")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "metrics.snapshot")
+
+        started = time.perf_counter()
+        size = write_snapshot(store, path)
+        write_s = time.perf_counter() - started
+        print(f"write           {write_s:.2f} s, {size / 2**20:.0f} MiB on disk "
+              f"({size / (args.agents * args.samples):.0f} bytes per raw sample incl. rollups)")
+
+        restored = MetricsStore(capacity=args.samples, retention_seconds=args.samples)
+        started = time.perf_counter()
+        count = restore_snapshot(restored, path, now=now)
+        restore_s = time.perf_counter() - started
+        print(f"restore         {restore_s * 1e3:.1f} ms for {count} agents (memory-mapped, pages load on access)")
+
+        started = time.perf_counter()
+        latest = [restored.latest(agent_id) for agent_id in agents]
+        print(f"first live      {(time.perf_counter() - started) * 1e3:.1f} ms for {len(latest)} agents")
+
+        started = time.perf_counter()
+        fleet_frame(restored, "cpu_percent", agents, now - 3600, now, 10.0).stats()
+        print(f"first fleet 60m {(time.perf_counter() - started) * 1e3:.1f} ms (faults in one column)")
+
+        started = time.perf_counter()
+        fleet_frame(restored, "cpu_percent", agents, now - 3600, now, 10.0).stats()
+        print(f"again           {(time.perf_counter() - started) * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    main()
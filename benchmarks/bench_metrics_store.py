@@ -0,0 +1,126 @@
+"""
+Benchmark for the console's in-memory metrics store.
+
+Fills the store with an hour of 1-second samples for every agent, then
+times the operations the console performs: ingesting one fleet-wide second
+of samples, a 5-minute and a 60-minute lookback for one agent (raw, and as
+a chart within a point budget served from the rollup tiers), the
+latest sample of every agent (/metrics/live) and fleet-wide percentiles
+per 10 s bucket (/metrics/fleet). For comparison it also times
+the previous list-of-dicts buffer, which re-filtered every agent's list on
+each incoming message.
+
+    python -m benchmarks.bench_metrics_store [--agents 1000] [--samples 3600]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from console.monitoring.fleet import fleet_frame
+from console.monitoring.store import MetricsStore
+from benchmarks.bench_codec import metrics_payload
+
+def sample_metrics(i: int) -> Dict[str, Any]:
+    metrics = metrics_payload()["metrics"]
+    metrics["cpu_percent"] = float(i % 100)
+    metrics["network"]["bytes_sent"] += i * 1500
+    return metrics
+
+def legacy_ingest(buffer: Dict[str, List[Dict[str, Any]]], agent_id: str, timestamp: float,
+                  metrics: Dict[str, Any]) -> None:
+    """The old MonitoringService path: append, then prune every agent's list"""
+    buffer.setdefault(agent_id, []).append({'timestamp': timestamp, 'metrics': metrics})
+    cutoff_timestamp = (datetime.fromtimestamp(timestamp) - timedelta(hours=1)).timestamp()
+    for key in buffer:
+        buffer[key] = [entry for entry in buffer[key] if entry['timestamp'] > cutoff_timestamp]
+
+def timed(fn, repeat: int) -> float:
+    """Mean seconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=3600, help="samples per agent (1 per second)")
+    parser.add_argument("--max-points", type=int, default=500, help="point budget for chart queries")
+    parser.add_argument("--legacy-agents", type=int, default=100,
+                        help="agents for the old buffer; it is too slow at full scale")
+    args = parser.parse_args()
+
+    agents = [f"agent-{i:04d}" for i in range(args.agents)]
+    metrics = [sample_metrics(i) for i in range(60)]
+    start_ts = time.time() - args.samples
+
+    store = MetricsStore(capacity=args.samples, retention_seconds=args.samples)
+    fill_start = time.perf_counter()
+    for second in range(args.samples):
+        for agent_id in agents:
+            store.append(agent_id, start_ts + second, metrics[second % 60])
+    fill = time.perf_counter() - fill_start
+    total = args.agents * args.samples
+    print(f"fill            {total} samples in {fill:.1f}s "
+          f"({fill / total * 1e6:.2f} us/sample), {store.nbytes() / 2**20:.0f} MiB")
+
+    # Steady state: each new second evicts one sample per agent
+    now = start_ts + args.samples
+    second = [now]
+
+    def ingest_second():
+        second[0] += 1
+        for agent_id in agents:
+            store.append(agent_id, second[0], metrics[0])
+
+    per_second = timed(ingest_second, 10)
+    print(f"ingest 1s       {per_second * 1e3:.2f} ms for {args.agents} agents "
+          f"({per_second / args.agents * 1e6:.2f} us/sample)")
+
+    newest = second[0]
+    for minutes in (5, 60):
+        lookup = timed(lambda: store.query(agents[0], newest - minutes * 60), 200)
+        entries = timed(lambda: store.entries(agents[0], newest - minutes * 60), 20)
+        print(f"lookback {minutes:>2}m    arrays {lookup * 1e6:.1f} us, entries {entries * 1e3:.2f} ms")
+
+    # Charts with a point budget: raw when it fits, otherwise a rollup tier
+    for minutes in (5, 60):
+        since = newest - minutes * 60
+
+        def chart():
+            tier = store.select_tier(agents[0], since, max_points=args.max_points)
+            if tier is None:
+                return store.entries(agents[0], since)
+            return store.rollup_entries(tier, since)
+
+        points = len(chart())
+        chart_s = timed(chart, 20)
+        print(f"chart {minutes:>2}m       {chart_s * 1e3:.2f} ms, {points} points (max {args.max_points})")
+
+    live = timed(lambda: [store.latest(agent_id) for agent_id in agents], 5)
+    print(f"live            {live * 1e3:.2f} ms for {args.agents} agents")
+
+    for minutes in (5, 60):
+        since = newest - minutes * 60
+
+        def fleet():
+            return fleet_frame(store, "cpu_percent", agents, since, newest, 10.0).stats()
+
+        fleet_s = timed(fleet, 5)
+        print(f"fleet p95 {minutes:>2}m    {fleet_s * 1e3:.2f} ms for {args.agents} agents, 10 s buckets")
+
+    # The old buffer at a fraction of the scale
+    legacy_agents = agents[:args.legacy_agents]
+    legacy_samples = min(args.samples, 600)
+    buffer: Dict[str, List[Dict[str, Any]]] = {}
+    legacy_start = time.perf_counter()
+    for s in range(legacy_samples):
+        for agent_id in legacy_agents:
+            legacy_ingest(buffer, agent_id, start_ts + s, metrics[s % 60])
+    legacy = (time.perf_counter() - legacy_start) / (legacy_samples * len(legacy_agents))
+    print(f"legacy ingest   {legacy * 1e6:.1f} us/sample at {len(legacy_agents)} agents x "
+          f"{legacy_samples} samples (grows with agents x samples)")
+
+if __name__ == "__main__":
+    main()
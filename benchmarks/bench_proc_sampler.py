@@ -0,0 +1,68 @@
+"""
+Benchmark for agent system metrics sampling cost.
+
+Times ProcSampler.sample(), which the agent calls every METRICS_INTERVAL
+seconds, against the psutil calls it used before (re-imported on every
+call, with network counters left as placeholders). Reports time per sample
+and the share of one core a 10 Hz sampler would use.
+
+    python -m benchmarks.bench_proc_sampler [--samples 2000] [--rate 10]
+"""
+import argparse
+import time
+
+from agent.sampler import ProcSampler
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def psutil_sample() -> dict:
+    import psutil
+    network = psutil.net_io_counters()
+    return {
+        "cpu_percent": psutil.cpu_percent(),
+        "memory_percent": psutil.virtual_memory().percent,
+        "disk_percent": psutil.disk_usage("/").percent,
+        "network": {"bytes_sent": network.bytes_sent, "bytes_recv": network.bytes_recv},
+    }
+
+def measure(name: str, sample, samples: int, rate: float) -> None:
+    sample()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(samples):
+        sample()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    per_sample = cpu / samples
+    print(f"{name:<8} {wall / samples * 1e6:8.1f} us/sample wall  {per_sample * 1e6:8.1f} us/sample cpu  "
+          f"{per_sample * rate * 100:6.3f}% of a core at {rate:g} Hz")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=10.0, help="samples per second to estimate CPU share for")
+    args = parser.parse_args()
+
+    sampler = ProcSampler()
+    measure("proc", sampler.sample, args.samples, args.rate)
+    sampler.close()
+    if psutil is not None:
+        measure("psutil", psutil_sample, args.samples, args.rate)
+
+    # Check the rate estimate by actually sampling at that rate for a while
+    sampler = ProcSampler()
+    interval = 1.0 / args.rate
+    cpu, start = time.process_time(), time.monotonic()
+    deadline, end = start, start + min(5.0, args.samples * interval)
+    while deadline < end:
+        sampler.sample()
+        deadline += interval
+        time.sleep(max(0.0, deadline - time.monotonic()))
+    elapsed = time.monotonic() - start
+    print(f"paced    {(time.process_time() - cpu) / elapsed * 100:6.3f}% of a core sampling at {args.rate:g} Hz "
+          f"for {elapsed:.1f} s (includes sleep wakeups)")
+    sampler.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import json
+import zlib
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+def _msgpack_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+class JsonCodec:
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, message: Any) -> bytes:
+        return json.dumps(message, cls=DateTimeEncoder).encode()
+
+    def decode(self, body: bytes) -> Any:
+        return json.loads(body.decode())
+
+class MsgPackCodec:
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("msgpack is required for the application/msgpack codec")
+
+    def encode(self, message: Any) -> bytes:
+        return msgpack.packb(message, default=_msgpack_default, use_bin_type=True)
+
+    def decode(self, body: bytes) -> Any:
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+
+def _zstd_compress(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+# content_encoding -> (compress(data, level), decompress(data))
+COMPRESSORS: Dict[str, Tuple[Callable[[bytes, int], bytes], Callable[[bytes], bytes]]] = {
+    "deflate": (lambda data, level: zlib.compress(data, level), zlib.decompress),
+}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = (_zstd_compress, _zstd_decompress)
+
+CODECS: Dict[str, Any] = {JSON_CONTENT_TYPE: JsonCodec()}
+if msgpack is not None:
+    CODECS[MSGPACK_CONTENT_TYPE] = MsgPackCodec()
+
+CODEC_NAMES = {
+    "json": JSON_CONTENT_TYPE,
+    "msgpack": MSGPACK_CONTENT_TYPE,
+}
+
+COMPRESSION_NAMES = {
+    "zlib": "deflate",
+    "deflate": "deflate",
+    "zstd": "zstd",
+}
+
+class MessageCodec:
+    """
+    Encodes outgoing messages and decodes incoming ones by their AMQP properties.
+
+    The outgoing format is fixed per publisher, while decoding follows each
+    message's ``content_type``/``content_encoding``. Peers that only speak
+    JSON keep working as long as whoever talks to them publishes JSON, and a
+    message without a content type is treated as JSON.
+    """
+
+    def __init__(self, content_type: str = JSON_CONTENT_TYPE, compression: Optional[str] = None,
+                 compression_threshold: int = 4096, compression_level: int = 3):
+        if content_type not in CODECS:
+            logger.warning(f"Codec {content_type} is not available, falling back to JSON")
+            content_type = JSON_CONTENT_TYPE
+        if compression and compression not in COMPRESSORS:
+            logger.warning(f"Compression {compression} is not available, sending uncompressed")
+            compression = None
+
+        self.content_type = content_type
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self._codec = CODECS[content_type]
+
+    @classmethod
+    def from_names(cls, codec: str = "json", compression: Optional[str] = None,
+                   compression_threshold: int = 4096) -> "MessageCodec":
+        """Build a codec from short configuration names such as 'msgpack' and 'zstd'"""
+        return cls(
+            content_type=CODEC_NAMES.get(codec, codec),
+            compression=COMPRESSION_NAMES.get(compression, compression) if compression else None,
+            compression_threshold=compression_threshold
+        )
+
+    def encode(self, message: Any) -> Tuple[bytes, str, Optional[str]]:
+        """Encode a message, returning (body, content_type, content_encoding)"""
+        body = self._codec.encode(message)
+
+        if self.compression and len(body) >= self.compression_threshold:
+            compress, _ = COMPRESSORS[self.compression]
+            return compress(body, self.compression_level), self.content_type, self.compression
+
+        return body, self.content_type, None
+
+    def decode(self, body: bytes, content_type: Optional[str] = None,
+               content_encoding: Optional[str] = None) -> Any:
+        """Decode a message body according to its content type and encoding"""
+        if content_encoding and content_encoding in COMPRESSORS:
+            _, decompress = COMPRESSORS[content_encoding]
+            body = decompress(body)
+        elif content_encoding and content_encoding not in ("identity", "utf-8"):
+            raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+        codec = CODECS.get(content_type or JSON_CONTENT_TYPE)
+        if codec is None:
+            raise ValueError(f"Unsupported content type: {content_type}")
+        return codec.decode(body)
@@ -0,0 +1,158 @@
+import base64
+import math
+import operator
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+FORMAT_VERSION = 1
+
+def _pack_counts(counts: List[int]) -> array:
+    """Counts as little-endian unsigned integers, 32-bit unless one needs more"""
+    packed = array("I" if max(counts, default=0) < 2 ** 32 else "Q", counts)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed
+
+class Histogram:
+    """
+    Log-bucketed histogram of non-negative values, laid out like HdrHistogram.
+
+    Values are counted in whole multiples of ``resolution``. Every value
+    below ``2 ** sub_bucket_bits`` units has its own bucket; above that each
+    power of two is split into ``2 ** (sub_bucket_bits - 1)`` equal buckets,
+    so buckets are never wider than 1/128 of their values with the default
+    8 bits, over any range. Recording is a few integer operations. Two
+    histograms with the same layout merge exactly by adding their counts,
+    which is what makes fleet-wide percentiles possible: averaging
+    per-agent percentiles is not.
+    """
+
+    def __init__(self, resolution: float = 1.0, sub_bucket_bits: int = 8):
+        self.resolution = resolution
+        self.sub_bucket_bits = sub_bucket_bits
+        self._sub_buckets = 1 << sub_bucket_bits
+        self._half = self._sub_buckets >> 1
+        self.counts: List[int] = []
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, units: int) -> int:
+        if units < self._sub_buckets:
+            return units
+        shift = units.bit_length() - self.sub_bucket_bits
+        return self._sub_buckets + (shift - 1) * self._half + (units >> shift) - self._half
+
+    def _upper_units(self, index: int) -> int:
+        """First unit value past the bucket"""
+        if index < self._sub_buckets:
+            return index + 1
+        shift, offset = divmod(index - self._sub_buckets, self._half)
+        return (self._half + offset + 1) << (shift + 1)
+
+    def record(self, value: float, count: int = 1) -> None:
+        index = self._index(int(value / self.resolution)) if value > 0 else 0
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += count
+        self.count += count
+        self.total += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        """Add another histogram's counts to this one; the layouts must match"""
+        if (other.resolution, other.sub_bucket_bits) != (self.resolution, self.sub_bucket_bits):
+            raise ValueError("Cannot merge histograms with different resolution or bucket layout")
+        counts, others = self.counts, other.counts
+        if len(others) > len(counts):
+            counts.extend([0] * (len(others) - len(counts)))
+        counts[:len(others)] = map(operator.add, counts, others)
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, histograms: Iterable["Histogram"]) -> Optional["Histogram"]:
+        """A new histogram holding all of them; None if there are none"""
+        result = None
+        for histogram in histograms:
+            if result is None:
+                result = cls.__new__(cls)
+                Histogram.__init__(result, histogram.resolution, histogram.sub_bucket_bits)
+            result.merge(histogram)
+        return result
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the given percentile, capped at the largest value"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self._upper_units(index) * self.resolution, self.max)
+        return self.max
+
+    def summary(self, percentiles: Iterable[float] = (50, 95, 99), suffix: str = "") -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        result = {"count": self.count, f"mean{suffix}": self.total / self.count, f"min{suffix}": self.min}
+        for pct in percentiles:
+            result[f"p{pct:g}{suffix}"] = self.percentile(pct)
+        result[f"max{suffix}"] = self.max
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Compact JSON-safe form for messages.
+
+        Only the range of buckets in use is written, as fixed-width counts
+        deflated (runs of empty buckets compress to almost nothing), so the
+        size depends on how widely values are spread, not on how many were
+        recorded: a few KB even for latencies spanning several decades.
+        """
+        counts = self.counts
+        first = next((index for index, count in enumerate(counts) if count), 0)
+        last = len(counts)
+        while last > first and not counts[last - 1]:
+            last -= 1
+        packed = _pack_counts(counts[first:last])
+        return {
+            "v": FORMAT_VERSION,
+            "resolution": self.resolution,
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max,
+            "offset": first,
+            "width": packed.itemsize,
+            "counts": base64.b64encode(zlib.compress(packed.tobytes())).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Histogram":
+        if data.get("v") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported histogram format {data.get('v')}")
+        histogram = cls.__new__(cls)
+        Histogram.__init__(histogram, data["resolution"], data["sub_bucket_bits"])
+        packed = array("I" if data["width"] == 4 else "Q")
+        packed.frombytes(zlib.decompress(base64.b64decode(data["counts"])))
+        if sys.byteorder == "big":
+            packed.byteswap()
+        histogram.counts = [0] * data["offset"] + packed.tolist()
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"] if data["min"] is not None else math.inf
+        histogram.max = data["max"]
+        return histogram
@@ -0,0 +1,318 @@
+import threading
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import pika
+
+from common.codecs import MessageCodec
+from common.latency import LatencyTracker, SequenceStamper
+from common.messaging import (
+    MessageBroker,
+    ConsumerDispatcher,
+    DEFAULT_PREFETCH_COUNT,
+    HEADER_SOURCE_QUEUE,
+    dead_letter_exchange_name,
+    dead_letter_queue_name,
+    describe_dead_letter,
+    get_topic_policy,
+    multicast_exchange_name,
+    multicast_header,
+    original_routing_key,
+    replay_headers,
+    retry_queue_name,
+)
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=65536)
+def topic_matches(pattern: str, key: str) -> bool:
+    """AMQP topic matching: '*' is exactly one word, '#' is zero or more words"""
+    return _match_words(tuple(pattern.split('.')), tuple(key.split('.')))
+
+def _match_words(pattern: Tuple[str, ...], words: Tuple[str, ...]) -> bool:
+    if not pattern:
+        return not words
+
+    head = pattern[0]
+    if head == '#':
+        # Try consuming 0..n words with the wildcard
+        return any(_match_words(pattern[1:], words[i:]) for i in range(len(words) + 1))
+    if not words:
+        return False
+    if head == '*' or head == words[0]:
+        return _match_words(pattern[1:], words[1:])
+    return False
+
+class _LoopbackQueue:
+    """Thread-safe FIFO with the broker's max-length/overflow behaviour"""
+
+    def __init__(self, max_length: Optional[int] = None, overflow: str = "drop-head"):
+        self.max_length = max_length
+        self.overflow = overflow
+        self.dropped = 0
+        self._items: Deque[Tuple[str, pika.BasicProperties, bytes]] = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item, front: bool = False) -> None:
+        with self._cond:
+            if front:
+                self._items.appendleft(item)
+            elif self.max_length is not None and len(self._items) >= self.max_length:
+                self.dropped += 1
+                if self.overflow == "reject-publish":
+                    return
+                self._items.popleft()
+                self._items.append(item)
+            else:
+                self._items.append(item)
+            self._cond.notify()
+
+    def peek(self, limit: int) -> List[Tuple[str, pika.BasicProperties, bytes]]:
+        with self._cond:
+            return [self._items[i] for i in range(min(limit, len(self._items)))]
+
+    def get(self, timeout: float):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+class _DirectConnection:
+    """Stand-in for pika's connection: loopback acks can run on any thread"""
+
+    @staticmethod
+    def add_callback_threadsafe(fn: Callable[[], None]) -> None:
+        fn()
+
+class InMemoryBroker(MessageBroker):
+    """
+    In-process MessageBroker with topic-exchange semantics.
+
+    Messages go through the same codec, routing keys and consumer dispatch
+    as the RabbitMQ-backed broker, but queues live in memory, so the
+    messaging hot path can be benchmarked and tested without a network.
+    Retry delay queues are emulated with timers.
+    """
+
+    def __init__(self, codec: Optional[MessageCodec] = None, publish_timeout: float = 10.0,
+                 clock: Callable[[], float] = time.time):
+        # Deliberately skips MessageBroker.__init__, which opens connections
+        self.rabbitmq_url = None
+        self.codec = codec or MessageCodec()
+        self.stamper = SequenceStamper(clock=clock)
+        self.latency = LatencyTracker(clock=clock)
+        self.publish_timeout = publish_timeout
+        self.connection = None
+        self.channel = None
+        self.publisher = None
+        self.consumer_threads = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        # exchange -> [(binding key, queue name)]
+        self._bindings: Dict[str, List[Tuple[str, str]]] = {}
+        self._queues: Dict[str, _LoopbackQueue] = {}
+        # multicast exchange -> [(target header, queue name)]
+        self._multicast: Dict[str, List[Tuple[str, str]]] = {}
+        # retry queue name -> (consumer queue name, delay in seconds)
+        self._retry_queues: Dict[str, Tuple[str, float]] = {}
+
+    def connect(self):
+        pass
+
+    def queue_depth(self, queue_name: str) -> int:
+        """Number of messages waiting in a queue"""
+        queue = self._queues.get(queue_name)
+        return len(queue) if queue else 0
+
+    def _route(self, exchange: str, key: str, properties: pika.BasicProperties, body: bytes) -> int:
+        if exchange == '':
+            return self._route_default(key, properties, body)
+
+        with self._lock:
+            if exchange in self._multicast:
+                # Headers exchange, x-match any on the "to.<id>" headers
+                headers = properties.headers or {}
+                targets = {
+                    queue_name for header, queue_name in self._multicast[exchange]
+                    if headers.get(header)
+                }
+            else:
+                targets = {
+                    queue_name for pattern, queue_name in self._bindings.get(exchange, [])
+                    if topic_matches(pattern, key)
+                }
+            queues = [self._queues[name] for name in targets]
+
+        for queue in queues:
+            queue.put((key, properties, body))
+        return len(queues)
+
+    def _route_default(self, queue_name: str, properties: pika.BasicProperties, body: bytes) -> int:
+        """The default exchange delivers straight to the queue with the key's name"""
+        retry = self._retry_queues.get(queue_name)
+        if retry is not None:
+            # Like an expiring delay queue: back to the consumer queue, keyed by its name
+            target, delay = retry
+            timer = threading.Timer(delay, self._route_default, args=(target, properties, body))
+            timer.daemon = True
+            timer.start()
+            return 1
+
+        queue = self._queues.get(queue_name)
+        if queue is None:
+            return 0
+        queue.put((queue_name, properties, body))
+        return 1
+
+    def _submit(self, exchange: str, key: str, body: bytes, properties: pika.BasicProperties) -> Future:
+        """Route a message to every bound queue; the returned future is already resolved"""
+        future = Future()
+        try:
+            self._route(exchange, key, properties, body)
+            future.set_result(True)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _declare_consumer_queue(self, channel, topic_name: str, group_id: str,
+                                binding_keys: Optional[List[str]] = None,
+                                multicast_id: Optional[str] = None) -> str:
+        keys = list(binding_keys) if binding_keys else ['#']
+        queue_name = f"{topic_name}.{group_id}"
+
+        policy = get_topic_policy(topic_name)
+        dead_letters = dead_letter_queue_name(topic_name)
+
+        with self._lock:
+            if queue_name not in self._queues:
+                self._queues[queue_name] = _LoopbackQueue(policy.max_length, policy.overflow)
+            if policy.max_retries:
+                self._retry_queues[retry_queue_name(queue_name)] = (queue_name, policy.retry_delay_ms / 1000.0)
+            if dead_letters not in self._queues:
+                self._queues[dead_letters] = _LoopbackQueue(policy.dead_letter_max_length)
+                self._bindings.setdefault(dead_letter_exchange_name(topic_name), []).append(('#', dead_letters))
+            bindings = self._bindings.setdefault(topic_name, [])
+            if '#' not in keys:
+                bindings[:] = [b for b in bindings if b != ('#', queue_name)]
+            for key in keys:
+                if (key, queue_name) not in bindings:
+                    bindings.append((key, queue_name))
+            if multicast_id:
+                multicast = self._multicast.setdefault(multicast_exchange_name(topic_name), [])
+                if (multicast_header(multicast_id), queue_name) not in multicast:
+                    multicast.append((multicast_header(multicast_id), queue_name))
+
+        return queue_name
+
+    def _consume_loop(self, topic_name: str, queue_name: str, callback: Callable, auto_commit: bool,
+                      workers: int, ordered: bool) -> None:
+        queue = self._queues[queue_name]
+        dispatcher = ConsumerDispatcher(_DirectConnection(), workers, ordered, name=queue_name) if workers else None
+
+        def settle(failed) -> None:
+            if failed is not None:
+                exchange, key, body, properties = failed
+                self._route(exchange, key, properties, body)
+
+        try:
+            while not self._closed.is_set():
+                item = queue.get(timeout=0.1)
+                if item is None:
+                    continue
+                key, properties, body = item
+
+                if dispatcher:
+                    def process(key=key, properties=properties, body=body):
+                        failed = self._handle_delivery(callback, auto_commit, topic_name, queue_name,
+                                                       key, properties, body)
+                        dispatcher.settle(lambda: settle(failed))
+                    dispatcher.submit(original_routing_key(key, properties.headers), process)
+                else:
+                    failed = self._handle_delivery(callback, auto_commit, topic_name, queue_name,
+                                                   key, properties, body)
+                    settle(failed)
+        finally:
+            if dispatcher:
+                dispatcher.shutdown()
+
+    def consume(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False,
+                binding_keys: Optional[List[str]] = None, prefetch_count: int = DEFAULT_PREFETCH_COUNT,
+                workers: int = 0, ordered: bool = False, multicast_id: Optional[str] = None) -> None:
+        """Consume messages on the calling thread until the broker is closed"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        queue_name = self._declare_consumer_queue(None, topic_name, group_id, binding_keys, multicast_id)
+        self._consume_loop(topic_name, queue_name, callback, auto_commit, workers, ordered)
+
+    def start_consuming_in_thread(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False,
+                                  binding_keys: Optional[List[str]] = None,
+                                  prefetch_count: int = DEFAULT_PREFETCH_COUNT,
+                                  workers: int = 0, ordered: bool = False,
+                                  multicast_id: Optional[str] = None) -> threading.Thread:
+        """Start consuming messages in a background thread"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        thread_id = f"{topic}.{group_id}"
+        if thread_id in self.consumer_threads and self.consumer_threads[thread_id].is_alive():
+            logger.warning(f"Consumer thread for {thread_id} already running")
+            return self.consumer_threads[thread_id]
+
+        # Bind before returning so messages published right after are not lost
+        queue_name = self._declare_consumer_queue(None, topic_name, group_id, binding_keys, multicast_id)
+        thread = threading.Thread(
+            target=self._consume_loop,
+            args=(topic_name, queue_name, callback, auto_commit, workers, ordered),
+            daemon=True
+        )
+        thread.start()
+        self.consumer_threads[thread_id] = thread
+        return thread
+
+    def get_dead_letters(self, topic: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """The oldest dead letters for a topic, without removing them"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        queue = self._queues.get(dead_letter_queue_name(topic_name))
+        if queue is None:
+            return []
+        return [
+            describe_dead_letter(self.codec, key, properties.content_type, properties.content_encoding,
+                                 properties.headers, body)
+            for key, properties, body in queue.peek(limit)
+        ]
+
+    def replay_dead_letters(self, topic: str, limit: int = 100) -> int:
+        """Send up to limit dead letters back to their consumer queues with a fresh retry budget"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        queue = self._queues.get(dead_letter_queue_name(topic_name))
+        replayed = 0
+        while queue is not None and replayed < limit:
+            item = queue.get(timeout=0)
+            if item is None:
+                break
+            key, properties, body = item
+            headers = properties.headers or {}
+            replayed_properties = pika.BasicProperties(
+                delivery_mode=properties.delivery_mode,
+                content_type=properties.content_type,
+                content_encoding=properties.content_encoding,
+                headers=replay_headers(headers)
+            )
+            if headers.get(HEADER_SOURCE_QUEUE):
+                self._route('', headers[HEADER_SOURCE_QUEUE], replayed_properties, body)
+            else:
+                self._route(topic_name, original_routing_key(key, headers), replayed_properties, body)
+            replayed += 1
+        return replayed
+
+    def close(self) -> None:
+        """Stop all consumers"""
+        self._closed.set()
+        for thread in self.consumer_threads.values():
+            thread.join(timeout=1)
@@ -1,32 +1,577 @@
-import json
 import pika
-from typing import Dict, Any, Callable, Optional
+import queue
+import functools
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional, List, Tuple
 from enum import Enum
 import threading
 import logging
 import time
-from datetime import datetime
+from common.codecs import DateTimeEncoder, MessageCodec
+from common.latency import LatencyTracker, SequenceStamper
+from common.spool import OutboundSpool, ReconnectBackoff, SpoolRecord
 
 logger = logging.getLogger(__name__)
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+# Unacknowledged deliveries a consumer may hold at once
+DEFAULT_PREFETCH_COUNT = 100
 
 class TopicType(str, Enum):
     COMMANDS = "do-control.commands"
     STATUS = "do-control.status"
     METRICS = "do-control.metrics"
 
+class TopicPolicy:
+    """
+    Delivery and queue settings shared by every message and queue of a topic.
+    
+    ``persistent`` picks the delivery mode. The remaining settings become
+    queue arguments: ``max_length`` with ``overflow`` bounds a queue (drop-head
+    discards the oldest message, reject-publish nacks new ones, which only
+    publishers with confirms notice), ``message_ttl_ms`` expires stale messages,
+    ``queue_expires_ms`` deletes queues nobody consumes from, and ``lazy``
+    keeps messages on disk instead of in broker memory.
+    
+    A message whose handler fails is retried up to ``max_retries`` times,
+    each after sitting ``retry_delay_ms`` in a delay queue, and is then moved
+    to the topic's dead-letter queue (bounded by ``dead_letter_max_length``).
+    """
+    
+    def __init__(self, persistent: bool = True, max_length: Optional[int] = None,
+                 overflow: str = "drop-head", message_ttl_ms: Optional[int] = None,
+                 queue_expires_ms: Optional[int] = None, lazy: bool = False,
+                 max_retries: int = 3, retry_delay_ms: int = 5000,
+                 dead_letter_max_length: int = 10_000):
+        self.persistent = persistent
+        self.max_length = max_length
+        self.overflow = overflow
+        self.message_ttl_ms = message_ttl_ms
+        self.queue_expires_ms = queue_expires_ms
+        self.lazy = lazy
+        self.max_retries = max_retries
+        self.retry_delay_ms = retry_delay_ms
+        self.dead_letter_max_length = dead_letter_max_length
+        
+    @property
+    def delivery_mode(self) -> int:
+        return 2 if self.persistent else 1
+        
+    def queue_arguments(self) -> Dict[str, Any]:
+        """Arguments for queue_declare implementing this policy"""
+        arguments = {}
+        if self.max_length is not None:
+            arguments['x-max-length'] = self.max_length
+            arguments['x-overflow'] = self.overflow
+        if self.message_ttl_ms is not None:
+            arguments['x-message-ttl'] = self.message_ttl_ms
+        if self.queue_expires_ms is not None:
+            arguments['x-expires'] = self.queue_expires_ms
+        if self.lazy:
+            arguments['x-queue-mode'] = 'lazy'
+        return arguments
+
+TOPIC_POLICIES: Dict[str, TopicPolicy] = {
+    # Commands are time-sensitive: a prepare delivered minutes late is worse
+    # than none. Agent queues are per process, so let abandoned ones expire.
+    TopicType.COMMANDS.value: TopicPolicy(
+        persistent=True,
+        message_ttl_ms=60_000,
+        queue_expires_ms=3_600_000,
+        max_retries=2,
+        retry_delay_ms=1000
+    ),
+    # Status and results must survive a broker restart; results can carry
+    # large outputs, so keep them out of broker memory. A full queue refuses
+    # new messages rather than silently discarding queued results; the
+    # publisher's confirm is a nack, and it keeps the message spooled and
+    # retries until the queue drains.
+    TopicType.STATUS.value: TopicPolicy(
+        persistent=True,
+        max_length=100_000,
+        overflow="reject-publish",
+        lazy=True
+    ),
+    # Metrics are superseded every few seconds: no fsync, bounded backlog
+    TopicType.METRICS.value: TopicPolicy(
+        persistent=False,
+        max_length=10_000,
+        message_ttl_ms=60_000,
+        max_retries=0,
+        dead_letter_max_length=1000
+    ),
+}
+
+DEFAULT_TOPIC_POLICY = TopicPolicy()
+
+def get_topic_policy(topic_name: str) -> TopicPolicy:
+    """Policy for a topic, falling back to persistent, unbounded delivery"""
+    return TOPIC_POLICIES.get(topic_name, DEFAULT_TOPIC_POLICY)
+
+# What happens to a delivery once its handler has run
+DELIVERY_ACK = "ack"
+DELIVERY_RETRY = "retry"
+DELIVERY_DEAD_LETTER = "dead-letter"
+
+# Headers carried by retried and dead-lettered messages
+HEADER_RETRY_COUNT = "x-retry-count"
+HEADER_ORIGINAL_ROUTING_KEY = "x-original-routing-key"
+HEADER_SOURCE_QUEUE = "x-source-queue"
+HEADER_ERROR = "x-error"
+HEADER_DEAD_LETTERED_AT = "x-dead-lettered-at"
+
+def retry_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.retry"
+
+def dead_letter_exchange_name(topic_name: str) -> str:
+    return f"{topic_name}.dlx"
+
+def dead_letter_queue_name(topic_name: str) -> str:
+    return f"{topic_name}.dead-letter"
+
+def retry_queue_arguments(policy: TopicPolicy, queue_name: str) -> Dict[str, Any]:
+    """
+    Delay queue whose expired messages go straight back to the consumer queue.
+
+    It expires along with an abandoned consumer queue. A retry queue never
+    has consumers, so consumers redeclare it before retrying a message to
+    renew its lease.
+    """
+    arguments = {
+        'x-message-ttl': policy.retry_delay_ms,
+        'x-dead-letter-exchange': '',
+        'x-dead-letter-routing-key': queue_name,
+    }
+    if policy.queue_expires_ms is not None:
+        arguments['x-expires'] = policy.queue_expires_ms
+    return arguments
+
+def dead_letter_queue_arguments(policy: TopicPolicy) -> Dict[str, Any]:
+    return {
+        'x-max-length': policy.dead_letter_max_length,
+        'x-overflow': 'drop-head',
+        'x-queue-mode': 'lazy',
+    }
+
+# Multicast: one message reaches a chosen set of consumers through a headers
+# exchange. Each consumer binds with its own "to.<id>" header (x-match any) and
+# a message names its targets as headers, so the broker fans it out once.
+MULTICAST_ROUTING_KEY = "multicast"
+# Targets per message, keeping the header frame well under the AMQP frame size
+MULTICAST_MAX_TARGETS = 500
+
+def multicast_exchange_name(topic_name: str) -> str:
+    return f"{topic_name}.multicast"
+
+def multicast_header(target: str) -> str:
+    return f"to.{target}"
+
+def multicast_binding_arguments(target: str) -> Dict[str, Any]:
+    return {'x-match': 'any', multicast_header(target): True}
+
+def multicast_headers(targets: List[str]) -> List[Dict[str, Any]]:
+    """Target headers for a multicast, one dict per message to publish"""
+    unique = list(dict.fromkeys(targets))
+    return [
+        {multicast_header(target): True for target in unique[i:i + MULTICAST_MAX_TARGETS]}
+        for i in range(0, len(unique), MULTICAST_MAX_TARGETS)
+    ]
+
+def original_routing_key(routing_key: str, headers: Optional[Dict[str, Any]]) -> str:
+    """Routing key the message was first published with (retries come back keyed by queue)"""
+    if headers and headers.get(HEADER_ORIGINAL_ROUTING_KEY):
+        return headers[HEADER_ORIGINAL_ROUTING_KEY]
+    return routing_key
+
+def failure_disposition(policy: TopicPolicy, headers: Optional[Dict[str, Any]], auto_commit: bool) -> str:
+    """Retry a failed message while it has retries left, otherwise dead-letter it"""
+    retries = (headers or {}).get(HEADER_RETRY_COUNT, 0)
+    if not auto_commit and retries < policy.max_retries:
+        return DELIVERY_RETRY
+    return DELIVERY_DEAD_LETTER
+
+def failure_headers(headers: Optional[Dict[str, Any]], routing_key: str, queue_name: str,
+                    outcome: str, error: Optional[str]) -> Dict[str, Any]:
+    """Headers for republishing a failed message to its retry or dead-letter queue"""
+    result = dict(headers or {})
+    result[HEADER_ORIGINAL_ROUTING_KEY] = routing_key
+    result[HEADER_SOURCE_QUEUE] = queue_name
+    result[HEADER_ERROR] = (error or "")[:1000]
+    if outcome == DELIVERY_RETRY:
+        result[HEADER_RETRY_COUNT] = result.get(HEADER_RETRY_COUNT, 0) + 1
+    else:
+        result[HEADER_DEAD_LETTERED_AT] = time.time()
+    return result
+
+def replay_headers(headers: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Headers for sending a dead letter back to its queue with a fresh retry budget"""
+    result = dict(headers or {})
+    result[HEADER_RETRY_COUNT] = 0
+    result.pop(HEADER_DEAD_LETTERED_AT, None)
+    result.pop(HEADER_ERROR, None)
+    return result
+
+def describe_dead_letter(codec: MessageCodec, routing_key: str, content_type: Optional[str],
+                         content_encoding: Optional[str], headers: Optional[Dict[str, Any]],
+                         body: bytes) -> Dict[str, Any]:
+    """JSON-friendly view of a dead-lettered message"""
+    headers = headers or {}
+    try:
+        message = codec.decode(body, content_type, content_encoding)
+    except Exception:
+        message = None
+    return {
+        "routing_key": original_routing_key(routing_key, headers),
+        "queue": headers.get(HEADER_SOURCE_QUEUE),
+        "error": headers.get(HEADER_ERROR),
+        "retries": headers.get(HEADER_RETRY_COUNT, 0),
+        "dead_lettered_at": headers.get(HEADER_DEAD_LETTERED_AT),
+        "size": len(body),
+        "message": message,
+    }
+
+class PublisherPool:
+    """
+    Pool of publisher threads, each owning its own connection and channel.
+
+    pika's BlockingConnection is not thread-safe, so callers never touch a
+    socket: they enqueue a message and get a Future back. Messages are
+    sharded across the workers by routing key (crc32, like the consumer
+    lanes), so messages with the same key are published in the order they
+    were submitted; a pool of one keeps the order across keys too. Each
+    worker drains up to ``batch_size`` pending messages at a time. With
+    ``confirms`` the channel is in publisher confirm mode: every publish
+    waits for the broker's ack, and a message no queue is bound for fails
+    its future with UnroutableError.
+
+    When a message cannot be sent, or the broker nacks it (a full
+    reject-publish queue), the pool goes offline: it and every later
+    message go to the OutboundSpool, in order, and callers are not held up.
+    Messages of the batch the broker already confirmed are not spooled
+    again. A single replay thread reconnects with jittered exponential
+    backoff, drains the spool in order and brings the pool back online once
+    it is empty. A future therefore resolves to True once its message has
+    been published or accepted by the spool, and fails only if the spool
+    could not store it or the message was unroutable. A full spool drops
+    its oldest messages to make room.
+    """
+    _STOP = object()
+
+    def __init__(self, rabbitmq_url: str, size: int = 2, confirms: bool = False,
+                 batch_size: int = 100, max_pending: int = 10000,
+                 spool: Optional[OutboundSpool] = None,
+                 backoff: Optional[ReconnectBackoff] = None):
+        self.rabbitmq_url = rabbitmq_url
+        self.size = max(1, size)
+        self.confirms = confirms
+        self.batch_size = max(1, batch_size)
+        self.spool = spool or OutboundSpool()
+        self.backoff = backoff or ReconnectBackoff()
+        # One queue per worker; max_pending is shared between them
+        self._queues = [queue.Queue(maxsize=max(1, max_pending // self.size)) for _ in range(self.size)]
+        self._closed = False
+        self._offline = False
+        # Guards the spool and the online/offline switch
+        self._spool_lock = threading.Lock()
+        self._wake_replay = threading.Event()
+        # Cuts the replay thread's backoff short on close
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        
+        for i, work in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run,
+                args=(work,),
+                name=f"publisher-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._workers.append(thread)
+            
+        self._replay_thread = threading.Thread(target=self._replay, name="publisher-replay", daemon=True)
+        self._replay_thread.start()
+        
+        # Messages left in the spool file by a previous run
+        if len(self.spool):
+            self._go_offline()
+            
+    @property
+    def online(self) -> bool:
+        return not self._offline
+            
+    def submit(self, exchange: str, routing_key: str, body: bytes,
+               properties: pika.BasicProperties, timeout: Optional[float] = None) -> Future:
+        """Queue a message for publishing and return a future for its outcome"""
+        future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("Publisher pool is closed"))
+            return future
+        
+        # crc32 rather than hash(): the same key always lands on the same worker
+        work = self._queues[zlib.crc32(routing_key.encode()) % self.size]
+        try:
+            work.put((exchange, routing_key, body, properties, future), timeout=timeout)
+        except queue.Full:
+            future.set_exception(RuntimeError("Publisher queue is full"))
+        return future
+    
+    def pending(self) -> int:
+        """Number of messages waiting for a publisher thread"""
+        return sum(work.qsize() for work in self._queues)
+    
+    def spooled(self) -> int:
+        """Number of messages waiting in the spool for the broker to come back"""
+        with self._spool_lock:
+            return len(self.spool)
+        
+    def _next_batch(self, work: queue.Queue) -> Optional[List[Tuple]]:
+        """Block for one message, then drain whatever else is already queued"""
+        item = work.get()
+        if item is self._STOP:
+            return None
+        
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = work.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                # Leave the stop marker for the next wake-up of this worker
+                work.put(item)
+                break
+            batch.append(item)
+        return batch
+        
+    def _open_channel(self):
+        connection = pika.BlockingConnection(pika.URLParameters(self.rabbitmq_url))
+        channel = connection.channel()
+        if self.confirms:
+            channel.confirm_delivery()
+        return connection, channel
+    
+    def _send(self, channel, records: List[SpoolRecord]) -> Tuple[List[Optional[Exception]], Optional[Exception]]:
+        """
+        Publish records in order until one fails.
+        
+        Returns the outcome of each record dealt with (None, or the
+        UnroutableError of a message the broker returned) and the error that
+        stopped the rest. With confirms, the records dealt with are exactly
+        the ones the broker confirmed.
+        """
+        outcomes: List[Optional[Exception]] = []
+        for exchange, routing_key, body, properties in records:
+            try:
+                channel.basic_publish(
+                    exchange=exchange,
+                    routing_key=routing_key,
+                    body=body,
+                    properties=properties,
+                    mandatory=self.confirms
+                )
+                outcomes.append(None)
+            except pika.exceptions.UnroutableError as e:
+                # Retrying cannot help until a queue is bound; don't hold up the rest
+                logger.warning(f"No queue bound for {routing_key} on {exchange or 'the default exchange'}, "
+                               f"message returned")
+                outcomes.append(e)
+            except Exception as e:
+                return outcomes, e
+        return outcomes, None
+    
+    def _go_offline(self) -> None:
+        self._offline = True
+        self._wake_replay.set()
+            
+    def _spool_batch(self, batch: List[Tuple]) -> None:
+        """Append a batch to the spool and resolve its futures; caller holds the lock"""
+        for exchange, routing_key, body, properties, future in batch:
+            if self.spool.append((exchange, routing_key, body, properties)):
+                future.set_result(True)
+            else:
+                future.set_exception(RuntimeError("Broker unavailable and the message could not be spooled"))
+                
+    @staticmethod
+    def _close_quietly(connection) -> None:
+        try:
+            if connection and connection.is_open:
+                connection.close()
+        except Exception:
+            pass
+        
+    def _run(self, work: queue.Queue) -> None:
+        connection = None
+        channel = None
+        
+        while True:
+            batch = self._next_batch(work)
+            if batch is None:
+                break
+            
+            with self._spool_lock:
+                if self._offline:
+                    # Keep ordering behind what is already spooled
+                    self._spool_batch(batch)
+                    continue
+            
+            try:
+                if not connection or connection.is_closed or not channel or channel.is_closed:
+                    connection, channel = self._open_channel()
+                outcomes, error = self._send(channel, [item[:4] for item in batch])
+            except Exception as e:
+                outcomes, error = [], e
+            
+            for (*_, future), outcome in zip(batch, outcomes):
+                if outcome is None:
+                    future.set_result(True)
+                else:
+                    future.set_exception(outcome)
+            
+            if error is not None:
+                unsent = batch[len(outcomes):]
+                if isinstance(error, pika.exceptions.NackError):
+                    # The connection is fine; the queue is full
+                    logger.warning(f"Broker refused a message on {unsent[0][1]}, spooling {len(unsent)} to retry")
+                else:
+                    logger.error(f"Publisher failed to send {len(unsent)} of {len(batch)} messages, spooling: {error}")
+                    self._close_quietly(connection)
+                    connection = None
+                    channel = None
+                with self._spool_lock:
+                    self._spool_batch(unsent)
+                    self._go_offline()
+                
+        self._close_quietly(connection)
+        
+    def _replay(self) -> None:
+        """Reconnect with backoff and drain the spool in order"""
+        connection = None
+        channel = None
+        
+        while not self._closed:
+            self._wake_replay.wait()
+            if self._closed:
+                break
+            
+            try:
+                if not connection or connection.is_closed or not channel or channel.is_closed:
+                    connection, channel = self._open_channel()
+                    logger.info("Publisher reconnected, replaying spooled messages")
+                
+                while True:
+                    with self._spool_lock:
+                        records = self.spool.peek(self.batch_size)
+                        head = self.spool.head
+                        if not records:
+                            self._offline = False
+                            self._wake_replay.clear()
+                            break
+                    
+                    outcomes, error = self._send(channel, records)
+                    with self._spool_lock:
+                        # Records dropped for room meanwhile are already gone
+                        self.spool.pop(len(outcomes), head)
+                    if error is not None:
+                        raise error
+                        
+                self.backoff.reset()
+                
+            except pika.exceptions.NackError:
+                delay = self.backoff.next_delay()
+                logger.warning(f"Broker still refusing spooled messages, retrying in {delay:.1f}s")
+                self._stopping.wait(delay)
+            except Exception as e:
+                self._close_quietly(connection)
+                connection = None
+                channel = None
+                delay = self.backoff.next_delay()
+                logger.warning(f"Broker still unavailable ({e}), retrying in {delay:.1f}s")
+                self._stopping.wait(delay)
+                
+        self._close_quietly(connection)
+                
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush queued messages and stop the publisher threads"""
+        if self._closed:
+            return
+        
+        for work in self._queues:
+            work.put(self._STOP)
+        for thread in self._workers:
+            thread.join(timeout)
+            
+        self._closed = True
+        self._stopping.set()
+        self._wake_replay.set()
+        self._replay_thread.join(timeout)
+        with self._spool_lock:
+            if len(self.spool) and not self.spool.path:
+                logger.warning(f"Dropping {len(self.spool)} unsent messages held in memory")
+            self.spool.close()
+
+class ConsumerDispatcher:
+    """
+    Runs consumer callbacks on worker threads.
+    
+    In ordered mode each routing key is pinned to one single-threaded lane, so
+    messages for the same key are processed in delivery order while different
+    keys proceed in parallel. Acks and nacks are handed back to the consumer's
+    connection thread, since pika channels must only be used from there.
+    """
+    
+    def __init__(self, connection, workers: int, ordered: bool = False, name: str = "consumer"):
+        self.connection = connection
+        self.ordered = ordered
+        if ordered:
+            self._lanes = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-{i}")
+                for i in range(workers)
+            ]
+        else:
+            self._lanes = [ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)]
+            
+    def submit(self, routing_key: str, fn: Callable[[], None]) -> None:
+        """Schedule fn on the lane owning routing_key"""
+        # crc32 rather than hash(): str hashes are salted per process, and the
+        # lane layout should not change between runs
+        lane = self._lanes[zlib.crc32(routing_key.encode()) % len(self._lanes)] if self.ordered else self._lanes[0]
+        lane.submit(fn)
+        
+    def settle(self, fn: Callable[[], None]) -> None:
+        """Run fn (an ack or nack) on the connection thread"""
+        try:
+            self.connection.add_callback_threadsafe(fn)
+        except Exception as e:
+            # Connection is gone; unacked messages will be redelivered
+            logger.warning(f"Could not settle message, connection closed: {e}")
+            
+    def shutdown(self) -> None:
+        for lane in self._lanes:
+            lane.shutdown(wait=False, cancel_futures=True)
+
 class MessageBroker:
-    def __init__(self, rabbitmq_url: str):
+    def __init__(self, rabbitmq_url: str, publisher_pool_size: int = 2,
+                 publisher_confirms: bool = False, publish_batch_size: int = 100,
+                 publish_timeout: float = 10.0, codec: Optional[MessageCodec] = None,
+                 clock: Callable[[], float] = time.time, spool_path: Optional[str] = None,
+                 spool_memory_limit: int = 10000, spool_max_bytes: int = 256 * 1024 * 1024):
         self.rabbitmq_url = rabbitmq_url
+        self.codec = codec or MessageCodec()
+        # Envelope stamps and per-topic delivery latency of consumed messages
+        self.stamper = SequenceStamper(clock=clock)
+        self.latency = LatencyTracker(clock=clock)
         self.connection = None
         self.channel = None
+        self.publish_timeout = publish_timeout
         self.connect()
         self.consumer_threads = {}
+        self.publisher = PublisherPool(
+            rabbitmq_url,
+            size=publisher_pool_size,
+            confirms=publisher_confirms,
+            batch_size=publish_batch_size,
+            spool=OutboundSpool(spool_path, spool_memory_limit, spool_max_bytes)
+        )
         
     def connect(self):
         """Connect to RabbitMQ and set up channel"""
@@ -43,6 +588,11 @@ class MessageBroker:
                     exchange_type='topic',
                     durable=True
                 )
+                self.channel.exchange_declare(
+                    exchange=multicast_exchange_name(topic.value),
+                    exchange_type='headers',
+                    durable=True
+                )
                 
             logger.info("Connected to RabbitMQ")
         except Exception as e:
@@ -58,62 +608,275 @@ class MessageBroker:
             logger.info("RabbitMQ channel is closed, recreating...")
             self.channel = self.connection.channel()
             
+    def _submit(self, exchange: str, key: str, body: bytes, properties: pika.BasicProperties) -> Future:
+        return self.publisher.submit(exchange, key, body, properties, timeout=self.publish_timeout)
+        
+    def _properties(self, topic_name: str, key: str, content_type: str, content_encoding: Optional[str],
+                    extra_headers: Optional[Dict[str, Any]] = None, sequenced: bool = True) -> pika.BasicProperties:
+        headers = self.stamper.headers(topic_name, key, sequenced)
+        if extra_headers:
+            headers.update(extra_headers)
+        return pika.BasicProperties(
+            delivery_mode=get_topic_policy(topic_name).delivery_mode,
+            content_type=content_type,
+            content_encoding=content_encoding,
+            headers=headers
+        )
+        
+    def publish_async(self, topic: str, key: str, message: Dict[str, Any]) -> Future:
+        """
+        Publish a message to a topic without waiting for the broker.
+        
+        Safe to call from any thread. The returned future resolves to True once
+        the message is written (and confirmed, with publisher confirms enabled)
+        or carries the exception that prevented it.
+        """
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        
+        try:
+            body, content_type, content_encoding = self.codec.encode(message)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        
+        return self._submit(topic_name, key, body,
+                            self._properties(topic_name, key, content_type, content_encoding))
+        
+    def publish_multicast(self, topic: str, targets: List[str], message: Dict[str, Any]) -> bool:
+        """
+        Publish one message to the consumers bound with the given multicast ids.
+        
+        The message is encoded once and published once per
+        MULTICAST_MAX_TARGETS targets, instead of once per target. Multicasts
+        carry no sequence number, so they don't count towards gaps.
+        """
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        
+        try:
+            body, content_type, content_encoding = self.codec.encode(message)
+            futures = [
+                self._submit(multicast_exchange_name(topic_name), MULTICAST_ROUTING_KEY, body,
+                             self._properties(topic_name, MULTICAST_ROUTING_KEY, content_type,
+                                              content_encoding, headers, sequenced=False))
+                for headers in multicast_headers(targets)
+            ]
+            for future in futures:
+                future.result(timeout=self.publish_timeout)
+            logger.debug(f"Multicast message to {len(targets)} targets on {topic_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to multicast message to {topic_name}: {e}")
+            return False
+        
     def publish(self, topic: str, key: str, message: Dict[str, Any]) -> bool:
         """Publish a message to a topic"""
         topic_name = topic.value if hasattr(topic, 'value') else topic
         
         try:
-            self._ensure_connection()
-            
-            self.channel.basic_publish(
-                exchange=topic_name,
-                routing_key=key,
-                body=json.dumps(message, cls=DateTimeEncoder).encode(),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # persistent delivery
-                    content_type='application/json'
-                )
-            )
+            self.publish_async(topic, key, message).result(timeout=self.publish_timeout)
             logger.debug(f"Published message to {topic_name} with routing key {key}")
             return True
         except Exception as e:
             logger.error(f"Failed to publish message to {topic_name}: {e}")
             return False
             
-    def consume(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False) -> None:
-        """Consume messages from a topic"""
-        topic_name = topic.value if hasattr(topic, 'value') else topic
+    def _declare_consumer_queue(self, channel, topic_name: str, group_id: str,
+                                binding_keys: Optional[List[str]] = None,
+                                multicast_id: Optional[str] = None) -> str:
+        """
+        Declare the queue for a consumer group and bind it with its routing keys.
         
-        try:
-            self._ensure_connection()
-            
-            # Declare a queue for this consumer group
-            queue_name = f"{topic_name}.{group_id}"
-            self.channel.queue_declare(queue=queue_name, durable=True)
-            
-            # Bind the queue to the exchange with routing key '#' to receive all messages
-            self.channel.queue_bind(
-                exchange=topic_name,
+        Binding only the keys a consumer actually handles lets the broker do the
+        filtering, so a direct message is copied to one queue instead of every
+        queue on the exchange. Without binding keys the queue receives
+        everything ('#'). With a multicast id the queue also receives
+        multicasts that name it. The group's retry queue and the topic's
+        dead-letter exchange and queue are declared alongside.
+        """
+        keys = list(binding_keys) if binding_keys else ['#']
+        policy = get_topic_policy(topic_name)
+        
+        # Declare a queue for this consumer group
+        queue_name = f"{topic_name}.{group_id}"
+        channel.queue_declare(
+            queue=queue_name,
+            durable=True,
+            arguments=policy.queue_arguments()
+        )
+        
+        # Durable queues keep bindings from earlier runs, so drop the
+        # catch-all binding when this consumer asks for specific keys
+        if '#' not in keys:
+            channel.queue_unbind(
                 queue=queue_name,
+                exchange=topic_name,
                 routing_key='#'
             )
+        
+        for key in keys:
+            channel.queue_bind(
+                exchange=topic_name,
+                queue=queue_name,
+                routing_key=key
+            )
+        
+        if multicast_id:
+            channel.exchange_declare(
+                exchange=multicast_exchange_name(topic_name),
+                exchange_type='headers',
+                durable=True
+            )
+            channel.queue_bind(
+                exchange=multicast_exchange_name(topic_name),
+                queue=queue_name,
+                routing_key='',
+                arguments=multicast_binding_arguments(multicast_id)
+            )
+        
+        if policy.max_retries:
+            channel.queue_declare(
+                queue=retry_queue_name(queue_name),
+                durable=True,
+                arguments=retry_queue_arguments(policy, queue_name)
+            )
+        
+        channel.exchange_declare(
+            exchange=dead_letter_exchange_name(topic_name),
+            exchange_type='topic',
+            durable=True
+        )
+        channel.queue_declare(
+            queue=dead_letter_queue_name(topic_name),
+            durable=True,
+            arguments=dead_letter_queue_arguments(policy)
+        )
+        channel.queue_bind(
+            exchange=dead_letter_exchange_name(topic_name),
+            queue=dead_letter_queue_name(topic_name),
+            routing_key='#'
+        )
+        
+        return queue_name
+        
+    def _handle_delivery(self, callback: Callable, auto_commit: bool, topic_name: str, queue_name: str,
+                         routing_key: str, properties, body: bytes) -> Optional[SpoolRecord]:
+        """
+        Decode a delivery and run the callback.
+        
+        Returns None when the message was handled. For a failed message it
+        returns where to republish it before acking: the group's retry queue
+        while it has retries left, otherwise the topic's dead-letter exchange.
+        Messages that cannot be decoded, and failures in auto_commit
+        consumers, are dead-lettered straight away.
+        """
+        headers = properties.headers or {}
+        routing_key = original_routing_key(routing_key, headers)
+        self.latency.observe(topic_name, routing_key, headers)
+        
+        try:
+            value = self.codec.decode(body, properties.content_type, properties.content_encoding)
+        except Exception as e:
+            logger.error(f"Dead-lettering undecodable message from {queue_name}: {e}")
+            return self._failure_record(topic_name, queue_name, routing_key, properties, body,
+                                        DELIVERY_DEAD_LETTER, f"decode: {e}")
+        
+        try:
+            callback(routing_key, value)
+            return None
+        except Exception as e:
+            outcome = failure_disposition(get_topic_policy(topic_name), headers, auto_commit)
+            logger.error(f"Error processing message from {queue_name} ({outcome}): {e}")
+            return self._failure_record(topic_name, queue_name, routing_key, properties, body,
+                                        outcome, repr(e))
+    
+    @staticmethod
+    def _failure_record(topic_name: str, queue_name: str, routing_key: str, properties,
+                        body: bytes, outcome: str, error: str) -> SpoolRecord:
+        if outcome == DELIVERY_RETRY:
+            exchange, key = '', retry_queue_name(queue_name)
+        else:
+            exchange, key = dead_letter_exchange_name(topic_name), routing_key
+        return exchange, key, body, pika.BasicProperties(
+            delivery_mode=properties.delivery_mode,
+            content_type=properties.content_type,
+            content_encoding=properties.content_encoding,
+            headers=failure_headers(properties.headers, routing_key, queue_name, outcome, error)
+        )
+            
+    @staticmethod
+    def _settle(channel, delivery_tag: int, failed: Optional[SpoolRecord],
+                retry_arguments: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Ack a delivery, first republishing it if it failed; must run on the
+        connection's thread. Failed messages are never requeued in place, so
+        a poison message costs at most max_retries + 1 deliveries. With
+        ``retry_arguments`` the retry queue is redeclared first, renewing an
+        expiring queue's lease.
+        """
+        if not delivery_tag or not channel.is_open:
+            # The channel died while the message was being processed; the
+            # broker will redeliver it
+            return
+        if failed is not None:
+            exchange, key, body, properties = failed
+            if retry_arguments is not None and exchange == '':
+                channel.queue_declare(queue=key, durable=True, arguments=retry_arguments)
+            channel.basic_publish(exchange=exchange, routing_key=key, body=body, properties=properties)
+        channel.basic_ack(delivery_tag=delivery_tag)
+            
+    def _start_consumer(self, connection, channel, topic_name: str, group_id: str, callback: Callable,
+                        auto_commit: bool, binding_keys: Optional[List[str]], prefetch_count: int,
+                        workers: int, ordered: bool,
+                        multicast_id: Optional[str] = None) -> Optional["ConsumerDispatcher"]:
+        """Declare the consumer queue, apply prefetch and register the delivery handler"""
+        queue_name = self._declare_consumer_queue(channel, topic_name, group_id, binding_keys, multicast_id)
+        policy = get_topic_policy(topic_name)
+        retry_arguments = (retry_queue_arguments(policy, queue_name)
+                           if policy.max_retries and policy.queue_expires_ms is not None else None)
+        
+        if prefetch_count:
+            channel.basic_qos(prefetch_count=prefetch_count)
+        
+        dispatcher = None
+        if workers:
+            dispatcher = ConsumerDispatcher(connection, workers, ordered, name=queue_name)
             
             def message_handler(ch, method, properties, body):
-                try:
-                    value = json.loads(body.decode())
-                    callback(method.routing_key, value)
+                def process():
+                    failed = self._handle_delivery(callback, auto_commit, topic_name, queue_name,
+                                                   method.routing_key, properties, body)
+                    dispatcher.settle(functools.partial(self._settle, ch, method.delivery_tag, failed, retry_arguments))
                     
-                    if auto_commit or not method.delivery_tag:
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
-                    if not auto_commit and method.delivery_tag:
-                        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                # Retries arrive keyed by queue name; keep them in their original lane
+                lane_key = original_routing_key(method.routing_key, properties.headers)
+                dispatcher.submit(lane_key, process)
+        else:
+            def message_handler(ch, method, properties, body):
+                failed = self._handle_delivery(callback, auto_commit, topic_name, queue_name,
+                                               method.routing_key, properties, body)
+                self._settle(ch, method.delivery_tag, failed, retry_arguments)
+        
+        channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=message_handler,
+            auto_ack=False
+        )
+        return dispatcher
             
-            self.channel.basic_consume(
-                queue=queue_name,
-                on_message_callback=message_handler,
-                auto_ack=False
+    def consume(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False,
+                binding_keys: Optional[List[str]] = None, prefetch_count: int = DEFAULT_PREFETCH_COUNT,
+                workers: int = 0, ordered: bool = False, multicast_id: Optional[str] = None) -> None:
+        """Consume messages from a topic"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        dispatcher = None
+        
+        try:
+            self._ensure_connection()
+            
+            dispatcher = self._start_consumer(
+                self.connection, self.channel, topic_name, group_id, callback,
+                auto_commit, binding_keys, prefetch_count, workers, ordered, multicast_id
             )
             
             logger.info(f"Started consuming from {topic_name}")
@@ -122,11 +885,28 @@ class MessageBroker:
         except Exception as e:
             logger.error(f"Error consuming from topic {topic_name}: {e}")
             raise
+        finally:
+            if dispatcher:
+                dispatcher.shutdown()
             
-    def start_consuming_in_thread(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False) -> threading.Thread:
-        """Start consuming messages in a background thread"""
+    def start_consuming_in_thread(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False,
+                                  binding_keys: Optional[List[str]] = None,
+                                  prefetch_count: int = DEFAULT_PREFETCH_COUNT,
+                                  workers: int = 0, ordered: bool = False,
+                                  multicast_id: Optional[str] = None) -> threading.Thread:
+        """
+        Start consuming messages in a background thread.
+        
+        At most ``prefetch_count`` messages are unacknowledged at a time (0 for
+        no limit). With ``workers`` the callbacks run on a thread pool instead of
+        pika's I/O thread, so a slow callback cannot stall heartbeats; with
+        ``ordered`` messages sharing a routing key are still processed in order.
+        With ``multicast_id`` the consumer also receives multicasts naming it.
+        """
         def consume_wrapper():
+            backoff = ReconnectBackoff(base=1.0)
             while True:
+                dispatcher = None
                 try:
                     # Create a new connection for each consumer thread
                     connection = pika.BlockingConnection(
@@ -143,41 +923,22 @@ class MessageBroker:
                         durable=True
                     )
                     
-                    # Declare a queue for this consumer group
-                    queue_name = f"{topic_name}.{group_id}"
-                    channel.queue_declare(queue=queue_name, durable=True)
-                    
-                    # Bind the queue to the exchange with routing key '#' to receive all messages
-                    channel.queue_bind(
-                        exchange=topic_name,
-                        queue=queue_name,
-                        routing_key='#'
-                    )
-                    
-                    def message_handler(ch, method, properties, body):
-                        try:
-                            value = json.loads(body.decode())
-                            callback(method.routing_key, value)
-                            
-                            if auto_commit or not method.delivery_tag:
-                                ch.basic_ack(delivery_tag=method.delivery_tag)
-                        except Exception as e:
-                            logger.error(f"Error processing message: {e}")
-                            if not auto_commit and method.delivery_tag:
-                                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-                    
-                    channel.basic_consume(
-                        queue=queue_name,
-                        on_message_callback=message_handler,
-                        auto_ack=False
+                    dispatcher = self._start_consumer(
+                        connection, channel, topic_name, group_id, callback,
+                        auto_commit, binding_keys, prefetch_count, workers, ordered, multicast_id
                     )
                     
                     logger.info(f"Started consuming from {topic_name} in thread")
+                    backoff.reset()
                     channel.start_consuming()
                     
                 except Exception as e:
-                    logger.error(f"Error in consumer thread: {e}")
-                    time.sleep(5)  # Wait before retrying
+                    delay = backoff.next_delay()
+                    logger.error(f"Error in consumer thread, reconnecting in {delay:.1f}s: {e}")
+                    time.sleep(delay)
+                finally:
+                    if dispatcher:
+                        dispatcher.shutdown()
                     
         thread_id = f"{topic}.{group_id}"
         if thread_id in self.consumer_threads and self.consumer_threads[thread_id].is_alive():
@@ -189,8 +950,67 @@ class MessageBroker:
         self.consumer_threads[thread_id] = thread
         return thread
         
+    def get_dead_letters(self, topic: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        The oldest dead letters for a topic, without removing them.
+        
+        Messages are fetched unacked on a short-lived channel; closing it
+        returns them to the dead-letter queue in their original order.
+        """
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        connection = pika.BlockingConnection(pika.URLParameters(self.rabbitmq_url))
+        try:
+            channel = connection.channel()
+            result = []
+            while len(result) < limit:
+                method, properties, body = channel.basic_get(dead_letter_queue_name(topic_name), auto_ack=False)
+                if method is None:
+                    break
+                result.append(describe_dead_letter(self.codec, method.routing_key, properties.content_type,
+                                                   properties.content_encoding, properties.headers, body))
+            return result
+        finally:
+            connection.close()
+            
+    def replay_dead_letters(self, topic: str, limit: int = 100) -> int:
+        """Send up to limit dead letters back to their consumer queues with a fresh retry budget"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        connection = pika.BlockingConnection(pika.URLParameters(self.rabbitmq_url))
+        replayed = 0
+        try:
+            channel = connection.channel()
+            channel.confirm_delivery()
+            while replayed < limit:
+                method, properties, body = channel.basic_get(dead_letter_queue_name(topic_name), auto_ack=False)
+                if method is None:
+                    break
+                headers = properties.headers or {}
+                source = headers.get(HEADER_SOURCE_QUEUE)
+                if source:
+                    exchange, key = '', source
+                else:
+                    exchange, key = topic_name, original_routing_key(method.routing_key, headers)
+                channel.basic_publish(
+                    exchange=exchange,
+                    routing_key=key,
+                    body=body,
+                    properties=pika.BasicProperties(
+                        delivery_mode=properties.delivery_mode,
+                        content_type=properties.content_type,
+                        content_encoding=properties.content_encoding,
+                        headers=replay_headers(headers)
+                    )
+                )
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+                replayed += 1
+        finally:
+            connection.close()
+        logger.info(f"Replayed {replayed} dead letters on {topic_name}")
+        return replayed
+        
     def close(self) -> None:
         """Close all connections"""
+        self.publisher.close()
         if self.connection and self.connection.is_open:
             try:
                 self.connection.close()
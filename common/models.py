@@ -60,4 +60,5 @@ class TestExecution(BaseModel):
     start_time: datetime
     end_time: Optional[datetime] = None
     results: Optional[Dict[str, Any]] = None
-    droplet_results: Optional[Dict[str, Dict[str, Any]]] = None
\ No newline at end of file
+    droplet_results: Optional[Dict[str, Dict[str, Any]]] = None
+    dispatch_ms: Optional[float] = None
\ No newline at end of file
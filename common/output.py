@@ -0,0 +1,96 @@
+import base64
+import threading
+from typing import Any, Dict, Optional
+
+from common.codecs import COMPRESSORS
+
+# Agents publish output frames on the status topic under agent.<id>.output
+OUTPUT_KEY_SUFFIX = "output"
+
+# Upper bound on one frame's raw data, before compression
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+# Every console can inflate deflate; zstd depends on what is installed there
+OUTPUT_COMPRESSION = "deflate"
+
+def output_frame(agent_id: str, command_id: str, seq: int, stream: str, offset: int, data: bytes,
+                 execution_id: Optional[str] = None, eof: bool = False,
+                 compression: Optional[str] = OUTPUT_COMPRESSION, level: int = 3) -> Dict[str, Any]:
+    """
+    One chunk of a command's output as a message.
+
+    ``seq`` numbers a command's frames across both streams from 0, and
+    ``offset`` is where ``data`` starts in its stream, so the receiver can
+    reorder frames and tell lost ones apart. The data is compressed and
+    base64-encoded to fit any message codec. The last frame has ``eof`` set
+    and may carry no data.
+    """
+    encoding = None
+    if data and compression:
+        compress, _ = COMPRESSORS[compression]
+        compressed = compress(data, level)
+        # Binary or already-compressed output does not shrink
+        if len(compressed) < len(data):
+            data, encoding = compressed, compression
+
+    frame = {
+        "agent_id": agent_id,
+        "command_id": command_id,
+        "seq": seq,
+        "stream": stream,
+        "offset": offset,
+        "data": base64.b64encode(data).decode("ascii"),
+        "encoding": encoding,
+        "eof": eof
+    }
+    if execution_id:
+        frame["execution_id"] = execution_id
+    return frame
+
+class OutputWindow:
+    """
+    Caps the output bytes handed to the publisher and not yet sent.
+
+    ``acquire`` blocks while the window is full, which stalls the reader and
+    with it the command writing to its pipe. A frame that still does not fit
+    after ``timeout`` seconds is dropped and counted in ``dropped``; the
+    receiver sees the gap in ``seq`` and ``offset``.
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, timeout: float = 5.0):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.in_flight = 0
+        self.dropped = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int) -> bool:
+        """Reserve ``size`` bytes, False if the frame was dropped instead"""
+        with self._cond:
+            # An empty window admits any frame, so one never waits forever
+            if not self._cond.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.max_bytes,
+                                       self.timeout):
+                self.dropped += 1
+                return False
+            self.in_flight += size
+            return True
+
+    def release(self, size: int) -> None:
+        """Return bytes once their frame is sent, spooled or failed"""
+        with self._cond:
+            self.in_flight -= size
+            self._cond.notify_all()
+
+def frame_data(frame: Dict[str, Any]) -> bytes:
+    """The raw output bytes a frame carries"""
+    data = base64.b64decode(frame.get("data") or "")
+    encoding = frame.get("encoding")
+    if encoding:
+        if encoding not in COMPRESSORS:
+            raise ValueError(f"Unsupported output encoding: {encoding}")
+        _, decompress = COMPRESSORS[encoding]
+        data = decompress(data)
+    return data
@@ -0,0 +1,290 @@
+import json
+import os
+import random
+import struct
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import pika
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# (exchange, routing key, body, properties)
+SpoolRecord = Tuple[str, str, bytes, pika.BasicProperties]
+
+# Frame header: metadata length, body length
+_FRAME_HEADER = struct.Struct(">II")
+
+# Spool files a host may hold: the path, then path.1 .. path.<n-1>
+MAX_SPOOL_SLOTS = 64
+
+# Bytes moved per read when compacting the spool file
+_COMPACT_CHUNK = 1024 * 1024
+
+class ReconnectBackoff:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, base: float = 0.5, maximum: float = 30.0):
+        self.base = base
+        self.maximum = maximum
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        """Delay before the next attempt; grows with every call until reset"""
+        ceiling = min(self.maximum, self.base * (2 ** self.attempt))
+        self.attempt += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+def _encode_record(record: SpoolRecord) -> bytes:
+    exchange, routing_key, body, properties = record
+    meta = json.dumps({
+        "exchange": exchange,
+        "routing_key": routing_key,
+        "content_type": properties.content_type,
+        "content_encoding": properties.content_encoding,
+        "delivery_mode": properties.delivery_mode,
+        "headers": properties.headers,
+    }).encode()
+    return _FRAME_HEADER.pack(len(meta), len(body)) + meta + body
+
+def _decode_meta(meta: bytes, body: bytes) -> SpoolRecord:
+    fields: Dict[str, Any] = json.loads(meta.decode())
+    properties = pika.BasicProperties(
+        content_type=fields["content_type"],
+        content_encoding=fields["content_encoding"],
+        delivery_mode=fields["delivery_mode"],
+        headers=fields["headers"]
+    )
+    return fields["exchange"], fields["routing_key"], body, properties
+
+class OutboundSpool:
+    """
+    Ordered buffer for messages that could not be published yet.
+
+    With a path, every record is written to an append-only file as it is
+    added, so nothing accepted by the spool is lost if the process is killed
+    or crashes; the file is flushed to the OS on every append but not
+    fsynced. Up to ``memory_limit`` records at a time are read back into a
+    memory ring for replay, so memory use is bounded however long the broker
+    is away. Without a path the spool is memory only and holds at most
+    ``memory_limit`` records.
+
+    The file holds at most ``max_bytes`` of unsent records. When a record
+    would not fit, or the memory-only spool is full, the oldest records
+    are dropped to make room and counted in ``dropped``. Sent and dropped
+    records are cut from the front of the file once they take up as much
+    space as the limit, so the file stays under twice that size.
+
+    The file is locked while the spool is open. If another process on the
+    host holds it, the spool uses the first free of ``path.1``,
+    ``path.2``, ... instead, so agents sharing a host never write into each
+    other's spool, and a restarted agent picks up a file left behind.
+
+    Records found in the file at startup are replayed, so delivery across an
+    agent restart is at-least-once: records popped since the file was last
+    emptied or compacted may be sent again. The spool is not thread-safe;
+    the owner serializes access.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_limit: int = 10000,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.memory_limit = max(1, memory_limit)
+        self.max_bytes = max(1, max_bytes)
+        # Records removed to make room, and records removed from the front
+        # in total (sent or dropped), so a replay in flight can tell
+        self.dropped = 0
+        self.head = 0
+        self._memory: Deque[SpoolRecord] = deque()
+        # Frame sizes of the file records in the memory ring
+        self._sizes: Deque[int] = deque()
+        self._file = None
+        # Start of the oldest record not yet popped, of the next one to load,
+        # and the end of the file
+        self._start_offset = 0
+        self._read_offset = 0
+        self._end_offset = 0
+        # Records in the file not loaded into memory yet
+        self._file_records = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = self._open_locked(path)
+            self._file_records = self._count_records()
+            self._end_offset = self._file.tell()
+            if self._file_records:
+                logger.info(f"Found {self._file_records} spooled messages in {self.path}")
+
+    def _open_locked(self, path: str):
+        """Open the first spool file no other process holds; sets self.path"""
+        for slot in range(MAX_SPOOL_SLOTS):
+            candidate = path if slot == 0 else f"{path}.{slot}"
+            # Append mode: writes always go to the end, reads seek freely
+            file = open(candidate, "a+b")
+            if fcntl is None:
+                break
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                file.close()
+        else:
+            raise RuntimeError(f"All {MAX_SPOOL_SLOTS} spool files at {path} are in use")
+        if candidate != path:
+            logger.info(f"Spool file {path} is in use by another process, using {candidate}")
+        self.path = candidate
+        return file
+
+    def __len__(self) -> int:
+        return len(self._memory) + self._file_records
+
+    def _count_records(self) -> int:
+        size = os.fstat(self._file.fileno()).st_size
+        self._file.seek(0)
+        count = 0
+        good = 0
+        while True:
+            header = self._file.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                break
+            meta_len, body_len = _FRAME_HEADER.unpack(header)
+            end = self._file.seek(meta_len + body_len, os.SEEK_CUR)
+            if end > size:
+                break
+            good = end
+            count += 1
+        if good < size:
+            # Drop a torn write left by a crash so new records stay readable
+            logger.warning(f"Discarding {size - good} bytes of incomplete data in {self.path}")
+            self._file.truncate(good)
+        self._file.seek(good)
+        return count
+
+    def append(self, record: SpoolRecord) -> bool:
+        """Add a record at the tail, dropping the oldest if needed; False if it could not be stored"""
+        if self._file is None:
+            if len(self._memory) >= self.memory_limit:
+                self._drop_oldest()
+            self._memory.append(record)
+            return True
+
+        frame = _encode_record(record)
+        if len(frame) > self.max_bytes:
+            logger.error(f"Message of {len(frame)} bytes is larger than the whole spool, dropping it")
+            self.dropped += 1
+            return False
+        while len(self) and self._end_offset - self._start_offset + len(frame) > self.max_bytes:
+            self._drop_oldest()
+        if self._start_offset >= self.max_bytes:
+            self._compact()
+
+        try:
+            self._file.write(frame)
+            self._file.flush()
+        except OSError as e:
+            logger.error(f"Failed to write to spool file {self.path}: {e}")
+            return False
+        self._end_offset += len(frame)
+        self._file_records += 1
+        return True
+
+    def _drop_oldest(self) -> None:
+        """Make room by discarding the oldest record"""
+        if self._memory:
+            self.pop(1)
+        else:
+            # Skip it in the file without reading its body
+            self._file.seek(self._read_offset)
+            meta_len, body_len = _FRAME_HEADER.unpack(self._file.read(_FRAME_HEADER.size))
+            self._read_offset += _FRAME_HEADER.size + meta_len + body_len
+            self._start_offset = self._read_offset
+            self._file_records -= 1
+            self.head += 1
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(f"Spool is full, dropped {self.dropped} oldest messages so far")
+
+    def _compact(self) -> None:
+        """Move the unsent records to the front of the file, a chunk at a time"""
+        self._file.flush()
+        # The append-mode handle can only write at the end: copy through a second one
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            source, target = self._start_offset, 0
+            while source < self._end_offset:
+                chunk = os.pread(fd, min(_COMPACT_CHUNK, self._end_offset - source), source)
+                os.pwrite(fd, chunk, target)
+                source += len(chunk)
+                target += len(chunk)
+            os.ftruncate(fd, target)
+        finally:
+            os.close(fd)
+        self._read_offset -= self._start_offset
+        self._end_offset -= self._start_offset
+        self._start_offset = 0
+
+    def _load_from_file(self) -> None:
+        """Read file records into the memory ring until it is full"""
+        self._file.seek(self._read_offset)
+        while len(self._memory) < self.memory_limit and self._file_records:
+            header = self._file.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                self._file_records = 0
+                break
+            meta_len, body_len = _FRAME_HEADER.unpack(header)
+            meta = self._file.read(meta_len)
+            body = self._file.read(body_len)
+            self._memory.append(_decode_meta(meta, body))
+            self._sizes.append(_FRAME_HEADER.size + meta_len + body_len)
+            self._file_records -= 1
+        self._read_offset = self._file.tell()
+
+    def peek(self, count: int) -> List[SpoolRecord]:
+        """The oldest records, up to count, without removing them"""
+        if len(self._memory) < count and self._file_records:
+            self._load_from_file()
+        return [self._memory[i] for i in range(min(count, len(self._memory)))]
+
+    def pop(self, count: int, head: Optional[int] = None) -> None:
+        """
+        Remove the oldest count records after they were published
+
+        ``head`` is the spool's head when the records were peeked; records
+        dropped since then are not removed a second time.
+        """
+        if head is not None:
+            count -= self.head - head
+        for _ in range(min(count, len(self._memory))):
+            self._memory.popleft()
+            self.head += 1
+            if self._file is not None:
+                self._start_offset += self._sizes.popleft()
+
+        if self._file is not None and not self._memory and not self._file_records:
+            # Everything has been sent; start the file over
+            self._file.truncate(0)
+            self._start_offset = self._read_offset = self._end_offset = 0
+
+    def close(self) -> None:
+        """Drop already-sent records from the front of the file and close it"""
+        if self._file is None:
+            return
+        try:
+            if self._start_offset:
+                self._compact()
+        finally:
+            self._memory.clear()
+            self._sizes.clear()
+            self._file.close()
+            self._file = None
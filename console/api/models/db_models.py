@@ -17,6 +17,8 @@ class DBDroplet(Base):
     status = Column(String, nullable=False)
     created_at = Column(DateTime, nullable=False)
     agent_status = Column(String, nullable=True)
+    # Id of the agent last registered from the droplet; agents report metrics under it
+    agent_id = Column(String, nullable=True, index=True)
     tags = Column(JSON, nullable=True)
 
 
@@ -24,8 +24,9 @@ async def register_agent(registration: AgentRegistration, db: Session = Depends(
     db_droplet = db.query(DBDroplet).filter(DBDroplet.ip_address == registration.ip_address).first()
     
     if db_droplet:
-        # Update agent status
+        # Update agent status and remember which agent reports for the droplet
         db_droplet.agent_status = AgentStatus.READY.value
+        db_droplet.agent_id = registration.id
         db.commit()
         return {"status": "success", "droplet_id": db_droplet.id}
     else:
@@ -38,7 +39,8 @@ async def register_agent(registration: AgentRegistration, db: Session = Depends(
             ip_address=registration.ip_address,
             status="active",
             created_at=datetime.utcnow(),
-            agent_status=AgentStatus.READY.value
+            agent_status=AgentStatus.READY.value,
+            agent_id=registration.id
         )
         db.add(db_droplet)
         db.commit()
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, Any, List
+
+from common.messaging import TopicType
+from console.messaging.service import MessagingService, get_messaging_service
+
+router = APIRouter()
+
+def _topic(name: str) -> TopicType:
+    """Accept a short topic name ("commands") or the exchange name"""
+    try:
+        return TopicType[name.upper()]
+    except KeyError:
+        pass
+    try:
+        return TopicType(name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Unknown topic {name}")
+
+@router.get("/latency")
+async def get_latency(by_key: bool = False, messaging: MessagingService = Depends(get_messaging_service)) -> Dict[str, Any]:
+    """Publish-to-consume latency and sequence gaps for messages the console consumed"""
+    latency = messaging.broker.latency
+    return latency.snapshot() if by_key else latency.summary()
+
+@router.get("/dead-letters/{topic}")
+async def get_dead_letters(topic: str, limit: int = Query(100, ge=1, le=1000),
+                           messaging: MessagingService = Depends(get_messaging_service)) -> List[Dict[str, Any]]:
+    """The oldest dead-lettered messages for a topic"""
+    return await messaging.broker.get_dead_letters(_topic(topic), limit)
+
+@router.post("/dead-letters/{topic}/replay")
+async def replay_dead_letters(topic: str, limit: int = Query(100, ge=1, le=10000),
+                              messaging: MessagingService = Depends(get_messaging_service)) -> Dict[str, Any]:
+    """Send dead-lettered messages back to the queues they failed in"""
+    replayed = await messaging.broker.replay_dead_letters(_topic(topic), limit)
+    return {"replayed": replayed}
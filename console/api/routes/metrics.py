@@ -1,32 +1,170 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import Optional
+import asyncio
 
 from console.database import get_db
-from console.monitoring.service import MonitoringService
+from console.api.models.db_models import DBDroplet
+from console.monitoring.service import MonitoringService, get_monitoring_service
 
 router = APIRouter()
 
+# Idle SSE streams send a comment this often, so proxies keep them open and
+# a departed client is noticed
+SSE_KEEPALIVE_SECONDS = 15.0
+
+# Droplet attributes fleet queries can group by
+FLEET_GROUPS = {"region": DBDroplet.region, "size": DBDroplet.size}
+
 @router.get("/droplets/{agent_id}")
-async def get_agent_metrics(agent_id: str, lookback_minutes: int = 5, db: Session = Depends(get_db)):
-    """Get recent metrics for an agent/droplet"""
-    service = MonitoringService(db)
-    return service.get_agent_metrics(agent_id, lookback_minutes)
+async def get_agent_metrics(agent_id: str, lookback_minutes: int = 5, max_points: Optional[int] = Query(1000, ge=1),
+                            monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Get recent metrics for an agent/droplet, at a resolution that fits max_points"""
+    return monitoring.get_agent_metrics(agent_id, lookback_minutes, max_points)
+
+@router.get("/droplets/{agent_id}/load")
+async def get_agent_load_metrics(agent_id: str, lookback_minutes: int = 5, max_points: Optional[int] = Query(1000, ge=1),
+                                 monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Get an agent's recent per-second load test stats, at a resolution that fits max_points"""
+    return monitoring.get_agent_metrics(agent_id, lookback_minutes, max_points, load=True)
 
 @router.get("/executions/{execution_id}")
-async def get_execution_metrics(execution_id: str, db: Session = Depends(get_db)):
-    """Get metrics for a specific test execution"""
-    service = MonitoringService(db)
-    return service.get_execution_metrics(execution_id)
+async def get_execution_metrics(execution_id: str, max_points: Optional[int] = Query(500, ge=1),
+                                monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Per-agent and fleet-aggregated metrics over a test execution's window"""
+    metrics = monitoring.get_execution_metrics(execution_id, max_points)
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    return metrics
+
+@router.get("/fleet")
+async def get_fleet_metrics(column: str = "cpu_percent", start: Optional[float] = None, end: Optional[float] = None,
+                            bucket: float = Query(10.0, gt=0), execution_id: Optional[str] = None,
+                            percentiles: str = "50,95,99", bins: Optional[int] = Query(None, ge=1, le=1000),
+                            top: Optional[int] = Query(None, ge=1, le=1000), top_by: str = Query("mean", pattern="^(mean|max)$"),
+                            group_by: Optional[str] = Query(None, pattern="^(region|size)$"),
+                            monitoring: MonitoringService = Depends(get_monitoring_service),
+                            db: Session = Depends(get_db)):
+    """
+    Fleet-wide aggregates of one metric per time bucket: percentiles across
+    agents, optionally a value histogram, the top agents and statistics per
+    droplet region or size. The range is an execution's window, or
+    start/end (epoch seconds, default the last 5 minutes). Nested metrics
+    are addressed by column name, e.g. network/bytes_sent.
+    """
+    try:
+        pcts = tuple(float(p) for p in percentiles.split(",") if p.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    if any(not 0 <= p <= 100 for p in pcts):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    
+    labels = None
+    if group_by:
+        # Metrics are keyed by agent id, which the droplet learns when its agent registers
+        labels = {}
+        for droplet_id, agent_id, group in db.query(DBDroplet.id, DBDroplet.agent_id, FLEET_GROUPS[group_by]):
+            labels[droplet_id] = group
+            if agent_id:
+                labels[agent_id] = group
+    
+    try:
+        result = monitoring.query_fleet(column, start, end, bucket, execution_id, pcts, bins, top, top_by, labels)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Execution not found")
+    return result
 
 @router.get("/live")
-async def get_live_metrics(db: Session = Depends(get_db)):
+async def get_live_metrics(monitoring: MonitoringService = Depends(get_monitoring_service)):
     """Get live metrics for all agents"""
-    service = MonitoringService(db)
-    # Collect recent metrics for all agents in buffer
-    result = {}
-    for agent_id in service.metrics_buffer.keys():
-        metrics = service.get_agent_metrics(agent_id, lookback_minutes=1)
-        if metrics:
-            result[agent_id] = metrics[-1]  # Get most recent metrics
-    return result
\ No newline at end of file
+    return monitoring.get_live_metrics(lookback_minutes=1)
+
+async def _until_disconnect(websocket: WebSocket) -> None:
+    """Return once the client goes away; anything it sends is ignored"""
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@router.websocket("/stream")
+async def stream_live_metrics(websocket: WebSocket, interval: float = Query(1.0, gt=0),
+                              monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """
+    Push live metrics every ``interval`` seconds: a snapshot frame, then
+    delta frames with only the agents and columns that changed
+    """
+    await websocket.accept()
+    subscriber = monitoring.live.subscribe(interval)
+    # Frames can be far apart; watch for the client leaving meanwhile
+    closed = asyncio.ensure_future(_until_disconnect(websocket))
+    try:
+        while True:
+            frame = asyncio.ensure_future(subscriber.next_frame())
+            await asyncio.wait({frame, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed.done():
+                frame.cancel()
+                break
+            await websocket.send_text(frame.result())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        closed.cancel()
+        monitoring.live.unsubscribe(subscriber)
+
+@router.get("/stream")
+async def stream_live_metrics_sse(request: Request, interval: float = Query(1.0, gt=0),
+                                  monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """The live metrics stream as server-sent events, for clients without WebSocket"""
+    async def events():
+        subscriber = monitoring.live.subscribe(interval)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    text = await asyncio.wait_for(subscriber.next_frame(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {text}\n\n"
+        finally:
+            monitoring.live.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@router.get("/stream/stats")
+async def get_stream_stats(monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Live stream groups: subscribers, frames sent and frames merged for slow clients"""
+    return monitoring.live.stats()
+
+@router.get("/alerts")
+async def get_alerts(monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Agent alerts firing now and the most recent alert events"""
+    return monitoring.get_alerts()
+
+@router.get("/load/{run_id}")
+async def get_load_latency(run_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                           monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Load test latency percentiles merged across agents, overall and per second"""
+    latency = monitoring.get_load_latency(run_id, start, end)
+    if latency is None:
+        raise HTTPException(status_code=404, detail="No load test results for this id")
+    return latency
+
+@router.get("/output/{command_id}")
+async def get_command_output(command_id: str, agent_id: Optional[str] = None, offset: int = Query(0, ge=0),
+                             monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """
+    Output of a command per agent as it runs; poll with ``offset`` set to
+    the previous response's ``end`` to get only new output
+    """
+    output = monitoring.get_command_output(command_id, agent_id, offset)
+    if output is None:
+        raise HTTPException(status_code=404, detail="No output for this command")
+    return output
+
+@router.get("/writer")
+async def get_writer_stats(monitoring: MonitoringService = Depends(get_monitoring_service)):
+    """Counters of the time-series writer: queued, flushed and dropped points, flush latency"""
+    if not monitoring.writer:
+        return {"enabled": False}
+    return {"enabled": True, **monitoring.writer.stats()}
@@ -4,7 +4,7 @@ from typing import List, Optional
 from datetime import datetime
 
 from console.database import get_db
-from console.orchestration.service import OrchestrationService
+from console.orchestration.service import DispatchError, NoTargetsError, OrchestrationService
 from common.models import TestConfiguration, TestExecution
 from pydantic import BaseModel
 
@@ -59,9 +59,13 @@ async def execute_test(config_id: str, db: Session = Depends(get_db)):
     """Execute a test based on its configuration"""
     service = OrchestrationService(db)
     try:
-        return service.execute_test(config_id)
+        return await service.execute_test(config_id)
+    except NoTargetsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except DispatchError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -84,7 +88,7 @@ async def get_execution(execution_id: str, db: Session = Depends(get_db)):
 async def abort_execution(execution_id: str, db: Session = Depends(get_db)):
     """Abort a running test execution"""
     service = OrchestrationService(db)
-    success = service.abort_execution(execution_id)
+    success = await service.abort_execution(execution_id)
     if not success:
         raise HTTPException(status_code=404, detail="Cannot abort execution")
     return success
\ No newline at end of file
@@ -2,12 +2,17 @@ from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-import time
+import asyncio
 
-from console.database import engine, Base, get_db
+from console.database import engine, Base, get_db, SessionLocal
 from console.config import settings
-from console.api.routes import droplets, tests, metrics, agents, auth
+from console.api.routes import droplets, tests, metrics, agents, auth, messaging as messaging_routes
+from console.messaging import service as messaging
 from console.messaging.service import MessagingService
+from console.monitoring import service as monitoring
+from console.monitoring.service import MonitoringService
+from console.monitoring.writer import create_writer
+from console.orchestration.service import OrchestrationService
 
 # Create tables
 Base.metadata.create_all(bind=engine)
@@ -26,25 +31,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize messaging service
-messaging_service = None
+async def abort_on_alert(execution_id: str, reason: str) -> None:
+    """Abort an execution that an agent alert invalidated"""
+    db = SessionLocal()
+    try:
+        await OrchestrationService(db).abort_execution(execution_id, reason)
+    finally:
+        db.close()
 
 @app.on_event("startup")
 async def startup_event():
-    global messaging_service
-    
     # Wait for RabbitMQ to be fully started
     max_retries = 10
     retry_count = 0
     
     while retry_count < max_retries:
         try:
-            messaging_service = MessagingService()
+            service = MessagingService()
+            await service.connect()
+            messaging.messaging_service = service
             break
         except Exception as e:
             print(f"Failed to connect to RabbitMQ: {e}")
             retry_count += 1
-            time.sleep(5)  # Wait 5 seconds before retrying
+            await asyncio.sleep(5)  # Wait 5 seconds before retrying
+    
+    if messaging.messaging_service:
+        # One metrics consumer for the app's lifetime; routes only read from it
+        writer = create_writer(
+            settings.METRICS_SINK,
+            influxdb_url=settings.INFLUXDB_URL,
+            influxdb_token=settings.INFLUXDB_TOKEN,
+            influxdb_org=settings.INFLUXDB_ORG,
+            influxdb_bucket=settings.INFLUXDB_BUCKET,
+            file_path=settings.METRICS_FILE_PATH,
+            batch_size=settings.METRICS_BATCH_SIZE,
+            flush_interval=settings.METRICS_FLUSH_INTERVAL,
+            max_queued=settings.METRICS_MAX_QUEUED
+        )
+        service = MonitoringService(
+            messaging.messaging_service,
+            writer=writer,
+            live_min_interval=settings.LIVE_METRICS_MIN_INTERVAL,
+            snapshot_path=settings.METRICS_SNAPSHOT_PATH or None,
+            snapshot_interval=settings.METRICS_SNAPSHOT_INTERVAL,
+            agent_idle_seconds=settings.METRICS_AGENT_IDLE_SECONDS,
+            abort_execution=abort_on_alert if settings.ALERTS_AUTO_ABORT else None
+        )
+        await service.start()
+        monitoring.monitoring_service = service
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if monitoring.monitoring_service:
+        await monitoring.monitoring_service.stop()
+    if messaging.messaging_service:
+        await messaging.messaging_service.close()
 
 @app.get("/")
 async def root():
@@ -68,6 +110,7 @@ app.include_router(droplets.router, prefix=f"{settings.API_V1_STR}/droplets", ta
 app.include_router(tests.router, prefix=f"{settings.API_V1_STR}/tests", tags=["Tests"])
 app.include_router(metrics.router, prefix=f"{settings.API_V1_STR}/metrics", tags=["Metrics"])
 app.include_router(agents.router, prefix=f"{settings.API_V1_STR}/agents", tags=["Agents"])
+app.include_router(messaging_routes.router, prefix=f"{settings.API_V1_STR}/messaging", tags=["Messaging"])
 app.include_router(auth.router, tags=["Authentication"])
 
 if __name__ == "__main__":
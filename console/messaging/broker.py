@@ -0,0 +1,314 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import aio_pika
+
+from common.codecs import MessageCodec
+from common.latency import LatencyTracker, SequenceStamper
+from common.messaging import (
+    TopicType,
+    DEFAULT_PREFETCH_COUNT,
+    DELIVERY_DEAD_LETTER,
+    DELIVERY_RETRY,
+    HEADER_SOURCE_QUEUE,
+    MULTICAST_ROUTING_KEY,
+    dead_letter_exchange_name,
+    dead_letter_queue_arguments,
+    dead_letter_queue_name,
+    describe_dead_letter,
+    failure_disposition,
+    failure_headers,
+    get_topic_policy,
+    multicast_exchange_name,
+    multicast_headers,
+    original_routing_key,
+    replay_headers,
+    retry_queue_arguments,
+    retry_queue_name,
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncMessageBroker:
+    """
+    asyncio-native counterpart of common.messaging.MessageBroker.
+
+    Publishing and consuming run on the event loop through aio-pika, so route
+    handlers never block on a socket write. Queue naming, routing-key
+    bindings and message encoding match the blocking broker used by agents.
+    """
+
+    def __init__(self, rabbitmq_url: str, codec: Optional[MessageCodec] = None,
+                 publisher_confirms: bool = True):
+        self.rabbitmq_url = rabbitmq_url
+        self.codec = codec or MessageCodec()
+        self.publisher_confirms = publisher_confirms
+        self.stamper = SequenceStamper()
+        self.latency = LatencyTracker()
+        self.connection: Optional[aio_pika.abc.AbstractRobustConnection] = None
+        self.channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self.exchanges: Dict[str, aio_pika.abc.AbstractExchange] = {}
+        self.consumers: Dict[str, aio_pika.abc.AbstractChannel] = {}
+
+    async def connect(self) -> None:
+        """Connect to RabbitMQ and declare the topic exchanges"""
+        try:
+            self.connection = await aio_pika.connect_robust(self.rabbitmq_url)
+            self.channel = await self.connection.channel(publisher_confirms=self.publisher_confirms)
+
+            for topic in TopicType:
+                self.exchanges[topic.value] = await self.channel.declare_exchange(
+                    topic.value,
+                    aio_pika.ExchangeType.TOPIC,
+                    durable=True
+                )
+                self.exchanges[multicast_exchange_name(topic.value)] = await self.channel.declare_exchange(
+                    multicast_exchange_name(topic.value),
+                    aio_pika.ExchangeType.HEADERS,
+                    durable=True
+                )
+
+            logger.info("Connected to RabbitMQ")
+        except Exception as e:
+            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            raise
+
+    async def _get_exchange(self, channel, topic_name: str) -> aio_pika.abc.AbstractExchange:
+        if channel is self.channel and topic_name in self.exchanges:
+            return self.exchanges[topic_name]
+        return await channel.declare_exchange(topic_name, aio_pika.ExchangeType.TOPIC, durable=True)
+
+    async def publish(self, topic: str, key: str, message: Dict[str, Any]) -> bool:
+        """Publish a message to a topic"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+
+        try:
+            body, content_type, content_encoding = self.codec.encode(message)
+            exchange = await self._get_exchange(self.channel, topic_name)
+
+            await exchange.publish(
+                aio_pika.Message(
+                    body,
+                    content_type=content_type,
+                    content_encoding=content_encoding,
+                    delivery_mode=get_topic_policy(topic_name).delivery_mode,
+                    headers=self.stamper.headers(topic_name, key)
+                ),
+                routing_key=key
+            )
+            logger.debug(f"Published message to {topic_name} with routing key {key}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to publish message to {topic_name}: {e}")
+            return False
+
+    async def publish_multicast(self, topic: str, targets: List[str], message: Dict[str, Any]) -> bool:
+        """
+        Publish a message to the consumers bound with the given multicast ids.
+
+        The message is encoded once and published once per
+        MULTICAST_MAX_TARGETS targets through the topic's headers exchange,
+        instead of once per target.
+        """
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+
+        try:
+            body, content_type, content_encoding = self.codec.encode(message)
+            exchange = self.exchanges[multicast_exchange_name(topic_name)]
+            delivery_mode = get_topic_policy(topic_name).delivery_mode
+
+            publishes = []
+            for target_headers in multicast_headers(targets):
+                # Each agent only sees its own multicasts: no sequence to check
+                headers = self.stamper.headers(topic_name, MULTICAST_ROUTING_KEY, sequenced=False)
+                headers.update(target_headers)
+                publishes.append(exchange.publish(
+                    aio_pika.Message(
+                        body,
+                        content_type=content_type,
+                        content_encoding=content_encoding,
+                        delivery_mode=delivery_mode,
+                        headers=headers
+                    ),
+                    routing_key=MULTICAST_ROUTING_KEY
+                ))
+            await asyncio.gather(*publishes)
+            logger.debug(f"Multicast message to {len(targets)} targets on {topic_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to multicast message to {topic_name}: {e}")
+            return False
+
+    async def start_consuming(self, topic: str, group_id: str, callback: Callable, auto_commit: bool = False,
+                              binding_keys: Optional[List[str]] = None,
+                              prefetch_count: int = DEFAULT_PREFETCH_COUNT) -> None:
+        """
+        Start consuming messages on the event loop.
+
+        The callback receives (routing_key, message) and may be a plain
+        function or a coroutine function. Each consumer gets its own channel
+        so its prefetch window is independent of publishing.
+        """
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        consumer_id = f"{topic_name}.{group_id}"
+
+        if consumer_id in self.consumers and not self.consumers[consumer_id].is_closed:
+            logger.warning(f"Consumer for {consumer_id} already running")
+            return
+
+        channel = await self.connection.channel()
+        if prefetch_count:
+            await channel.set_qos(prefetch_count=prefetch_count)
+
+        policy = get_topic_policy(topic_name)
+        exchange = await self._get_exchange(channel, topic_name)
+        queue = await channel.declare_queue(
+            consumer_id,
+            durable=True,
+            arguments=policy.queue_arguments()
+        )
+
+        keys = list(binding_keys) if binding_keys else ['#']
+        if '#' not in keys:
+            # Durable queues keep bindings from earlier runs
+            await queue.unbind(exchange, routing_key='#')
+        for key in keys:
+            await queue.bind(exchange, routing_key=key)
+
+        if policy.max_retries:
+            await channel.declare_queue(
+                retry_queue_name(consumer_id),
+                durable=True,
+                arguments=retry_queue_arguments(policy, consumer_id)
+            )
+        dead_letter_exchange = await self._declare_dead_letters(channel, topic_name)
+
+        is_coroutine = asyncio.iscoroutinefunction(callback)
+
+        async def republish(message: aio_pika.abc.AbstractIncomingMessage, routing_key: str,
+                            outcome: str, error: str) -> None:
+            failed = aio_pika.Message(
+                message.body,
+                content_type=message.content_type,
+                content_encoding=message.content_encoding,
+                delivery_mode=message.delivery_mode,
+                headers=failure_headers(message.headers, routing_key, consumer_id, outcome, error)
+            )
+            if outcome == DELIVERY_RETRY:
+                if policy.queue_expires_ms is not None:
+                    # Renew the retry queue's lease; it never has consumers
+                    await channel.declare_queue(
+                        retry_queue_name(consumer_id),
+                        durable=True,
+                        arguments=retry_queue_arguments(policy, consumer_id)
+                    )
+                await channel.default_exchange.publish(failed, routing_key=retry_queue_name(consumer_id))
+            else:
+                await dead_letter_exchange.publish(failed, routing_key=routing_key)
+
+        async def message_handler(message: aio_pika.abc.AbstractIncomingMessage) -> None:
+            routing_key = original_routing_key(message.routing_key, message.headers)
+            self.latency.observe(topic_name, routing_key, message.headers)
+            try:
+                value = self.codec.decode(message.body, message.content_type, message.content_encoding)
+            except Exception as e:
+                logger.error(f"Dead-lettering undecodable message from {consumer_id}: {e}")
+                await republish(message, routing_key, DELIVERY_DEAD_LETTER, f"decode: {e}")
+                await message.ack()
+                return
+
+            try:
+                if is_coroutine:
+                    await callback(routing_key, value)
+                else:
+                    callback(routing_key, value)
+            except Exception as e:
+                outcome = failure_disposition(policy, message.headers, auto_commit)
+                logger.error(f"Error processing message from {consumer_id} ({outcome}): {e}")
+                await republish(message, routing_key, outcome, repr(e))
+            await message.ack()
+
+        await queue.consume(message_handler)
+        self.consumers[consumer_id] = channel
+        logger.info(f"Started consuming from {topic_name}")
+
+    async def _declare_dead_letters(self, channel, topic_name: str) -> aio_pika.abc.AbstractExchange:
+        """Declare a topic's dead-letter exchange and queue"""
+        exchange = await channel.declare_exchange(
+            dead_letter_exchange_name(topic_name),
+            aio_pika.ExchangeType.TOPIC,
+            durable=True
+        )
+        queue = await channel.declare_queue(
+            dead_letter_queue_name(topic_name),
+            durable=True,
+            arguments=dead_letter_queue_arguments(get_topic_policy(topic_name))
+        )
+        await queue.bind(exchange, routing_key='#')
+        return exchange
+
+    async def get_dead_letters(self, topic: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        The oldest dead letters for a topic, without removing them.
+
+        Messages are fetched unacked on a short-lived channel; closing it
+        returns them to the dead-letter queue.
+        """
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        channel = await self.connection.channel()
+        try:
+            await self._declare_dead_letters(channel, topic_name)
+            queue = await channel.get_queue(dead_letter_queue_name(topic_name))
+            result = []
+            while len(result) < limit:
+                message = await queue.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                result.append(describe_dead_letter(self.codec, message.routing_key, message.content_type,
+                                                   message.content_encoding, message.headers, message.body))
+            return result
+        finally:
+            await channel.close()
+
+    async def replay_dead_letters(self, topic: str, limit: int = 100) -> int:
+        """Send up to limit dead letters back to their consumer queues with a fresh retry budget"""
+        topic_name = topic.value if hasattr(topic, 'value') else topic
+        channel = await self.connection.channel(publisher_confirms=True)
+        replayed = 0
+        try:
+            await self._declare_dead_letters(channel, topic_name)
+            queue = await channel.get_queue(dead_letter_queue_name(topic_name))
+            while replayed < limit:
+                message = await queue.get(no_ack=False, fail=False)
+                if message is None:
+                    break
+                headers = message.headers or {}
+                replayed_message = aio_pika.Message(
+                    message.body,
+                    content_type=message.content_type,
+                    content_encoding=message.content_encoding,
+                    delivery_mode=message.delivery_mode,
+                    headers=replay_headers(headers)
+                )
+                if headers.get(HEADER_SOURCE_QUEUE):
+                    await channel.default_exchange.publish(replayed_message, routing_key=headers[HEADER_SOURCE_QUEUE])
+                else:
+                    exchange = await self._get_exchange(channel, topic_name)
+                    await exchange.publish(replayed_message,
+                                           routing_key=original_routing_key(message.routing_key, headers))
+                await message.ack()
+                replayed += 1
+        finally:
+            await channel.close()
+        logger.info(f"Replayed {replayed} dead letters on {topic_name}")
+        return replayed
+
+    async def close(self) -> None:
+        """Close all channels and the connection"""
+        if self.connection and not self.connection.is_closed:
+            try:
+                await self.connection.close()
+                logger.info("Closed RabbitMQ connection")
+            except Exception as e:
+                logger.error(f"Error closing connection: {e}")
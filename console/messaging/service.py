@@ -1,54 +1,120 @@
 from typing import Dict, Any, List, Optional
-from common.messaging import MessageBroker, TopicType
+from common.messaging import TopicType
+from common.codecs import MessageCodec
 from console.config import settings
+from console.messaging.broker import AsyncMessageBroker
 import logging
 
 logger = logging.getLogger(__name__)
 
 class MessagingService:
-    def __init__(self):
-        self.broker = MessageBroker(
-            rabbitmq_url=settings.RABBITMQ_URL
+    def __init__(self, broker: Optional[AsyncMessageBroker] = None):
+        self.broker = broker or AsyncMessageBroker(
+            rabbitmq_url=settings.RABBITMQ_URL,
+            publisher_confirms=settings.RABBITMQ_PUBLISHER_CONFIRMS,
+            codec=MessageCodec.from_names(
+                settings.MESSAGE_CODEC,
+                settings.MESSAGE_COMPRESSION or None,
+                settings.MESSAGE_COMPRESSION_THRESHOLD
+            )
         )
-        
-    def send_command(self, command: Dict[str, Any]) -> bool:
+
+    async def connect(self) -> None:
+        """
+        Connect to the message broker
+        """
+        await self.broker.connect()
+
+    async def close(self) -> None:
+        """
+        Close the message broker connection
+        """
+        await self.broker.close()
+
+    async def send_command(self, command: Dict[str, Any]) -> bool:
         """
         Send a command to all agents
         """
-        return self.broker.publish(
+        return await self.broker.publish(
             topic=TopicType.COMMANDS,
             key="broadcast",
             message=command
         )
-        
-    def send_direct_command(self, agent_id: str, command: Dict[str, Any]) -> bool:
+
+    async def send_direct_command(self, agent_id: str, command: Dict[str, Any]) -> bool:
         """
         Send a command to a specific agent
         """
-        return self.broker.publish(
+        return await self.broker.publish(
             topic=TopicType.COMMANDS,
             key=agent_id,
             message=command
         )
-        
-    def register_status_handler(self, callback) -> None:
+
+    async def send_multicast_command(self, agent_ids: List[str], command: Dict[str, Any]) -> bool:
+        """
+        Send a command to a set of agents with a single publish
+        """
+        return await self.broker.publish_multicast(
+            topic=TopicType.COMMANDS,
+            targets=agent_ids,
+            message=command
+        )
+
+    async def publish_alert(self, alert: Dict[str, Any]) -> bool:
+        """
+        Publish an agent alert on the status topic
+        """
+        return await self.broker.publish(
+            topic=TopicType.STATUS,
+            key=f"agent.{alert['agent_id']}.alert",
+            message=alert
+        )
+
+    async def register_status_handler(self, callback) -> None:
         """
         Register a handler for agent status updates
         """
-        self.broker.start_consuming_in_thread(
+        await self.broker.start_consuming(
             topic=TopicType.STATUS,
             group_id="console-status",
             callback=callback,
-            auto_commit=True
+            auto_commit=True,
+            binding_keys=["agent.*.status", "agent.*.result"],
+            prefetch_count=settings.RABBITMQ_CONSUMER_PREFETCH
         )
-        
-    def register_metrics_handler(self, callback) -> None:
+
+    async def register_output_handler(self, callback) -> None:
+        """
+        Register a handler for command output streamed by agents
+        """
+        await self.broker.start_consuming(
+            topic=TopicType.STATUS,
+            group_id="console-output",
+            callback=callback,
+            auto_commit=True,
+            binding_keys=["agent.*.output"],
+            prefetch_count=settings.RABBITMQ_CONSUMER_PREFETCH
+        )
+
+    async def register_metrics_handler(self, callback) -> None:
         """
         Register a handler for metrics collection
         """
-        self.broker.start_consuming_in_thread(
+        await self.broker.start_consuming(
             topic=TopicType.METRICS,
             group_id="console-metrics",
             callback=callback,
-            auto_commit=True
-        )
\ No newline at end of file
+            auto_commit=True,
+            binding_keys=["metrics.system.*", "metrics.load.*"],
+            prefetch_count=settings.RABBITMQ_CONSUMER_PREFETCH
+        )
+
+# Shared instance, connected when the console starts
+messaging_service: Optional[MessagingService] = None
+
+def get_messaging_service() -> MessagingService:
+    """Return the console's messaging service"""
+    if messaging_service is None:
+        raise RuntimeError("Messaging service is not connected")
+    return messaging_service
@@ -0,0 +1,161 @@
+import math
+import operator
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from console.monitoring.store import COLUMN_SEPARATOR
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+ALERT_FIRING = "firing"
+ALERT_RESOLVED = "resolved"
+
+class AlertRule:
+    """
+    A condition on one metric that has to hold for ``for_seconds`` to fire.
+
+    With ``kind="value"`` the metric itself is compared to the threshold;
+    with ``kind="rate"`` its rate of change per minute, smoothed over
+    ``window`` seconds. ``abort`` marks rules whose firing invalidates the
+    agent's test results.
+    """
+
+    def __init__(self, name: str, column: str, op: str, threshold: float, for_seconds: float = 0.0,
+                 kind: str = "value", window: float = 60.0, severity: str = "warning", abort: bool = False):
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op}")
+        if kind not in ("value", "rate"):
+            raise ValueError(f"Unknown rule kind {kind}")
+        self.name = name
+        self.column = column
+        self.op = op
+        self.threshold = threshold
+        self.for_seconds = for_seconds
+        self.kind = kind
+        self.window = window
+        self.severity = severity
+        self.abort = abort
+        self.path = column.split(COLUMN_SEPARATOR)
+        self._compare = OPERATORS[op]
+
+    def extract(self, metrics: Dict[str, Any]) -> Optional[float]:
+        """The rule's metric from a nested metrics dict, None if missing or not numeric"""
+        value: Any = metrics
+        for key in self.path:
+            if type(value) is not dict:
+                return None
+            value = value.get(key)
+        kind = type(value)
+        if kind is float or kind is int or kind is bool:
+            return float(value)
+        return None
+
+    def breached(self, value: float) -> bool:
+        return self._compare(value, self.threshold)
+
+    def describe(self) -> str:
+        metric = f"rate({self.column})/min" if self.kind == "rate" else self.column
+        held = f" for {self.for_seconds:g}s" if self.for_seconds else ""
+        return f"{metric} {self.op} {self.threshold:g}{held}"
+
+class _RuleState:
+    """What one rule remembers about one agent; constant size"""
+    __slots__ = ("since", "firing", "last_timestamp", "last_value", "rate")
+
+    def __init__(self):
+        self.since: Optional[float] = None
+        self.firing = False
+        self.last_timestamp: Optional[float] = None
+        self.last_value: Optional[float] = None
+        self.rate: Optional[float] = None
+
+    def update_rate(self, timestamp: float, value: float, window: float) -> Optional[float]:
+        """EWMA of the per-minute rate of change; None until there are two samples"""
+        last_timestamp, last_value = self.last_timestamp, self.last_value
+        self.last_timestamp, self.last_value = timestamp, value
+        if last_timestamp is None or timestamp <= last_timestamp:
+            return self.rate
+        elapsed = timestamp - last_timestamp
+        instant = (value - last_value) / elapsed * 60.0
+        if self.rate is None:
+            self.rate = instant
+        else:
+            self.rate += (1.0 - math.exp(-elapsed / window)) * (instant - self.rate)
+        return self.rate
+
+# Saturated load generators invalidate a test; these abort when auto-abort is on
+DEFAULT_RULES = (
+    AlertRule("cpu_saturated", "cpu_percent", ">", 90.0, for_seconds=15, severity="critical", abort=True),
+    AlertRule("memory_saturated", "memory_percent", ">", 90.0, for_seconds=15, severity="critical", abort=True),
+    AlertRule("memory_climbing", "memory_percent", ">", 5.0, for_seconds=30, kind="rate", window=60.0),
+    AlertRule("time_sync_lost", "time_sync/using_ntp", "<", 1.0, severity="critical"),
+)
+
+class AlertEngine:
+    """
+    Evaluates alert rules against every incoming metrics sample.
+
+    Each rule keeps a few numbers per agent (when the breach started,
+    whether it is firing, the smoothing state of rates), so a sample costs
+    O(rules) whatever the window lengths; no buffer is rescanned. ``observe``
+    returns the alerts that started firing or resolved with that sample.
+    """
+
+    def __init__(self, rules: Iterable[AlertRule] = DEFAULT_RULES, history: int = 1000):
+        self.rules = list(rules)
+        self._states: Dict[str, List[_RuleState]] = {}
+        self.active: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=history)
+
+    def observe(self, agent_id: str, timestamp: float, metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+        states = self._states.get(agent_id)
+        if states is None:
+            states = self._states[agent_id] = [_RuleState() for _ in self.rules]
+
+        events = []
+        for rule, state in zip(self.rules, states):
+            value = rule.extract(metrics)
+            if value is not None and rule.kind == "rate":
+                value = state.update_rate(timestamp, value, rule.window)
+            if value is None:
+                continue
+
+            if rule.breached(value):
+                if state.since is None:
+                    state.since = timestamp
+                if not state.firing and timestamp - state.since >= rule.for_seconds:
+                    state.firing = True
+                    events.append(self._event(ALERT_FIRING, rule, agent_id, timestamp, value, state.since))
+            else:
+                if state.firing:
+                    events.append(self._event(ALERT_RESOLVED, rule, agent_id, timestamp, value, state.since))
+                state.since = None
+                state.firing = False
+        return events
+
+    def forget(self, agent_ids: Iterable[str]) -> None:
+        """Drop the rule state and active alerts of agents that are gone"""
+        for agent_id in agent_ids:
+            self._states.pop(agent_id, None)
+            for rule in self.rules:
+                self.active.pop((agent_id, rule.name), None)
+
+    def _event(self, state: str, rule: AlertRule, agent_id: str, timestamp: float, value: float,
+               since: float) -> Dict[str, Any]:
+        event = {
+            "agent_id": agent_id,
+            "rule": rule.name,
+            "state": state,
+            "severity": rule.severity,
+            "condition": rule.describe(),
+            "value": value,
+            "since": since,
+            "timestamp": timestamp,
+            "abort": rule.abort,
+        }
+        if state == ALERT_FIRING:
+            self.active[(agent_id, rule.name)] = event
+        else:
+            self.active.pop((agent_id, rule.name), None)
+        self.recent.append(event)
+        return event
@@ -0,0 +1,152 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from console.monitoring.fleet import bucket_matrix, column_stats, json_values
+
+class AgentWindow:
+    """When one agent ran an execution; None until the agent reports it"""
+    __slots__ = ("started", "finished")
+
+    def __init__(self, started: Optional[float] = None, finished: Optional[float] = None):
+        self.started = started
+        self.finished = finished
+
+class ExecutionRecord:
+    """Membership and time window of one test execution"""
+
+    def __init__(self, execution_id: str, scheduled_start: float, duration: Optional[float]):
+        self.execution_id = execution_id
+        self.scheduled_start = scheduled_start
+        self.duration = duration
+        self.finished: Optional[float] = None
+        self.agents: Dict[str, AgentWindow] = {}
+
+    def agent_window(self, agent_id: str, now: float) -> Tuple[float, float]:
+        """(start, end) of an agent's part in the run, estimated from the schedule until it reports"""
+        window = self.agents.get(agent_id) or AgentWindow()
+        start = window.started if window.started is not None else self.scheduled_start
+        if window.finished is not None:
+            end = window.finished
+        elif self.finished is not None:
+            end = self.finished
+        elif self.duration:
+            end = min(now, start + self.duration)
+        else:
+            end = now
+        return start, max(start, end)
+
+    def window(self, now: float) -> Tuple[float, float]:
+        """(start, end) covering every agent"""
+        if not self.agents:
+            return self.agent_window("", now)
+        spans = [self.agent_window(agent_id, now) for agent_id in self.agents]
+        return min(start for start, _ in spans), max(end for _, end in spans)
+
+class ExecutionIndex:
+    """
+    Which agents took part in which execution, and when.
+
+    Fed by the console's own dispatch (targets and scheduled start) and by
+    the agents' status and result messages (actual start and finish), so
+    metrics for an execution can be read with one range lookup per member
+    agent. Only the most recent ``max_executions`` are kept.
+    """
+
+    def __init__(self, max_executions: int = 1000, clock=time.time):
+        self.max_executions = max_executions
+        self.clock = clock
+        self._executions: "OrderedDict[str, ExecutionRecord]" = OrderedDict()
+        # agent id -> execution it is running now
+        self._active: Dict[str, str] = {}
+
+    def __contains__(self, execution_id: str) -> bool:
+        return execution_id in self._executions
+
+    def get(self, execution_id: str) -> Optional[ExecutionRecord]:
+        return self._executions.get(execution_id)
+
+    def _record(self, execution_id: str, scheduled_start: Optional[float] = None) -> ExecutionRecord:
+        record = self._executions.get(execution_id)
+        if record is None:
+            # Executions we did not dispatch (e.g. after a console restart)
+            # start from the first report we see
+            record = self._executions[execution_id] = ExecutionRecord(
+                execution_id, scheduled_start if scheduled_start is not None else self.clock(), None
+            )
+            while len(self._executions) > self.max_executions:
+                _, evicted = self._executions.popitem(last=False)
+                self._deactivate(evicted)
+        return record
+
+    def track(self, execution_id: str, agent_ids: Optional[List[str]], scheduled_start: float,
+              duration: Optional[float]) -> None:
+        """Register a dispatched execution; broadcast runs (no agent list) learn members as agents start"""
+        record = self._record(execution_id, scheduled_start)
+        record.scheduled_start = scheduled_start
+        record.duration = duration
+        for agent_id in agent_ids or []:
+            record.agents.setdefault(agent_id, AgentWindow())
+
+    def agent_started(self, execution_id: str, agent_id: str, timestamp: float) -> None:
+        window = self._record(execution_id, timestamp).agents.setdefault(agent_id, AgentWindow())
+        window.started = timestamp
+        self._active[agent_id] = execution_id
+
+    def agent_finished(self, execution_id: str, agent_id: str, timestamp: float) -> None:
+        window = self._record(execution_id, timestamp).agents.setdefault(agent_id, AgentWindow())
+        window.finished = timestamp
+        if self._active.get(agent_id) == execution_id:
+            del self._active[agent_id]
+
+    def finish(self, execution_id: str, timestamp: float) -> None:
+        """The whole execution ended (aborted or failed); agents still running stop here"""
+        record = self._executions.get(execution_id)
+        if record is not None:
+            record.finished = timestamp
+            self._deactivate(record)
+
+    def _deactivate(self, record: ExecutionRecord) -> None:
+        for agent_id in record.agents:
+            if self._active.get(agent_id) == record.execution_id:
+                del self._active[agent_id]
+
+    def active_execution(self, agent_id: str) -> Optional[str]:
+        """The execution an agent has started and not yet finished"""
+        return self._active.get(agent_id)
+
+def fleet_series(series: Dict[str, Tuple[np.ndarray, Dict[str, np.ndarray]]], start: float, end: float,
+                 step: float) -> Dict[str, Any]:
+    """
+    Fleet aggregate of per-agent series on a common time grid: mean, min
+    and max across agents and the number of agents reporting, per step.
+    """
+    buckets = max(1, int(math.ceil((end - start) / step)))
+    per_column: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+    for timestamps, columns in series.values():
+        for name, values in columns.items():
+            per_column.setdefault(name, []).append((timestamps, values))
+
+    result: Dict[str, Any] = {
+        "timestamps": (start + step * np.arange(buckets)).tolist(),
+        "step": step,
+        "metrics": {},
+    }
+    for name, rows in per_column.items():
+        stats = column_stats(bucket_matrix(rows, start, step, buckets), percentiles=())
+        result["metrics"][name] = {
+            "mean": json_values(stats["mean"]),
+            "min": json_values(stats["min"]),
+            "max": json_values(stats["max"]),
+            "agents": stats["count"].tolist(),
+        }
+    return result
+
+def sample_interval(timestamps: np.ndarray, default: float = 1.0) -> float:
+    """Typical spacing of a series' samples (median gap)"""
+    if timestamps.size < 2:
+        return default
+    return float(np.median(np.diff(timestamps)))
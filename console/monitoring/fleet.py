@@ -0,0 +1,146 @@
+import math
+import warnings
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from console.monitoring.store import MetricsStore, _row_percentiles
+
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+# Upper bound on time buckets per query
+MAX_BUCKETS = 10_000
+
+def json_values(values: np.ndarray) -> List[Optional[float]]:
+    """Array as a JSON-safe list: NaN (no data) becomes None"""
+    return [None if value != value else value for value in values.tolist()]
+
+def bucket_matrix(series: Sequence[Tuple[np.ndarray, np.ndarray]], start: float, step: float,
+                  buckets: int) -> np.ndarray:
+    """
+    Per-series means on a common time grid, as a (series x buckets) matrix.
+
+    Every series is averaged within each step first, so each agent weighs
+    the same whatever its sample rate; steps without samples are NaN. All
+    series are binned with a single bincount.
+    """
+    rows = len(series)
+    if not rows:
+        return np.full((0, buckets), np.nan)
+    sizes = [timestamps.size for timestamps, _ in series]
+    timestamps = np.concatenate([timestamps for timestamps, _ in series])
+    values = np.concatenate([values for _, values in series])
+
+    # Samples are at or after start, so truncation is floor division (and cheaper)
+    column = np.minimum(((timestamps - start) * (1.0 / step)).astype(np.intp), buckets - 1)
+    index = np.repeat(np.arange(rows) * buckets, sizes) + column
+    valid = ~np.isnan(values)
+    if not valid.all():
+        index, values = index[valid], values[valid]
+    counts = np.bincount(index, minlength=rows * buckets)
+    sums = np.bincount(index, weights=values, minlength=rows * buckets)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return means.reshape(rows, buckets)
+
+def column_stats(matrix: np.ndarray, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, np.ndarray]:
+    """count, mean, min, max and percentiles down each column of a matrix, ignoring NaN"""
+    counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+    with warnings.catch_warnings():
+        # Columns where no agent reported are expected
+        warnings.simplefilter("ignore", RuntimeWarning)
+        stats = {
+            "count": counts,
+            "mean": np.nanmean(matrix, axis=0),
+            "min": np.nanmin(matrix, axis=0),
+            "max": np.nanmax(matrix, axis=0),
+        }
+    if matrix.shape[0]:
+        stats.update(_row_percentiles(matrix.T, counts, percentiles))
+    else:
+        stats.update({f"p{pct:g}": np.full(matrix.shape[1], np.nan) for pct in percentiles})
+    return stats
+
+class FleetFrame:
+    """
+    One metric for a set of agents on a common time grid.
+
+    ``values`` is an (agents x buckets) matrix of per-agent bucket means;
+    the aggregates below are column or row reductions over it.
+    """
+
+    def __init__(self, column: str, agent_ids: List[str], start: float, step: float, values: np.ndarray):
+        self.column = column
+        self.agent_ids = agent_ids
+        self.start = start
+        self.step = step
+        self.values = values
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Start of every bucket"""
+        return self.start + self.step * np.arange(self.values.shape[1])
+
+    def stats(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, np.ndarray]:
+        """Per-bucket statistics across agents"""
+        return column_stats(self.values, percentiles)
+
+    def histogram(self, bins: int = 20,
+                  value_range: Optional[Tuple[float, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Bin edges and a (buckets x bins) matrix counting agents per value bin in every bucket"""
+        buckets = self.values.shape[1]
+        valid = ~np.isnan(self.values)
+        if value_range is None:
+            value_range = ((float(self.values[valid].min()), float(self.values[valid].max()))
+                           if valid.any() else (0.0, 1.0))
+        edges = np.histogram_bin_edges([], bins=bins, range=value_range)
+
+        _, bucket = np.nonzero(valid)
+        values = self.values[valid]
+        inside = (values >= edges[0]) & (values <= edges[-1])
+        value_bin = np.clip(np.searchsorted(edges, values[inside], side="right") - 1, 0, bins - 1)
+        counts = np.bincount(bucket[inside] * bins + value_bin, minlength=buckets * bins)
+        return edges, counts.reshape(buckets, bins)
+
+    def top(self, k: int = 10, by: str = "mean") -> List[Tuple[str, float]]:
+        """The k agents with the highest mean (or max) over the range, hottest first"""
+        reduce = {"mean": np.nanmean, "max": np.nanmax}[by]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            scores = reduce(self.values, axis=1) if self.values.size else np.empty(0)
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+        k = min(k, scores.size)
+        if not k:
+            return []
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.agent_ids[i], float(scores[i])) for i in ranked if np.isfinite(scores[i])]
+
+    def group_by(self, labels: Dict[str, str],
+                 percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, Dict[str, np.ndarray]]:
+        """Per-bucket statistics within each group of agents; agents without a label go to 'unknown'"""
+        names = np.array([labels.get(agent_id) or "unknown" for agent_id in self.agent_ids])
+        groups = {}
+        for name in np.unique(names):
+            groups[str(name)] = column_stats(self.values[names == name], percentiles)
+        return groups
+
+def fleet_frame(store: MetricsStore, column: str, agent_ids: Iterable[str], start: float, end: float,
+                step: float) -> FleetFrame:
+    """
+    One column of the given agents over [start, end) in ``step`` buckets.
+
+    Raw samples are used while the window is within raw retention, rollup
+    bucket means beyond it. Raises ValueError past MAX_BUCKETS buckets.
+    """
+    buckets = max(1, int(math.ceil((end - start) / step)))
+    if buckets > MAX_BUCKETS:
+        raise ValueError(f"{buckets} buckets requested, at most {MAX_BUCKETS}; use a larger bucket")
+    # The store reads (since, until]; shift both bounds to get [start, end)
+    since, until = np.nextafter(start, -np.inf), np.nextafter(end, -np.inf)
+    agents, series = [], []
+    for agent_id in agent_ids:
+        timestamps, columns, _ = store.resolved(agent_id, since, until, columns=[column])
+        agents.append(agent_id)
+        series.append((timestamps, columns.get(column, np.full(timestamps.size, np.nan))))
+    return FleetFrame(column, agents, start, step, bucket_matrix(series, start, step, buckets))
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import math
+import logging
+from typing import Any, Dict, Iterable, Optional, Set
+
+from console.monitoring.store import MetricsStore
+
+logger = logging.getLogger(__name__)
+
+# A frame: {'type': 'snapshot' | 'delta', 'seq': int, 'interval': float,
+#           'agents': {agent_id: {'timestamp': float, 'metrics': {column: value}}}}
+Frame = Dict[str, Any]
+
+def encode_frame(frame: Frame) -> str:
+    return json.dumps(frame, separators=(",", ":"))
+
+def merge_frames(older: Frame, newer: Frame) -> Frame:
+    """
+    One frame equivalent to applying ``older`` then ``newer``.
+
+    Columns of an agent present in both are merged, newer values winning;
+    the result keeps ``older``'s type, so a snapshot stays a snapshot.
+    """
+    agents = dict(older["agents"])
+    for agent_id, update in newer["agents"].items():
+        previous = agents.get(agent_id)
+        if previous is None:
+            agents[agent_id] = update
+        else:
+            agents[agent_id] = {
+                "timestamp": update["timestamp"],
+                "metrics": {**previous["metrics"], **update["metrics"]},
+            }
+    return {**newer, "type": older["type"], "agents": agents}
+
+class LiveSubscriber:
+    """
+    One connected dashboard.
+
+    Holds at most one pending frame: a frame offered before the client took
+    the previous one is merged into it, so a slow client gets fewer, larger
+    frames instead of a growing backlog. Frames that were not merged are sent
+    as the text the group encoded once for everyone.
+    """
+
+    def __init__(self, group: "LiveGroup"):
+        self.group = group
+        self.coalesced = 0
+        self._pending: Optional[Frame] = None
+        self._text: Optional[str] = None
+        self._ready = asyncio.Event()
+
+    def offer(self, frame: Frame, text: Optional[str] = None) -> None:
+        if self._pending is None:
+            self._pending, self._text = frame, text
+        else:
+            self._pending, self._text = merge_frames(self._pending, frame), None
+            self.coalesced += 1
+        self._ready.set()
+
+    async def next_frame(self) -> str:
+        """Wait for the next frame and return it encoded"""
+        await self._ready.wait()
+        self._ready.clear()
+        frame, text = self._pending, self._text
+        self._pending = self._text = None
+        return text if text is not None else encode_frame(frame)
+
+class LiveGroup:
+    """
+    Subscribers sharing an update interval.
+
+    Every ``interval`` seconds the group turns the agents that reported since
+    the last tick into one delta frame (only the columns whose value changed
+    since the group last sent them), encodes it once and offers the same text
+    to every subscriber. The per-tick cost depends on the agents that changed,
+    not on how many dashboards are open.
+    """
+
+    def __init__(self, store: MetricsStore, interval: float):
+        self.store = store
+        self.interval = interval
+        self.subscribers: Set[LiveSubscriber] = set()
+        self.dirty: Set[str] = set()
+        self.seq = 0
+        # What this group's subscribers were last told, per agent
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.timestamps: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        for agent_id in store.agents():
+            self._refresh(agent_id)
+
+    def _refresh(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Update the group state from the agent's newest sample and return the changed columns"""
+        series = self.store.series.get(agent_id)
+        sample = series.latest() if series else None
+        if sample is None:
+            return None
+        timestamp, values = sample
+        previous = self.state.get(agent_id, {})
+        # NaN is a column missing from the sample; send it as null once
+        current = {name: (None if value != value else value) for name, value in values.items()}
+        changed = {name: value for name, value in current.items() if previous.get(name) != value}
+        self.state[agent_id] = current
+        self.timestamps[agent_id] = timestamp
+        return changed
+
+    def snapshot(self) -> Frame:
+        """Everything the group's subscribers currently know, for a new subscriber"""
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "interval": self.interval,
+            "agents": {
+                agent_id: {"timestamp": self.timestamps[agent_id],
+                           "metrics": {name: value for name, value in values.items() if value is not None}}
+                for agent_id, values in self.state.items()
+            },
+        }
+
+    def tick(self) -> Optional[Frame]:
+        """Build this interval's delta frame and offer it to every subscriber"""
+        if not self.dirty:
+            return None
+        agents = {}
+        for agent_id in self.dirty:
+            changed = self._refresh(agent_id)
+            if changed is not None:
+                agents[agent_id] = {"timestamp": self.timestamps[agent_id], "metrics": changed}
+        self.dirty.clear()
+        if not agents:
+            return None
+
+        self.seq += 1
+        frame = {"type": "delta", "seq": self.seq, "interval": self.interval, "agents": agents}
+        text = encode_frame(frame)
+        for subscriber in self.subscribers:
+            subscriber.offer(frame, text)
+        return frame
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error building live metrics frame: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+class LiveMetricsHub:
+    """
+    Push-based fan-out of agents' newest metrics.
+
+    The monitoring service marks an agent on every sample it stores;
+    subscribers are grouped by interval (clamped to ``min_interval`` ..
+    ``max_interval`` and rounded to a multiple of ``min_interval``), and each
+    group runs one ticker while it has subscribers. Runs on the event loop.
+    """
+
+    def __init__(self, store: MetricsStore, min_interval: float = 0.25, max_interval: float = 60.0):
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.groups: Dict[float, LiveGroup] = {}
+
+    def normalize_interval(self, interval: float) -> float:
+        if math.isnan(interval):
+            interval = 1.0
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        return round(interval / self.min_interval) * self.min_interval
+
+    def mark(self, agent_id: str) -> None:
+        """An agent has a new sample"""
+        for group in self.groups.values():
+            group.dirty.add(agent_id)
+
+    def forget(self, agent_ids: Iterable[str]) -> None:
+        """Drop agents that are gone from every group; new subscribers no longer see them"""
+        for agent_id in agent_ids:
+            for group in self.groups.values():
+                group.dirty.discard(agent_id)
+                group.state.pop(agent_id, None)
+                group.timestamps.pop(agent_id, None)
+
+    def subscribe(self, interval: float = 1.0) -> LiveSubscriber:
+        """Join the group for an interval; the first frame is a snapshot of the group's state"""
+        interval = self.normalize_interval(interval)
+        group = self.groups.get(interval)
+        if group is None:
+            group = self.groups[interval] = LiveGroup(self.store, interval)
+            group.start()
+        subscriber = LiveSubscriber(group)
+        subscriber.offer(group.snapshot())
+        group.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LiveSubscriber) -> None:
+        group = subscriber.group
+        group.subscribers.discard(subscriber)
+        if not group.subscribers and self.groups.get(group.interval) is group:
+            group.stop()
+            del self.groups[group.interval]
+
+    def close(self) -> None:
+        for group in self.groups.values():
+            group.stop()
+        self.groups.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "groups": {
+                str(interval): {
+                    "subscribers": len(group.subscribers),
+                    "seq": group.seq,
+                    "coalesced": sum(subscriber.coalesced for subscriber in group.subscribers),
+                }
+                for interval, group in self.groups.items()
+            }
+        }
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from common.latency import LatencyHistogram
+
+class LoadRun:
+    """
+    Request latency of one load test run, merged across its agents.
+
+    Agents send a histogram for every second of the run and one for the
+    whole run with their result. Seconds from all agents are merged per
+    wall-clock second as they arrive (at most ``max_seconds`` are kept);
+    whole-run histograms are kept per agent.
+    """
+
+    def __init__(self, max_seconds: int):
+        self.max_seconds = max_seconds
+        self.seconds: "OrderedDict[int, LatencyHistogram]" = OrderedDict()
+        self.totals: Dict[str, LatencyHistogram] = {}
+        self.agents: Set[str] = set()
+
+    def observe_second(self, agent_id: str, timestamp: float, histogram: Dict[str, Any]) -> None:
+        self.agents.add(agent_id)
+        second = int(timestamp)
+        merged = self.seconds.get(second)
+        if merged is None:
+            self.seconds[second] = LatencyHistogram.from_dict(histogram)
+            # Agents report in step, so new seconds almost always come last
+            if len(self.seconds) > 1 and second < next(reversed(self.seconds)):
+                self.seconds = OrderedDict(sorted(self.seconds.items()))
+            while len(self.seconds) > self.max_seconds:
+                self.seconds.popitem(last=False)
+        else:
+            merged.merge(LatencyHistogram.from_dict(histogram))
+
+    def observe_result(self, agent_id: str, histogram: Dict[str, Any]) -> None:
+        self.agents.add(agent_id)
+        self.totals[agent_id] = LatencyHistogram.from_dict(histogram)
+
+    def to_dict(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, Any]:
+        seconds = [
+            (second, histogram) for second, histogram in self.seconds.items()
+            if (start is None or second >= start) and (end is None or second < end)
+        ]
+        if start is None and end is None and self.totals and self.agents <= self.totals.keys():
+            # Once every agent has finished, their whole-run histograms also
+            # cover seconds that were dropped or lost
+            merged = LatencyHistogram.merged(self.totals.values())
+        else:
+            merged = LatencyHistogram.merged(histogram for _, histogram in seconds)
+        return {
+            "agents": sorted(self.agents),
+            "finished_agents": sorted(self.totals),
+            "latency": merged.summary(percentiles=(50, 90, 95, 99, 99.9)) if merged else {"count": 0},
+            "timeline": [{"timestamp": second, **histogram.summary()} for second, histogram in seconds],
+        }
+
+class LoadResults:
+    """Latency of the ``max_runs`` most recent load test runs, by execution or command id"""
+
+    def __init__(self, max_runs: int = 100, max_seconds: int = 3600):
+        self.max_runs = max_runs
+        self.max_seconds = max_seconds
+        self._runs: "OrderedDict[str, LoadRun]" = OrderedDict()
+
+    def _run(self, run_id: str) -> LoadRun:
+        run = self._runs.get(run_id)
+        if run is None:
+            run = self._runs[run_id] = LoadRun(self.max_seconds)
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        return run
+
+    def observe_second(self, run_id: str, agent_id: str, timestamp: float, histogram: Dict[str, Any]) -> None:
+        self._run(run_id).observe_second(agent_id, timestamp, histogram)
+
+    def observe_result(self, run_id: str, agent_id: str, histogram: Dict[str, Any]) -> None:
+        self._run(run_id).observe_result(agent_id, histogram)
+
+    def get(self, run_id: str, start: Optional[float] = None, end: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        run = self._runs.get(run_id)
+        return run.to_dict(start, end) if run else None
@@ -0,0 +1,140 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from common.output import STDERR, STDOUT, frame_data
+
+class StreamTail:
+    """The last ``max_bytes`` of one output stream, addressed by stream offset"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.data = bytearray()
+        self.end = 0
+        self.missing = 0
+
+    @property
+    def start(self) -> int:
+        return self.end - len(self.data)
+
+    def append(self, offset: int, data: bytes) -> None:
+        if offset > self.end:
+            # Frames were lost; the tail restarts after the hole
+            self.missing += offset - self.end
+            self.data.clear()
+            self.end = offset
+        elif offset < self.end:
+            # Overlaps what we already have (a redelivered frame)
+            data = data[self.end - offset:]
+        self.data += data
+        self.end += len(data)
+        if len(self.data) > self.max_bytes:
+            del self.data[:len(self.data) - self.max_bytes]
+
+    def read(self, offset: int = 0) -> Dict[str, Any]:
+        start = max(offset, self.start)
+        return {
+            "offset": start,
+            "end": self.end,
+            "truncated": start > offset,
+            "text": bytes(self.data[start - self.start:]).decode(errors="replace"),
+        }
+
+class CommandOutput:
+    """
+    One agent's output for one command, reassembled from its frames.
+
+    Frames are applied in ``seq`` order. Early ones wait in ``pending``;
+    when more than ``max_pending`` are waiting, the missing frame is taken
+    as lost and assembly skips ahead.
+    """
+
+    def __init__(self, tail_bytes: int, max_pending: int):
+        self.streams = {STDOUT: StreamTail(tail_bytes), STDERR: StreamTail(tail_bytes)}
+        self.max_pending = max_pending
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.next_seq = 0
+        self.lost_frames = 0
+        self.complete = False
+        self.execution_id: Optional[str] = None
+        self.updated = 0.0
+
+    def add(self, frame: Dict[str, Any]) -> None:
+        seq = frame["seq"]
+        if seq < self.next_seq or self.complete:
+            return
+        self.pending[seq] = frame
+        if len(self.pending) > self.max_pending:
+            first = min(self.pending)
+            self.lost_frames += first - self.next_seq
+            self.next_seq = first
+        while self.next_seq in self.pending:
+            self._apply(self.pending.pop(self.next_seq))
+            self.next_seq += 1
+
+    def _apply(self, frame: Dict[str, Any]) -> None:
+        stream = self.streams.get(frame.get("stream"))
+        data = frame_data(frame)
+        if stream is not None and data:
+            stream.append(frame.get("offset", stream.end), data)
+        if frame.get("eof"):
+            self.complete = True
+            self.pending.clear()
+
+    def to_dict(self, offset: int = 0) -> Dict[str, Any]:
+        result = {
+            "execution_id": self.execution_id,
+            "complete": self.complete,
+            "lost_frames": self.lost_frames,
+            "updated": self.updated,
+        }
+        for name, stream in self.streams.items():
+            result[name] = stream.read(offset)
+            result[name]["missing_bytes"] = stream.missing
+        return result
+
+class OutputIndex:
+    """
+    Live command output from agents, keyed by command and agent.
+
+    Keeps the last ``tail_bytes`` of each stream for the ``max_commands``
+    most recently active commands, so memory is bounded however long the
+    commands run or how much they print.
+    """
+
+    def __init__(self, max_commands: int = 200, tail_bytes: int = 1024 * 1024, max_pending: int = 256,
+                 clock: Callable[[], float] = time.time):
+        self.max_commands = max_commands
+        self.tail_bytes = tail_bytes
+        self.max_pending = max_pending
+        self.clock = clock
+        self._commands: "OrderedDict[str, Dict[str, CommandOutput]]" = OrderedDict()
+
+    def add(self, frame: Dict[str, Any]) -> None:
+        command_id, agent_id = frame["command_id"], frame["agent_id"]
+        agents = self._commands.get(command_id)
+        if agents is None:
+            agents = self._commands[command_id] = {}
+            while len(self._commands) > self.max_commands:
+                self._commands.popitem(last=False)
+        else:
+            self._commands.move_to_end(command_id)
+
+        output = agents.get(agent_id)
+        if output is None:
+            output = agents[agent_id] = CommandOutput(self.tail_bytes, self.max_pending)
+        output.execution_id = frame.get("execution_id")
+        output.updated = self.clock()
+        output.add(frame)
+
+    def get(self, command_id: str, agent_id: Optional[str] = None,
+            offset: int = 0) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Each agent's output from ``offset`` on (as far as the tail goes); None for an unknown command"""
+        agents = self._commands.get(command_id)
+        if agents is None:
+            return None
+        return {
+            agent: output.to_dict(offset)
+            for agent, output in agents.items()
+            if agent_id is None or agent == agent_id
+        }
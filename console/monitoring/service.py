@@ -1,24 +1,152 @@
-from typing import List, Dict, Any, Optional
+from typing import Awaitable, Callable, List, Dict, Any, Iterable, Optional, Set
+import asyncio
 import logging
-import json
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+import time
 
-from console.messaging.service import MessagingService
+from console.messaging.service import MessagingService, get_messaging_service
+from console.monitoring.alerts import ALERT_FIRING, DEFAULT_RULES, AlertEngine, AlertRule
+from console.monitoring.executions import ExecutionIndex, fleet_series, sample_interval
+from console.monitoring.fleet import DEFAULT_PERCENTILES, fleet_frame, json_values
+from console.monitoring.live import LiveMetricsHub
+from console.monitoring.load import LoadResults
+from console.monitoring.output import OutputIndex
+from console.monitoring.snapshot import SnapshotWriter, export_agent, remove_stale_temp_files, restore_snapshot
+from console.monitoring.store import COLUMN_SEPARATOR, MetricsStore
+from console.monitoring.writer import TimeSeriesWriter
 
 logger = logging.getLogger(__name__)
 
+# Agents publish each second of a load test here, as a ``load`` metric
+LOAD_METRICS_PREFIX = "metrics.load."
+LOAD_COLUMN_PREFIX = "load" + COLUMN_SEPARATOR
+
 class MonitoringService:
-    def __init__(self, db: Session, influxdb_client=None, messaging_service: Optional[MessagingService] = None):
-        self.db = db
-        self.influxdb = influxdb_client
-        self.messaging_service = messaging_service or MessagingService()
-        self.metrics_buffer = {}
-        self._setup_metrics_handler()
+    """
+    Metrics ingestion for the console.
+
+    One instance lives for the whole app: it owns the metrics consumer and
+    the in-memory store, and routes only read from it. Handlers run on the
+    event loop, so the store needs no locking. With a writer, every sample
+    is also queued for the time-series database. Agent status and result
+    messages feed an index of which agents ran each execution and when.
+    Stored samples are pushed to live dashboards through ``live``. With a
+    ``snapshot_path``, the store is restored from it on start and saved to
+    it every ``snapshot_interval`` seconds and on stop. Every sample is
+    checked against ``alert_rules``; alerts are published on the status
+    topic, and with an ``abort_execution`` handler an aborting rule stops
+    the execution the agent is running. Command output streamed by agents
+    is reassembled in ``output``, and load test latency histograms are
+    merged across agents in ``load``. Load tests' per-second stats are kept
+    apart from the system samples, in ``load_store``, so the two never
+    interleave in one series. Agent ids are per process, so an agent that
+    has not reported for ``agent_idle_seconds`` is dropped from the stores,
+    the alert engine and the live groups; the check runs every
+    ``eviction_interval`` seconds as samples arrive.
+    """
+
+    def __init__(self, messaging_service: Optional[MessagingService] = None,
+                 writer: Optional[TimeSeriesWriter] = None,
+                 retention_seconds: float = 3600.0, capacity: int = 3600,
+                 live_min_interval: float = 0.25,
+                 snapshot_path: Optional[str] = None, snapshot_interval: float = 60.0,
+                 alert_rules: Iterable[AlertRule] = DEFAULT_RULES,
+                 abort_execution: Optional[Callable[[str, str], Awaitable[Any]]] = None,
+                 agent_idle_seconds: float = 86400.0, eviction_interval: float = 60.0):
+        self.writer = writer
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._messaging_service = messaging_service
+        self.store = MetricsStore(capacity=capacity, retention_seconds=retention_seconds)
+        self.load_store = MetricsStore(capacity=capacity, retention_seconds=retention_seconds)
+        self.executions = ExecutionIndex()
+        self.live = LiveMetricsHub(self.store, min_interval=live_min_interval)
+        self.alerts = AlertEngine(alert_rules)
+        self.output = OutputIndex()
+        self.load = LoadResults()
+        self.abort_execution = abort_execution
+        self._aborted: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.agent_idle_seconds = agent_idle_seconds
+        self.eviction_interval = eviction_interval
+        self._next_eviction = time.time() + eviction_interval
+        self.started = False
+    
+    @property
+    def messaging_service(self) -> MessagingService:
+        """Messaging service passed in, or the console's shared one"""
+        return self._messaging_service or get_messaging_service()
+    
+    async def start(self) -> None:
+        """Start consuming metrics, agent status and command output; calling it again does nothing"""
+        if self.started:
+            return
+        if self.snapshot_path:
+            remove_stale_temp_files(self.snapshot_path)
+            self.restore()
+        await self.messaging_service.register_metrics_handler(self._handle_metrics)
+        await self.messaging_service.register_status_handler(self._handle_status)
+        await self.messaging_service.register_output_handler(self._handle_output)
+        if self.snapshot_path and self.snapshot_interval > 0:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        self.started = True
+        logger.info("Monitoring service started")
+    
+    async def stop(self) -> None:
+        """Stop live streams, save a last snapshot, then flush and stop the time-series writer"""
+        self.live.close()
+        if self._snapshot_task:
+            # Let a periodic snapshot in progress clean up before the final one
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        if self.snapshot_path:
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error(f"Failed to snapshot metrics on shutdown: {e}")
+        if self.writer:
+            self.writer.close()
+    
+    def restore(self) -> int:
+        """Load the store from the snapshot file, if there is a usable one"""
+        started = time.perf_counter()
+        try:
+            agents = restore_snapshot(self.store, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"Could not restore metrics snapshot {self.snapshot_path}: {e}")
+            return 0
+        if agents:
+            logger.info(f"Restored metrics of {agents} agents in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return agents
+    
+    async def snapshot(self) -> int:
+        """
+        Save the store to the snapshot file; returns its size in bytes.
+        
+        Each agent is copied on the event loop (the store's only thread) and
+        written from a worker thread, so ingestion keeps running meanwhile.
+        """
+        writer = await asyncio.to_thread(SnapshotWriter, self.snapshot_path)
+        try:
+            for agent_id in self.store.agents():
+                await asyncio.to_thread(writer.add, agent_id, *export_agent(self.store, agent_id))
+            return await asyncio.to_thread(writer.finish)
+        except BaseException:
+            writer.abort()
+            raise
     
-    def _setup_metrics_handler(self):
-        """Set up handler for incoming metrics"""
-        self.messaging_service.register_metrics_handler(self._handle_metrics)
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                size = await self.snapshot()
+                logger.debug(f"Wrote {size} byte metrics snapshot")
+            except Exception as e:
+                logger.error(f"Failed to snapshot metrics: {e}")
     
     def _handle_metrics(self, routing_key: str, metric_data: Dict[str, Any]):
         """Process incoming metrics messages"""
@@ -31,57 +159,283 @@ class MonitoringService:
                 logger.warning(f"Received invalid metrics message: {metric_data}")
                 return
             
-            # Store in InfluxDB if available
-            if self.influxdb:
-                self._store_in_influxdb(agent_id, timestamp, metrics)
+            # A second of a load test: merge its latency with the other agents'.
+            # The histogram itself is not a metric column
+            load = metrics.get('load')
+            if type(load) is dict and 'latency_histogram' in load:
+                load = dict(load)
+                histogram = load.pop('latency_histogram')
+                metrics = {**metrics, 'load': load}
+                run_id = metric_data.get('execution_id') or metric_data.get('command_id')
+                if run_id:
+                    self.load.observe_second(run_id, agent_id, timestamp, histogram)
+            
+            if routing_key.startswith(LOAD_METRICS_PREFIX):
+                # Its own series: the live view, alerts and fleet queries
+                # read the system samples, which carry no load columns
+                if self.writer:
+                    self.writer.submit(agent_id, timestamp, metrics)
+                self.load_store.append(agent_id, timestamp, metrics)
+                return
             
-            # Add to in-memory buffer
-            if agent_id not in self.metrics_buffer:
-                self.metrics_buffer[agent_id] = []
+            # Queue for the time-series database; encoding and writes happen
+            # on the writer's thread
+            if self.writer:
+                self.writer.submit(agent_id, timestamp, metrics)
             
-            self.metrics_buffer[agent_id].append({
-                'timestamp': timestamp,
-                'metrics': metrics
-            })
+            # Add to the in-memory store; old samples are evicted as it goes
+            if self.store.append(agent_id, timestamp, metrics):
+                self.live.mark(agent_id)
+                alerts = self.alerts.observe(agent_id, timestamp, metrics)
+                if alerts:
+                    self._dispatch_alerts(alerts)
             
-            # Keep only recent metrics in memory
-            self._prune_metrics_buffer()
+            now = time.time()
+            if now >= self._next_eviction:
+                self._next_eviction = now + self.eviction_interval
+                self.evict_idle_agents(now)
             
         except Exception as e:
             logger.error(f"Error handling metrics: {e}")
     
-    def _store_in_influxdb(self, agent_id: str, timestamp: float, metrics: Dict[str, Any]):
-        """Store metrics in InfluxDB"""
-        # Implementation will depend on InfluxDB client
-        pass
+    def evict_idle_agents(self, now: Optional[float] = None) -> List[str]:
+        """Forget agents that have not reported for agent_idle_seconds; returns their ids"""
+        cutoff = (now if now is not None else time.time()) - self.agent_idle_seconds
+        idle = self.store.idle_agents(cutoff)
+        self.store.evict(idle)
+        self.load_store.evict(self.load_store.idle_agents(cutoff))
+        self.alerts.forget(idle)
+        self.live.forget(idle)
+        if idle:
+            logger.info(f"Evicted {len(idle)} agents idle for over {self.agent_idle_seconds:g}s")
+        return idle
+    
+    def _spawn(self, coro: Awaitable[Any]) -> None:
+        """Run a coroutine in the background from a (synchronous) handler on the event loop"""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    def _dispatch_alerts(self, alerts: List[Dict[str, Any]]) -> None:
+        """Publish alerts and abort executions that a saturated agent invalidates"""
+        # Raises outside the event loop, before any coroutine is created
+        asyncio.get_running_loop()
+        for alert in alerts:
+            execution_id = self.executions.active_execution(alert['agent_id'])
+            alert['execution_id'] = execution_id
+            logger.warning(f"Alert {alert['rule']} {alert['state']} on {alert['agent_id']}: "
+                           f"{alert['condition']} (value {alert['value']:.3g})")
+            self._spawn(self.messaging_service.publish_alert(alert))
+            
+            if (alert['state'] == ALERT_FIRING and alert['abort'] and execution_id
+                    and self.abort_execution and execution_id not in self._aborted):
+                self._aborted.add(execution_id)
+                reason = f"{alert['rule']} on agent {alert['agent_id']}: {alert['condition']}"
+                logger.error(f"Aborting execution {execution_id}: {reason}")
+                self._spawn(self.abort_execution(execution_id, reason))
     
-    def _prune_metrics_buffer(self):
-        """Remove old metrics from the buffer to prevent memory issues"""
-        # Keep only metrics from the last hour
-        cutoff_time = datetime.now() - timedelta(hours=1)
-        cutoff_timestamp = cutoff_time.timestamp()
+    def get_alerts(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Alerts firing now and the most recent alert events, newest first"""
+        return {
+            'active': list(self.alerts.active.values()),
+            'recent': list(reversed(self.alerts.recent)),
+        }
+    
+    def _handle_status(self, routing_key: str, message: Dict[str, Any]):
+        """Record when agents start and finish executions"""
+        try:
+            agent_id = message.get('agent_id')
+            if not agent_id:
+                return
+            
+            if routing_key.endswith(".result"):
+                # The command's final result ends the agent's part in the run
+                execution_id = message.get('execution_id')
+                if execution_id:
+                    self.executions.agent_finished(execution_id, agent_id, message.get('timestamp') or time.time())
+                histogram = (message.get('result') or {}).get('latency_histogram')
+                if histogram:
+                    self.load.observe_result(execution_id or message.get('command_id'), agent_id, histogram)
+                return
+            
+            details = message.get('details') or {}
+            execution_id = details.get('execution_id')
+            if not execution_id:
+                return
+            if details.get('executing'):
+                self.executions.agent_started(execution_id, agent_id, details.get('start_time') or message.get('timestamp'))
+            elif details.get('execution_status') not in (None, "started"):
+                # The command did not start, so the agent is done with the run
+                self.executions.agent_finished(execution_id, agent_id, message.get('timestamp') or time.time())
+            
+        except Exception as e:
+            logger.error(f"Error handling status: {e}")
+    
+    def _handle_output(self, routing_key: str, frame: Dict[str, Any]):
+        """Add a frame of command output to its command's output"""
+        try:
+            self.output.add(frame)
+        except Exception as e:
+            logger.error(f"Error handling command output: {e}")
+    
+    def get_command_output(self, command_id: str, agent_id: Optional[str] = None,
+                           offset: int = 0) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Output of a command per agent, from stream offset ``offset`` on; None if none arrived"""
+        return self.output.get(command_id, agent_id, offset)
+    
+    def get_load_latency(self, run_id: str, start: Optional[float] = None,
+                         end: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Request latency of a load test across all its agents, by execution
+        id (or command id for a direct load command); None if unknown.
+        With ``start``/``end``, only the seconds in [start, end) are merged.
+        """
+        return self.load.get(run_id, start, end)
+    
+    def track_execution(self, execution_id: str, agent_ids: Optional[List[str]], start_time: float,
+                        duration: Optional[float] = None) -> None:
+        """Register a dispatched execution; without agent ids, members are learned as they start"""
+        self.executions.track(execution_id, agent_ids, start_time, duration)
+    
+    def finish_execution(self, execution_id: str, timestamp: Optional[float] = None) -> None:
+        """Close an execution's window, e.g. when it is aborted"""
+        self.executions.finish(execution_id, timestamp or time.time())
+    
+    def _store_for(self, column: str) -> MetricsStore:
+        """The store holding a metric column: load test columns have their own"""
+        return self.load_store if column.startswith(LOAD_COLUMN_PREFIX) else self.store
+    
+    def get_agent_metrics(self, agent_id, lookback_minutes=5, max_points: Optional[int] = None,
+                          load: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get recent metrics for an agent; its load test stats with ``load``.
+        
+        Raw samples are returned while they cover the lookback and fit in
+        ``max_points``; otherwise the finest rollup tier that does, whose
+        entries carry an ``interval`` and per-metric summary statistics.
+        """
+        store = self.load_store if load else self.store
+        since = time.time() - lookback_minutes * 60
+        tier = store.select_tier(agent_id, since, max_points=max_points)
+        if tier is None:
+            return store.entries(agent_id, since)
+        return store.rollup_entries(tier, since)
+    
+    def get_live_metrics(self, lookback_minutes=1) -> Dict[str, Dict[str, Any]]:
+        """Most recent metrics of every agent that reported within the lookback"""
+        cutoff = time.time() - lookback_minutes * 60
+        result = {}
+        for agent_id in self.store.agents():
+            latest = self.store.latest(agent_id)
+            if latest and latest['timestamp'] > cutoff:
+                result[agent_id] = latest
+        return result
+    
+    def get_execution_metrics(self, execution_id: str, max_points: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Metrics of every agent in an execution over its own window, plus a
+        fleet aggregate over the whole execution. None for an unknown
+        execution.
         
-        for agent_id in self.metrics_buffer:
-            self.metrics_buffer[agent_id] = [
-                entry for entry in self.metrics_buffer[agent_id]
-                if entry['timestamp'] > cutoff_timestamp
-            ]
-    
-    def get_agent_metrics(self, agent_id, lookback_minutes=5):
-        """Get recent metrics for an agent"""
-        now = datetime.now()
-        cutoff = now - timedelta(minutes=lookback_minutes)
+        Per-agent series are columnar ({'timestamps', 'interval',
+        'metrics': {column: values}}), at the resolution ``max_points``
+        allows; the fleet series uses a grid of at most ``max_points``
+        steps, no finer than the sparsest agent series.
+        """
+        record = self.executions.get(execution_id)
+        if record is None:
+            return None
         
-        if agent_id not in self.metrics_buffer:
-            return []
+        now = time.time()
+        start, end = record.window(now)
+        series = {}
+        agents = {}
+        step = 1.0
+        for agent_id in record.agents:
+            agent_start, agent_end = record.agent_window(agent_id, now)
+            timestamps, columns, interval = self.store.resolved(agent_id, agent_start, agent_end, max_points)
+            series[agent_id] = (timestamps, columns)
+            # Agents report every few seconds; a finer fleet grid would leave gaps
+            step = max(step, interval or sample_interval(timestamps))
+            agents[agent_id] = {
+                'start': agent_start,
+                'end': agent_end,
+                'interval': interval,
+                'timestamps': timestamps.tolist(),
+                'metrics': {name: json_values(values) for name, values in columns.items()},
+            }
+            if agent_id in self.load_store.series:
+                load_timestamps, load_columns, load_interval = self.load_store.resolved(
+                    agent_id, agent_start, agent_end, max_points
+                )
+                agents[agent_id]['load'] = {
+                    'interval': load_interval,
+                    'timestamps': load_timestamps.tolist(),
+                    'metrics': {name: json_values(values) for name, values in load_columns.items()},
+                }
         
-        return [
-            m for m in self.metrics_buffer[agent_id]
-            if datetime.fromtimestamp(m['timestamp']) > cutoff
-        ]
-    
-    def get_execution_metrics(self, execution_id):
-        """Get metrics for a specific test execution"""
-        # Implementation depends on how we tag test-specific metrics
-        # This is a placeholder
-        return []
\ No newline at end of file
+        if max_points:
+            step = max(step, (end - start) / max_points)
+        return {
+            'execution_id': execution_id,
+            'start': start,
+            'end': end,
+            'agents': agents,
+            'fleet': fleet_series(series, start, end, step),
+        }
+
+    def query_fleet(self, column: str, start: Optional[float] = None, end: Optional[float] = None,
+                    step: float = 10.0, execution_id: Optional[str] = None,
+                    percentiles=DEFAULT_PERCENTILES, bins: Optional[int] = None, top: Optional[int] = None,
+                    top_by: str = "mean", labels: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fleet aggregates of one metric column per ``step``-second bucket.
+        
+        Covers an execution's window and agents, or [start, end) for every
+        agent (by default the last 5 minutes); None for an unknown
+        execution. Always returns per-bucket statistics across agents; adds
+        a value histogram per bucket with ``bins``, the hottest agents with
+        ``top`` and per-group statistics with ``labels`` (agent id -> group).
+        """
+        now = time.time()
+        if execution_id:
+            record = self.executions.get(execution_id)
+            if record is None:
+                return None
+            start, end = record.window(now)
+            agent_ids = list(record.agents)
+        else:
+            end = end if end is not None else now
+            start = start if start is not None else end - 300
+            agent_ids = self.store.agents()
+        
+        frame = fleet_frame(self._store_for(column), column, agent_ids, start, end, step)
+        result = {
+            'column': column,
+            'start': start,
+            'end': end,
+            'step': step,
+            'agents': len(agent_ids),
+            'timestamps': frame.timestamps.tolist(),
+            'stats': {name: json_values(values) for name, values in frame.stats(percentiles).items()},
+        }
+        if bins:
+            edges, counts = frame.histogram(bins)
+            result['histogram'] = {'edges': edges.tolist(), 'counts': counts.tolist()}
+        if top:
+            result['top'] = [{'agent_id': agent_id, 'value': value} for agent_id, value in frame.top(top, top_by)]
+        if labels is not None:
+            result['groups'] = {
+                group: {name: json_values(values) for name, values in stats.items()}
+                for group, stats in frame.group_by(labels, percentiles).items()
+            }
+        return result
+
+# Shared instance, started when the console starts
+monitoring_service: Optional[MonitoringService] = None
+
+def get_monitoring_service() -> MonitoringService:
+    """Return the console's monitoring service"""
+    if monitoring_service is None:
+        raise RuntimeError("Monitoring service is not running")
+    return monitoring_service
@@ -0,0 +1,190 @@
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from console.monitoring.store import AgentSeries, MetricsStore, RollupTier
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, arrays (each series 64-byte aligned: timestamps, then
+# its columns back to back), JSON header, header length (u64 LE), MAGIC
+MAGIC = b"DOCMSNP1"
+ALIGNMENT = 64
+FOOTER = struct.Struct("<Q")
+VERSION = 1
+
+# An exported series: ordered timestamps and {column key: values}
+Export = Tuple[np.ndarray, Dict[Any, np.ndarray]]
+
+def export_agent(store: MetricsStore, agent_id: str) -> Tuple[Export, List[Tuple[float, int, Optional[float], Export]]]:
+    """Copies of an agent's raw samples and rollup tiers, taken on the store's thread"""
+    tiers = [
+        (tier.interval, tier.capacity, tier.open_bucket, tier.buckets.export())
+        for tier in store.tiers.get(agent_id, [])
+    ]
+    return store.series[agent_id].export(), tiers
+
+class SnapshotWriter:
+    """
+    Writes a store snapshot one agent at a time.
+
+    Only the samples held are written (not the rings' spare capacity), raw
+    columns as float64 and rollups as float32. Each writer has its own
+    temporary file next to the target, renamed over it in ``finish``, so a
+    crash never leaves a partial snapshot behind and concurrent writers
+    can't interfere. ``abort`` waits for an ``add`` still running in another
+    thread before removing the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self._lock = threading.Lock()
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        self.agents: Dict[str, Any] = {}
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._offset += len(data)
+
+    def _series(self, export: Export, dtype) -> Dict[str, Any]:
+        timestamps, columns = export
+        self._write(b"\0" * (-self._offset % ALIGNMENT))
+        entry = {"offset": self._offset, "count": int(timestamps.size), "columns": []}
+        self._write(np.ascontiguousarray(timestamps, dtype=np.float64).tobytes())
+        for key, values in columns.items():
+            entry["columns"].append(list(key) if isinstance(key, tuple) else key)
+            self._write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        return entry
+
+    def add(self, agent_id: str, raw: Export, tiers: List[Tuple[float, int, Optional[float], Export]]) -> None:
+        with self._lock:
+            self._add(agent_id, raw, tiers)
+
+    def _add(self, agent_id: str, raw: Export, tiers: List[Tuple[float, int, Optional[float], Export]]) -> None:
+        self.agents[agent_id] = {
+            "raw": self._series(raw, np.float64),
+            "tiers": [
+                {"interval": interval, "capacity": capacity, "open_bucket": open_bucket,
+                 "buckets": self._series(buckets, np.float32)}
+                for interval, capacity, open_bucket, buckets in tiers
+            ],
+        }
+
+    def finish(self, created: Optional[float] = None) -> int:
+        """Write the header and move the file into place; returns its size in bytes"""
+        with self._lock:
+            return self._finish(created)
+
+    def _finish(self, created: Optional[float]) -> int:
+        header = json.dumps({
+            "version": VERSION,
+            "created": created if created is not None else time.time(),
+            "agents": self.agents,
+        }, separators=(",", ":")).encode()
+        self._write(header)
+        self._write(FOOTER.pack(len(header)))
+        self._write(MAGIC)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self._offset
+
+    def abort(self) -> None:
+        with self._lock:
+            self._file.close()
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+def remove_stale_temp_files(path: str) -> int:
+    """Delete temporary files left next to a snapshot by writers that crashed; returns how many"""
+    removed = 0
+    for tmp_path in glob.glob(f"{glob.escape(path)}.*.tmp"):
+        try:
+            os.remove(tmp_path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Could not remove stale snapshot file {tmp_path}: {e}")
+    return removed
+
+def write_snapshot(store: MetricsStore, path: str) -> int:
+    """Snapshot a whole store in one go; returns the file size"""
+    writer = SnapshotWriter(path)
+    try:
+        for agent_id in store.agents():
+            writer.add(agent_id, *export_agent(store, agent_id))
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+def _series_view(data: mmap.mmap, entry: Dict[str, Any], dtype) -> Export:
+    """Views into the mapped file for one series; nothing is read until accessed"""
+    count, offset = entry["count"], entry["offset"]
+    timestamps = np.frombuffer(data, np.float64, count, offset)
+    keys = [tuple(key) if isinstance(key, list) else key for key in entry["columns"]]
+    # The columns are back to back: one buffer view, one row per column
+    matrix = np.frombuffer(data, dtype, count * len(keys), offset + count * 8).reshape(len(keys), count)
+    return timestamps, dict(zip(keys, matrix))
+
+def read_header(data: mmap.mmap) -> Dict[str, Any]:
+    if data[:len(MAGIC)] != MAGIC or data[-len(MAGIC):] != MAGIC:
+        raise ValueError("Not a metrics snapshot")
+    end = len(data) - len(MAGIC) - FOOTER.size
+    (length,) = FOOTER.unpack(data[end:end + FOOTER.size])
+    header = json.loads(data[end - length:end])
+    if header.get("version") != VERSION:
+        raise ValueError(f"Unsupported snapshot version {header.get('version')}")
+    return header
+
+def restore_snapshot(store: MetricsStore, path: str, now: Optional[float] = None) -> int:
+    """
+    Load a snapshot into an empty store; returns the number of agents restored.
+
+    The file is memory-mapped copy-on-write and the series adopt views of it,
+    so restoring costs little more than parsing the header; pages are read
+    as they are touched and copied only when written. Snapshots older than
+    anything the store would still hold are ignored, as are rollup tiers the
+    store is no longer configured with.
+    """
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return 0
+    with open(path, "rb") as f:
+        # Copy-on-write: the restored rings can be written without touching the file
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header = read_header(data)
+
+    age = (now if now is not None else time.time()) - header["created"]
+    if age > store.longest_retention:
+        logger.info(f"Ignoring metrics snapshot {path}, {age:.0f}s old")
+        return 0
+
+    for agent_id, entry in header["agents"].items():
+        store.series[agent_id] = AgentSeries.adopt(store.capacity, *_series_view(data, entry["raw"], np.float64))
+        saved = {(float(tier["interval"]), int(tier["capacity"])): tier for tier in entry["tiers"]}
+        tiers = []
+        for interval, capacity in store.rollups:
+            tier = RollupTier(interval, capacity)
+            tier_entry = saved.get((float(interval), int(capacity)))
+            if tier_entry:
+                tier.buckets = AgentSeries.adopt(capacity, *_series_view(data, tier_entry["buckets"], np.float32),
+                                                 dtype=np.float32)
+                tier.open_bucket = tier_entry["open_bucket"]
+            tiers.append(tier)
+        store.tiers[agent_id] = tiers
+    return len(header["agents"])
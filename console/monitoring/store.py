@@ -0,0 +1,465 @@
+import logging
+import warnings
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Joins nested metric names into column names ("network/bytes_sent"); topic
+# names in the messaging summary contain dots, so dots cannot be used
+COLUMN_SEPARATOR = "/"
+
+def flatten_metrics(metrics: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of a nested metrics dict, keyed by column name"""
+    flat: Dict[str, float] = {}
+    # Iterative with exact type checks: this runs for every incoming sample
+    stack = [(prefix, metrics)]
+    while stack:
+        prefix, node = stack.pop()
+        for name, value in node.items():
+            kind = type(value)
+            if kind is float or kind is int or kind is bool:
+                # Sync flags become 0.0/1.0 in the float64 columns
+                flat[prefix + name] = value
+            elif kind is dict:
+                stack.append((prefix + name + COLUMN_SEPARATOR, value))
+    return flat
+
+def unflatten_metrics(flat: Dict[str, float]) -> Dict[str, Any]:
+    """Inverse of flatten_metrics; NaN (no value in that sample) is left out"""
+    metrics: Dict[str, Any] = {}
+    for column, value in flat.items():
+        if value != value:
+            continue
+        *parents, name = column.split(COLUMN_SEPARATOR)
+        node = metrics
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = value
+    return metrics
+
+class AgentSeries:
+    """
+    Fixed-capacity columnar ring buffer of one agent's samples.
+
+    Timestamps and each metric live in their own array, so an append is a
+    handful of index writes. Arrays start small and double until they reach
+    ``capacity``, after which the oldest sample is overwritten. Samples are
+    kept in timestamp order (late samples are dropped), which lets
+    time-range lookups binary search the ring instead of scanning it. A
+    column that first appears mid-stream reads NaN for earlier samples.
+    """
+
+    INITIAL_SIZE = 64
+
+    def __init__(self, capacity: int, dtype=np.float64):
+        self.capacity = capacity
+        self.dtype = dtype
+        self._size = min(capacity, self.INITIAL_SIZE)
+        self.timestamps = np.zeros(self._size, dtype=np.float64)
+        self.columns: Dict[str, np.ndarray] = {}
+        self._start = 0
+        self._count = 0
+        self._last: Optional[float] = None
+        self.dropped = 0
+
+    @classmethod
+    def adopt(cls, capacity: int, timestamps: np.ndarray, columns: Dict[Any, np.ndarray],
+              dtype=np.float64) -> "AgentSeries":
+        """
+        A series over existing arrays of ordered samples, without copying.
+
+        Used to restore from memory-mapped snapshots: the arrays become the
+        ring itself and are only copied when the series grows.
+        """
+        series = cls(capacity, dtype)
+        count = min(len(timestamps), capacity)
+        if count < len(timestamps):
+            timestamps = timestamps[-count:]
+            columns = {name: column[-count:] for name, column in columns.items()}
+        if count:
+            series.timestamps = timestamps
+            series.columns = dict(columns)
+            series._size = count
+            series._count = count
+            series._last = float(series.timestamps[-1])
+        return series
+
+    def export(self) -> Tuple[np.ndarray, Dict[Any, np.ndarray]]:
+        """Copies of all samples, oldest first"""
+        return self._slice(0, self._count, None)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        return self._last if self._count else None
+
+    def _column(self, name: str) -> np.ndarray:
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = np.full(self._size, np.nan, dtype=self.dtype)
+        return column
+
+    def _grow(self) -> None:
+        """Double the arrays (up to capacity), moving the samples to the front"""
+        size = min(self.capacity, self._size * 2)
+        order = np.arange(self._start, self._start + self._count) % self._size
+
+        timestamps = np.zeros(size, dtype=np.float64)
+        timestamps[:self._count] = self.timestamps[order]
+        self.timestamps = timestamps
+        for name, column in self.columns.items():
+            grown = np.full(size, np.nan, dtype=self.dtype)
+            grown[:self._count] = column[order]
+            self.columns[name] = grown
+
+        self._size = size
+        self._start = 0
+
+    def append(self, timestamp: float, values: Dict[str, float]) -> bool:
+        """Add a sample, overwriting the oldest when full; False if it is out of order"""
+        last = self.last_timestamp
+        if last is not None and timestamp < last:
+            self.dropped += 1
+            return False
+
+        if self._count == self._size and self._size < self.capacity:
+            self._grow()
+
+        if self._count == self._size:
+            index = self._start
+            self._start = (self._start + 1) % self._size
+        else:
+            index = (self._start + self._count) % self._size
+            self._count += 1
+
+        self.timestamps[index] = timestamp
+        self._last = timestamp
+        for name, column in self.columns.items():
+            column[index] = values.get(name, np.nan)
+        for name in values.keys() - self.columns.keys():
+            self._column(name)[index] = values[name]
+        return True
+
+    def _segments(self) -> List[Tuple[int, int]]:
+        """The ring's contents as (start, stop) slices of the arrays, oldest first"""
+        end = self._start + self._count
+        if end <= self._size:
+            return [(self._start, end)]
+        return [(self._start, self._size), (0, end - self._size)]
+
+    def _position(self, timestamp: float, side: str) -> int:
+        """Logical index of a timestamp, as np.searchsorted over the samples in order"""
+        offset = 0
+        for start, stop in self._segments():
+            segment = self.timestamps[start:stop]
+            if segment.size and (side == "left" and segment[-1] >= timestamp
+                                 or side == "right" and segment[-1] > timestamp):
+                return offset + int(np.searchsorted(segment, timestamp, side=side))
+            offset += stop - start
+        return offset
+
+    def evict_before(self, cutoff: float) -> int:
+        """Drop samples older than cutoff from the front; returns how many"""
+        if not self._count or self.timestamps[self._start] >= cutoff:
+            return 0
+        evicted = self._position(cutoff, "left")
+        self._start = (self._start + evicted) % self._size
+        self._count -= evicted
+        return evicted
+
+    def _take(self, array: np.ndarray, first: int, last: int) -> np.ndarray:
+        """Copy of logical samples [first, last) of an array"""
+        start = (self._start + first) % self._size
+        stop = start + (last - first)
+        if stop <= self._size:
+            return array[start:stop].copy()
+        return np.concatenate((array[start:], array[:stop - self._size]))
+
+    def _bounds(self, since: float, until: Optional[float]) -> Tuple[int, int]:
+        first = self._position(since, "right")
+        last = self._count if until is None else self._position(until, "right")
+        return first, max(first, last)
+
+    def count(self, since: float, until: Optional[float] = None) -> int:
+        """Number of samples with since < timestamp <= until"""
+        first, last = self._bounds(since, until)
+        return last - first
+
+    def _slice(self, first: int, last: int,
+               columns: Optional[Iterable[str]]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        names = self.columns.keys() if columns is None else [c for c in columns if c in self.columns]
+        return (
+            self._take(self.timestamps, first, last),
+            {name: self._take(self.columns[name], first, last) for name in names}
+        )
+
+    def range(self, since: float, until: Optional[float] = None,
+              columns: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Timestamps and column values of samples with since < timestamp <= until"""
+        first, last = self._bounds(since, until)
+        return self._slice(first, last, columns)
+
+    def window(self, start: float, end: float) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Timestamps and column values of samples with start <= timestamp < end"""
+        first = self._position(start, "left")
+        last = max(first, self._position(end, "left"))
+        return self._slice(first, last, None)
+
+    def latest(self) -> Optional[Tuple[float, Dict[str, float]]]:
+        """The newest sample"""
+        if not self._count:
+            return None
+        index = (self._start + self._count - 1) % self._size
+        return float(self.timestamps[index]), {name: float(column[index]) for name, column in self.columns.items()}
+
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(column.nbytes for column in self.columns.values())
+
+# Summary statistics kept per column for every rollup bucket
+ROLLUP_STATS = ("count", "min", "max", "mean", "p50", "p95", "p99")
+_PERCENTILES = (50, 95, 99)
+
+def _row_percentiles(matrix: np.ndarray, counts: np.ndarray,
+                     percentiles: Iterable[float] = _PERCENTILES) -> Dict[str, np.ndarray]:
+    """
+    Linearly interpolated percentiles of each row, ignoring NaN.
+
+    Same result as np.nanpercentile(..., axis=1), which falls back to a
+    Python-level loop per row and dominated the cost of closing a bucket.
+    """
+    ordered = np.sort(matrix, axis=1)  # NaN sorts last
+    last = np.maximum(counts - 1, 0)
+    rows = np.arange(ordered.shape[0])
+    result = {}
+    for pct in percentiles:
+        position = last * (pct / 100.0)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.ceil(position).astype(np.intp)
+        low = ordered[rows, lower]
+        high = ordered[rows, upper]
+        values = low + (high - low) * (position - lower)
+        values[counts == 0] = np.nan
+        result[f"p{pct:g}"] = values
+    return result
+
+class RollupTier:
+    """
+    Fixed-interval summaries of one agent's raw samples.
+
+    Each bucket is summarized once, when the first sample of a later bucket
+    arrives, from the raw samples it covers: count, min, max and mean per
+    column plus percentiles over the bucket's samples. A bucket is
+    timestamped with its start; the bucket still filling is not visible.
+    Summaries are stored as float32 in one ring keyed by (column, stat).
+    """
+
+    def __init__(self, interval: float, capacity: int):
+        self.interval = interval
+        self.capacity = capacity
+        self.buckets = AgentSeries(capacity, dtype=np.float32)
+        self.open_bucket: Optional[float] = None
+
+    @property
+    def retention_seconds(self) -> float:
+        return self.interval * self.capacity
+
+    def observe(self, raw: AgentSeries, timestamp: float) -> None:
+        """Note a new raw sample; closes the open bucket when the sample is past it"""
+        bucket = timestamp - timestamp % self.interval
+        if self.open_bucket is None:
+            self.open_bucket = bucket
+        elif bucket > self.open_bucket:
+            self._close(raw, self.open_bucket)
+            self.open_bucket = bucket
+
+    def _close(self, raw: AgentSeries, bucket: float) -> None:
+        timestamps, columns = raw.window(bucket, bucket + self.interval)
+        if not timestamps.size or not columns:
+            return
+
+        names = list(columns)
+        matrix = np.vstack([columns[name] for name in names])
+        with warnings.catch_warnings():
+            # Columns with no value in this bucket summarize to NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            summary = {
+                "count": np.count_nonzero(~np.isnan(matrix), axis=1),
+                "min": np.nanmin(matrix, axis=1),
+                "max": np.nanmax(matrix, axis=1),
+                "mean": np.nanmean(matrix, axis=1),
+            }
+            summary.update(_row_percentiles(matrix, summary["count"]))
+
+        values = {}
+        for stat, stat_values in summary.items():
+            values.update(zip(((name, stat) for name in names), stat_values.tolist()))
+        self.buckets.append(bucket, values)
+
+    def count(self, since: float, until: Optional[float] = None) -> int:
+        return self.buckets.count(since, until)
+
+    def range(self, since: float, until: Optional[float] = None,
+              columns: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, Dict[str, Dict[str, np.ndarray]]]:
+        """Bucket start times and {column: {stat: values}} for buckets in (since, until]"""
+        keys = None if columns is None else [(name, stat) for name in columns for stat in ROLLUP_STATS]
+        timestamps, columns = self.buckets.range(since, until, keys)
+        result: Dict[str, Dict[str, np.ndarray]] = {}
+        for (name, stat), values in columns.items():
+            result.setdefault(name, {})[stat] = values
+        return timestamps, result
+
+    def nbytes(self) -> int:
+        return self.buckets.nbytes()
+
+# (interval seconds, buckets kept): 10 s for 6 hours, 1 minute for 24 hours
+DEFAULT_ROLLUPS = ((10, 2160), (60, 1440))
+
+class MetricsStore:
+    """
+    In-memory metrics for every agent: raw samples plus rollup tiers.
+
+    Raw samples older than ``retention_seconds`` (relative to the agent's
+    newest sample) are evicted as new ones arrive; ``capacity`` bounds raw
+    samples per agent. Each ``rollups`` entry adds a tier of (interval,
+    buckets) kept incrementally, so long windows can be served at a coarser
+    resolution. Agents are only removed by ``evict``, e.g. once
+    ``idle_agents`` reports them. Not thread-safe; the console feeds and
+    reads it from the event loop.
+    """
+
+    def __init__(self, capacity: int = 3600, retention_seconds: float = 3600.0,
+                 rollups: Iterable[Tuple[float, int]] = DEFAULT_ROLLUPS):
+        self.capacity = capacity
+        self.retention_seconds = retention_seconds
+        self.rollups = sorted(rollups)
+        self.series: Dict[str, AgentSeries] = {}
+        self.tiers: Dict[str, List[RollupTier]] = {}
+
+    def agents(self) -> List[str]:
+        return list(self.series)
+
+    @property
+    def longest_retention(self) -> float:
+        """Seconds of history the store can hold, in its coarsest tier"""
+        return max([self.retention_seconds] + [interval * capacity for interval, capacity in self.rollups])
+
+    def idle_agents(self, cutoff: float) -> List[str]:
+        """Agents whose newest sample is older than cutoff"""
+        return [
+            agent_id for agent_id, series in self.series.items()
+            if series.last_timestamp is None or series.last_timestamp < cutoff
+        ]
+
+    def evict(self, agent_ids: Iterable[str]) -> None:
+        """Forget agents and all their samples"""
+        for agent_id in agent_ids:
+            self.series.pop(agent_id, None)
+            self.tiers.pop(agent_id, None)
+
+    def append(self, agent_id: str, timestamp: float, metrics: Dict[str, Any]) -> bool:
+        """Add one sample of nested metrics for an agent"""
+        series = self.series.get(agent_id)
+        if series is None:
+            series = self.series[agent_id] = AgentSeries(self.capacity)
+            self.tiers[agent_id] = [RollupTier(interval, buckets) for interval, buckets in self.rollups]
+
+        if not series.append(timestamp, flatten_metrics(metrics)):
+            logger.debug(f"Dropped out-of-order sample from {agent_id} at {timestamp}")
+            return False
+        for tier in self.tiers[agent_id]:
+            tier.observe(series, timestamp)
+        series.evict_before(timestamp - self.retention_seconds)
+        return True
+
+    def query(self, agent_id: str, since: float, until: Optional[float] = None,
+              columns: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Column arrays of an agent's samples in (since, until]"""
+        series = self.series.get(agent_id)
+        if series is None:
+            return np.empty(0), {}
+        return series.range(since, until, columns)
+
+    def entries(self, agent_id: str, since: float, until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Samples in (since, until] as {'timestamp', 'metrics'} dicts with nested metrics"""
+        timestamps, columns = self.query(agent_id, since, until)
+        names = list(columns)
+        rows = zip(*(columns[name].tolist() for name in names)) if names else ((),) * len(timestamps)
+        return [
+            {'timestamp': timestamp, 'metrics': unflatten_metrics(dict(zip(names, row)))}
+            for timestamp, row in zip(timestamps.tolist(), rows)
+        ]
+
+    def select_tier(self, agent_id: str, since: float, until: Optional[float] = None,
+                    max_points: Optional[int] = None) -> Optional[RollupTier]:
+        """
+        Resolution for a window: None for raw samples, otherwise a rollup tier.
+
+        Only resolutions whose retention covers the window are considered;
+        of those, the finest that returns at most ``max_points`` points wins,
+        or the coarsest if none fits.
+        """
+        series = self.series.get(agent_id)
+        if series is None or not self.tiers[agent_id]:
+            return None
+
+        end = until if until is not None else series.last_timestamp or since
+        span = end - since
+        candidates: List[Optional[RollupTier]] = [None] if span <= self.retention_seconds else []
+        candidates += [tier for tier in self.tiers[agent_id] if span <= tier.retention_seconds]
+        if not candidates:
+            return self.tiers[agent_id][-1]
+
+        for tier in candidates:
+            points = series.count(since, until) if tier is None else tier.count(since, until)
+            if max_points is None or points <= max_points:
+                return tier
+        return candidates[-1]
+
+    def rollup_entries(self, tier: RollupTier, since: float, until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Buckets in (since, until] as {'timestamp', 'interval', 'metrics'} dicts; leaves hold the stats"""
+        timestamps, columns = tier.range(since, until)
+        names = list(columns)
+        stats = {name: {stat: values.tolist() for stat, values in columns[name].items()} for name in names}
+        entries = []
+        for i, timestamp in enumerate(timestamps.tolist()):
+            leaves = {
+                name: {stat: values[i] for stat, values in stats[name].items()}
+                for name in names if stats[name]["count"][i]
+            }
+            entries.append({'timestamp': timestamp, 'interval': tier.interval,
+                            'metrics': unflatten_metrics(leaves)})
+        return entries
+
+    def resolved(self, agent_id: str, since: float, until: Optional[float] = None,
+                 max_points: Optional[int] = None,
+                 columns: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray], Optional[float]]:
+        """
+        Column arrays in (since, until] at the resolution ``select_tier`` picks.
+
+        Returns (timestamps, {column: values}, interval): raw samples with an
+        interval of None, or a tier's bucket means.
+        """
+        tier = self.select_tier(agent_id, since, until, max_points)
+        if tier is None:
+            timestamps, values = self.query(agent_id, since, until, columns)
+            return timestamps, values, None
+        timestamps, stats = tier.range(since, until, columns)
+        means = {name: values["mean"].astype(np.float64) for name, values in stats.items()}
+        return timestamps, means, tier.interval
+
+    def latest(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """An agent's newest sample as a {'timestamp', 'metrics'} dict"""
+        series = self.series.get(agent_id)
+        sample = series.latest() if series else None
+        if sample is None:
+            return None
+        timestamp, values = sample
+        return {'timestamp': timestamp, 'metrics': unflatten_metrics(values)}
+
+    def nbytes(self) -> int:
+        return (sum(series.nbytes() for series in self.series.values())
+                + sum(tier.nbytes() for tiers in self.tiers.values() for tier in tiers))
@@ -0,0 +1,226 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from common.latency import LatencyHistogram
+from common.spool import ReconnectBackoff
+from console.monitoring.store import flatten_metrics
+
+try:
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+except ImportError:  # pragma: no cover - depends on the environment
+    InfluxDBClient = None
+
+logger = logging.getLogger(__name__)
+
+MEASUREMENT = "agent_metrics"
+
+# (agent id, timestamp, nested metrics) as received from an agent
+MetricsPoint = Tuple[str, float, Dict[str, Any]]
+
+def _escape_key(value: str) -> str:
+    """Escape a measurement, tag or field key for line protocol"""
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+def encode_line(measurement: str, tags: Dict[str, str], fields: Dict[str, float], timestamp: float) -> Optional[str]:
+    """
+    One line-protocol point with nanosecond precision.
+
+    Every field is written as a float so a metric never changes type between
+    points (InfluxDB rejects that); NaN and infinities are left out. Returns
+    None when no field is left.
+    """
+    field_set = ",".join(
+        f"{_escape_key(name)}={float(value)!r}"
+        for name, value in fields.items()
+        if math.isfinite(value)
+    )
+    if not field_set:
+        return None
+    tag_set = "".join(f",{_escape_key(key)}={_escape_key(value)}" for key, value in sorted(tags.items()))
+    return f"{_escape_key(measurement)}{tag_set} {field_set} {int(timestamp * 1e9)}"
+
+def metrics_to_line(agent_id: str, timestamp: float, metrics: Dict[str, Any]) -> Optional[str]:
+    """An agent metrics sample as a line-protocol point, fields named like the store's columns"""
+    return encode_line(MEASUREMENT, {"agent_id": agent_id}, flatten_metrics(metrics), timestamp)
+
+class LineProtocolFileSink:
+    """Appends batches to a local line-protocol file, for offline runs and tests"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, lines: List[str]) -> None:
+        self._file.write("\n".join(lines))
+        self._file.write("\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class InfluxDBSink:
+    """Writes batches to an InfluxDB 2.x bucket"""
+
+    def __init__(self, url: str, token: str, org: str, bucket: str, timeout_ms: int = 10_000):
+        if InfluxDBClient is None:
+            raise ValueError("The influxdb sink requires the 'influxdb-client' package")
+        self.bucket = bucket
+        self.org = org
+        self._client = InfluxDBClient(url=url, token=token, org=org, timeout=timeout_ms)
+        self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
+
+    def write(self, lines: List[str]) -> None:
+        self._write_api.write(bucket=self.bucket, org=self.org, record=lines)
+
+    def close(self) -> None:
+        self._client.close()
+
+class TimeSeriesWriter:
+    """
+    Background writer that ships metrics points to a sink in batches.
+
+    ``submit`` only appends to a bounded in-memory queue, so the consumer
+    callback never waits on the sink. A writer thread encodes line protocol
+    and flushes when ``batch_size`` points are queued or ``flush_interval``
+    seconds have passed. A failed flush is retried with backoff; while the
+    sink is slow or down, the queue fills and the oldest points are dropped
+    first, keeping the most recent data.
+    """
+
+    def __init__(self, sink, batch_size: int = 5000, flush_interval: float = 1.0,
+                 max_queued: int = 100_000, backoff: Optional[ReconnectBackoff] = None):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queued = max_queued
+        self.backoff = backoff or ReconnectBackoff(base=0.5, maximum=30.0)
+        self._queue: Deque[MetricsPoint] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.submitted = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.flush_latency = LatencyHistogram()
+
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, agent_id: str, timestamp: float, metrics: Dict[str, Any]) -> None:
+        """Queue a point; never blocks beyond a short lock"""
+        with self._cond:
+            if self._closed:
+                return
+            self._queue.append((agent_id, timestamp, metrics))
+            self.submitted += 1
+            if len(self._queue) > self.max_queued:
+                self._queue.popleft()
+                self.dropped += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def _take_batch(self) -> List[MetricsPoint]:
+        """Wait for a full batch, the flush interval or close, then take up to batch_size points"""
+        deadline = time.monotonic() + self.flush_interval
+        with self._cond:
+            while not self._closed and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _flush(self, lines: List[str]) -> bool:
+        started = time.perf_counter()
+        try:
+            self.sink.write(lines)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.warning(f"Failed to write {len(lines)} metrics points: {e}")
+            return False
+        self.flush_latency.record((time.perf_counter() - started) * 1000.0)
+        self.flushed += len(lines)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+
+            lines = [line for line in (metrics_to_line(*point) for point in batch) if line]
+            if not lines:
+                continue
+
+            while not self._flush(lines):
+                if self._closed:
+                    self.dropped += len(lines)
+                    return
+                delay = self.backoff.next_delay()
+                with self._cond:
+                    self._cond.wait(delay)
+            self.backoff.reset()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queued(),
+            "submitted": self.submitted,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "flush_latency": self.flush_latency.summary(),
+        }
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush what is queued (one attempt per batch) and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+        if self._queue:
+            logger.warning(f"Dropping {len(self._queue)} unwritten metrics points")
+            self.dropped += len(self._queue)
+            self._queue.clear()
+        self.sink.close()
+
+def create_writer(sink: str, **options) -> Optional[TimeSeriesWriter]:
+    """
+    Writer for a configured sink name: "influxdb", "file" or "" for none.
+
+    ``options`` carries the sink settings (influxdb_url, influxdb_token,
+    influxdb_org, influxdb_bucket or file_path) and the writer's batch_size,
+    flush_interval and max_queued.
+    """
+    if not sink:
+        return None
+    if sink == "influxdb":
+        target = InfluxDBSink(
+            options["influxdb_url"], options["influxdb_token"],
+            options["influxdb_org"], options["influxdb_bucket"]
+        )
+    elif sink == "file":
+        target = LineProtocolFileSink(options["file_path"])
+    else:
+        raise ValueError(f"Unknown metrics sink {sink}")
+
+    return TimeSeriesWriter(
+        target,
+        batch_size=options.get("batch_size", 5000),
+        flush_interval=options.get("flush_interval", 1.0),
+        max_queued=options.get("max_queued", 100_000)
+    )
@@ -1,23 +1,47 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import asyncio
+import time
 import uuid
 import json
 import logging
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
 from console.api.models.db_models import DBTestConfiguration, DBTestExecution, DBDroplet
-from console.messaging.service import MessagingService
+from console.config import settings
+from console.messaging.service import MessagingService, get_messaging_service
+from console.monitoring import service as monitoring
+from console.monitoring.service import MonitoringService
 from common.models import TestConfiguration, TestExecution, ExecutionStatus
 from common.synchronization import TimeSynchronizer
 
 logger = logging.getLogger(__name__)
 
+class DispatchError(RuntimeError):
+    """The prepare command could not reach the agents well before the start time"""
+
+class NoTargetsError(ValueError):
+    """A test names target droplets, but none of them has a registered agent"""
+
 class OrchestrationService:
-    def __init__(self, db: Session, messaging_service: Optional[MessagingService] = None):
+    def __init__(self, db: Session, messaging_service: Optional[MessagingService] = None,
+                 monitoring_service: Optional[MonitoringService] = None):
         self.db = db
-        self.messaging_service = messaging_service or MessagingService()
+        self._messaging_service = messaging_service
+        self._monitoring_service = monitoring_service
         self.time_sync = TimeSynchronizer()
     
+    @property
+    def messaging_service(self) -> MessagingService:
+        """Messaging service passed in, or the console's shared one"""
+        return self._messaging_service or get_messaging_service()
+    
+    @property
+    def monitoring_service(self) -> Optional[MonitoringService]:
+        """Monitoring service passed in, or the console's shared one if it is running"""
+        return self._monitoring_service or monitoring.monitoring_service
+    
     def create_test_config(self, config: TestConfiguration) -> TestConfiguration:
         """Create a new test configuration"""
         db_config = DBTestConfiguration(
@@ -50,12 +74,19 @@ class OrchestrationService:
         db_configs = self.db.query(DBTestConfiguration).all()
         return [self._convert_config_to_model(c) for c in db_configs]
     
-    def execute_test(self, config_id: str) -> TestExecution:
+    async def execute_test(self, config_id: str) -> TestExecution:
         """Execute a test based on its configuration"""
         config = self.get_test_config(config_id)
         if not config:
             raise ValueError(f"Test configuration {config_id} not found")
         
+        targets = self._target_agents(config.target_droplets)
+        if config.target_droplets and not targets:
+            # A multicast to nobody would "succeed" and record a run with no agents
+            raise NoTargetsError(
+                f"None of the {len(config.target_droplets)} target droplets has a registered agent"
+            )
+        
         # Create execution record
         execution_id = str(uuid.uuid4())
         execution = DBTestExecution(
@@ -68,11 +99,13 @@ class OrchestrationService:
         self.db.add(execution)
         self.db.commit()
         
-        # Synchronize time
-        self.time_sync.sync()
+        # Synchronize time (NTP queries block, keep them off the event loop)
+        await asyncio.to_thread(self.time_sync.sync)
         
-        # Calculate execution time (5 seconds in the future)
-        execution_time = self.time_sync.calculate_execution_time(5000)
+        # Calculate execution time; the lead starts counting now
+        lead_ms = settings.TEST_START_LEAD_MS
+        execution_time = await asyncio.to_thread(self.time_sync.calculate_execution_time, lead_ms)
+        dispatch_started = time.perf_counter()
         
         # Prepare command for distribution
         command = {
@@ -81,27 +114,85 @@ class OrchestrationService:
             "command_type": "prepare",
             "command": config.command,
             "parameters": config.parameters,
-            "target_droplets": config.target_droplets,
             "duration": config.duration,
-            "preparation_time": 5,  # 5 seconds for preparation
+            "preparation_time": lead_ms / 1000,
             "execution_time": execution_time  # Synchronized execution time
         }
         
         # Distribute command to target agents
         if config.target_droplets:
-            for agent_id in config.target_droplets:
-                # Check if droplet exists
-                droplet = self.db.query(DBDroplet).filter(DBDroplet.id == agent_id).first()
-                if not droplet:
-                    logger.warning(f"Target droplet {agent_id} not found, skipping")
-                    continue
-                
-                self.messaging_service.send_direct_command(agent_id, command)
+            # One multicast carries the whole target set
+            sent = await self.messaging_service.send_multicast_command(targets, command)
         else:
             # Broadcast to all agents
-            self.messaging_service.send_command(command)
+            sent = await self.messaging_service.send_command(command)
         
-        return self._convert_execution_to_model(execution)
+        dispatch_ms = (time.perf_counter() - dispatch_started) * 1000
+        logger.info(f"Dispatched execution {execution_id} to "
+                    f"{len(targets) if config.target_droplets else 'all'} agents in {dispatch_ms:.1f} ms")
+        
+        budget_ms = lead_ms * settings.DISPATCH_BUDGET_FRACTION
+        if not sent or dispatch_ms > budget_ms:
+            reason = ("prepare command was not published" if not sent else
+                      f"dispatch took {dispatch_ms:.0f} ms of the {lead_ms} ms start lead")
+            await self._fail_dispatch(execution, targets if config.target_droplets else None, reason)
+            raise DispatchError(reason)
+        
+        # Index the run so its metrics can be looked up by execution
+        if self.monitoring_service:
+            self.monitoring_service.track_execution(
+                execution_id, targets if config.target_droplets else None, execution_time, config.duration
+            )
+        
+        result = self._convert_execution_to_model(execution)
+        result.dispatch_ms = dispatch_ms
+        return result
+    
+    def _target_agents(self, targets: List[str]) -> List[str]:
+        """
+        Ids of the agents running on the given droplets, in order, looked up
+        with one query
+
+        Agents listen and report under their own id, which the droplet
+        records when its agent registers; a target may also be an agent id.
+        Droplets that don't exist or have no registered agent are skipped.
+        """
+        if not targets:
+            return []
+        agents = {}
+        rows = self.db.query(DBDroplet.id, DBDroplet.agent_id).filter(
+            or_(DBDroplet.id.in_(targets), DBDroplet.agent_id.in_(targets))
+        ).all()
+        for droplet_id, agent_id in rows:
+            agents[droplet_id] = agent_id
+            if agent_id:
+                agents[agent_id] = agent_id
+        
+        missing = [target for target in targets if target not in agents]
+        if missing:
+            logger.warning(f"{len(missing)} target droplets not found, skipping: {missing[:10]}")
+        no_agent = [target for target in targets if target in agents and not agents[target]]
+        if no_agent:
+            logger.warning(f"{len(no_agent)} target droplets have no registered agent, skipping: {no_agent[:10]}")
+        return list(dict.fromkeys(agents[target] for target in targets if agents.get(target)))
+    
+    async def _fail_dispatch(self, execution: DBTestExecution, targets: Optional[List[str]], reason: str) -> None:
+        """Mark an execution failed and tell any agent that got the prepare command to stand down"""
+        logger.error(f"Execution {execution.id} failed to dispatch: {reason}")
+        execution.status = ExecutionStatus.FAILED.value
+        execution.end_time = datetime.utcnow()
+        execution.results = json.dumps({"error": reason})
+        self.db.commit()
+        
+        abort = {
+            "command_id": str(uuid.uuid4()),
+            "execution_id": execution.id,
+            "command_type": "abort"
+        }
+        if targets is None:
+            await self.messaging_service.send_command(abort)
+        elif targets:
+            await self.messaging_service.send_multicast_command(targets, abort)
     
     def get_execution(self, execution_id: str) -> Optional[TestExecution]:
         """Get test execution status by ID"""
@@ -115,8 +206,8 @@ class OrchestrationService:
         db_executions = self.db.query(DBTestExecution).all()
         return [self._convert_execution_to_model(e) for e in db_executions]
     
-    def abort_execution(self, execution_id: str) -> bool:
-        """Abort a running test execution"""
+    async def abort_execution(self, execution_id: str, reason: Optional[str] = None) -> bool:
+        """Abort a running test execution, recording why if a reason is given"""
         db_execution = self.db.query(DBTestExecution).filter(DBTestExecution.id == execution_id).first()
         if not db_execution:
             return False
@@ -127,7 +218,11 @@ class OrchestrationService:
         # Update status
         db_execution.status = ExecutionStatus.ABORTED.value
         db_execution.end_time = datetime.utcnow()
+        if reason:
+            db_execution.results = json.dumps({"error": reason})
         self.db.commit()
+        if self.monitoring_service:
+            self.monitoring_service.finish_execution(execution_id)
         
         # Send abort command
         command = {
@@ -136,7 +231,7 @@ class OrchestrationService:
             "command_type": "abort"
         }
         
-        self.messaging_service.send_command(command)
+        await self.messaging_service.send_command(command)
         return True
     
     def _convert_config_to_model(self, db_config: DBTestConfiguration) -> TestConfiguration:
@@ -0,0 +1,26 @@
+"""droplet agent id
+
+Revision ID: 3f6d2b1c9e47
+Revises: a8c2fa958765
+Create Date: 2026-10-17 09:12:41.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6d2b1c9e47'
+down_revision = 'a8c2fa958765'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('droplets', sa.Column('agent_id', sa.String(), nullable=True))
+    op.create_index('ix_droplets_agent_id', 'droplets', ['agent_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_droplets_agent_id', table_name='droplets')
+    op.drop_column('droplets', 'agent_id')
@@ -0,0 +1,63 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from console.monitoring.alerts import AlertEngine, AlertRule
+from console.monitoring.service import MonitoringService
+
+def test_threshold_must_hold_for_duration():
+    engine = AlertEngine([AlertRule("cpu", "cpu_percent", ">", 90.0, for_seconds=15)])
+
+    events = []
+    for t, cpu in enumerate([95, 95, 80, 95, 95, 95, 95, 50]):
+        events += [(t, e["state"]) for e in engine.observe("a1", t * 5.0, {"cpu_percent": cpu})]
+
+    # The dip at t=2 restarts the 15 s clock
+    assert events == [(6, "firing"), (7, "resolved")]
+    assert engine.active == {}
+    assert [e["state"] for e in engine.recent] == ["firing", "resolved"]
+
+def test_rate_rule_and_nested_columns():
+    engine = AlertEngine([
+        AlertRule("climbing", "memory_percent", ">", 5.0, kind="rate", window=30.0),
+        AlertRule("sync", "time_sync/using_ntp", "<", 1.0),
+    ])
+
+    # +1% every 5 s is 12%/min
+    events = []
+    for t in range(4):
+        events += engine.observe("a1", t * 5.0, {"memory_percent": 50.0 + t, "time_sync": {"using_ntp": True}})
+    assert [(e["rule"], e["state"]) for e in events] == [("climbing", "firing")]
+    assert events[0]["value"] == pytest.approx(12.0)
+
+    [event] = engine.observe("a1", 20.0, {"memory_percent": 53.0, "time_sync": {"using_ntp": False}})
+    assert (event["rule"], event["state"]) == ("sync", "firing")
+    assert set(engine.active) == {("a1", "climbing"), ("a1", "sync")}
+
+def test_saturated_agent_aborts_its_execution():
+    messaging = Mock()
+    messaging.publish_alert = AsyncMock(return_value=True)
+    abort = AsyncMock()
+    service = MonitoringService(
+        messaging,
+        alert_rules=[AlertRule("cpu", "cpu_percent", ">", 90.0, for_seconds=10, abort=True)],
+        abort_execution=abort
+    )
+
+    async def run():
+        service._handle_status("agent.a1.status", {
+            "agent_id": "a1", "details": {"execution_id": "e1", "executing": True, "start_time": 100.0}
+        })
+        for t in range(100, 125, 5):
+            service._handle_metrics("metrics.system.a1", {"agent_id": "a1", "timestamp": float(t),
+                                                          "metrics": {"cpu_percent": 99.0}})
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    alert = messaging.publish_alert.await_args.args[0]
+    assert (alert["rule"], alert["state"], alert["execution_id"]) == ("cpu", "firing", "e1")
+    abort.assert_awaited_once()
+    assert abort.await_args.args[0] == "e1"
+    assert service.get_alerts()["active"][0]["agent_id"] == "a1"
@@ -0,0 +1,46 @@
+import json
+import pytest
+from datetime import datetime
+
+from common.codecs import MessageCodec, CODECS, COMPRESSORS, MSGPACK_CONTENT_TYPE
+
+MESSAGE = {
+    "agent_id": "a1",
+    "timestamp": 1700000000.5,
+    "metrics": {"cpu_percent": 12.5, "network": {"bytes_sent": 10, "bytes_recv": 20}},
+}
+
+def test_json_is_default_and_readable_by_plain_json():
+    body, content_type, content_encoding = MessageCodec().encode(MESSAGE)
+
+    assert content_type == "application/json"
+    assert content_encoding is None
+    assert json.loads(body.decode()) == MESSAGE
+
+def test_decode_without_properties_assumes_json():
+    body = json.dumps(MESSAGE).encode()
+    assert MessageCodec().decode(body, None, None) == MESSAGE
+
+@pytest.mark.skipif(MSGPACK_CONTENT_TYPE not in CODECS, reason="msgpack not installed")
+def test_msgpack_round_trip_through_json_consumer():
+    body, content_type, content_encoding = MessageCodec.from_names("msgpack").encode(MESSAGE)
+
+    # A consumer configured for JSON still decodes by the message properties
+    assert MessageCodec().decode(body, content_type, content_encoding) == MESSAGE
+
+@pytest.mark.parametrize("encoding", sorted(COMPRESSORS))
+def test_compression_only_above_threshold(encoding):
+    codec = MessageCodec(compression=encoding, compression_threshold=1024)
+
+    _, _, small_encoding = codec.encode(MESSAGE)
+    large = dict(MESSAGE, stdout="x" * 10000, sent_at=datetime(2024, 1, 1))
+    body, content_type, large_encoding = codec.encode(large)
+
+    assert small_encoding is None
+    assert large_encoding == encoding
+    assert len(body) < 10000
+    assert codec.decode(body, content_type, large_encoding)["sent_at"] == "2024-01-01T00:00:00"
+
+def test_unknown_content_type_is_rejected():
+    with pytest.raises(ValueError):
+        MessageCodec().decode(b"\x00", "application/x-unknown", None)
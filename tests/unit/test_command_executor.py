@@ -0,0 +1,83 @@
+import threading
+import time
+
+from agent.executor.command import CommandExecutor
+
+def wait(executor, command_id):
+    """The command's result; completion() is None once a fast command has already finished"""
+    done = threading.Event()
+    results = []
+    executor.when_complete(command_id, lambda result: (results.append(result), done.set()))
+    assert done.wait(10)
+    return results[0]
+
+def test_completion_callback_fires_when_process_exits(tmp_path):
+    executor = CommandExecutor()
+    done = threading.Event()
+    results = []
+
+    def on_complete(result):
+        results.append((result, threading.current_thread()))
+        done.set()
+
+    # The command waits for the callback to be registered, so it fires on exit
+    flag = tmp_path / "go"
+    assert executor.execute("c1", f"sh -c 'while [ ! -e {flag} ]; do sleep 0.01; done; echo hello'")["status"] == "started"
+    assert executor.when_complete("c1", on_complete)
+    flag.touch()
+    assert done.wait(5)
+
+    [(result, thread)] = results
+    assert (result["status"], result["exit_code"], result["stdout"]) == ("completed", 0, "hello\n")
+    assert thread is not threading.current_thread()
+    assert executor.running() == 0
+    assert executor.completion("c1") is None
+
+def test_late_callback_runs_immediately_and_unknown_command_is_rejected():
+    executor = CommandExecutor()
+    executor.execute("c1", "true")
+    assert wait(executor, "c1")["exit_code"] == 0
+
+    results = []
+    assert executor.when_complete("c1", results.append)
+    assert results == [executor.get_result("c1")]
+    assert not executor.when_complete("missing", results.append)
+
+def test_output_streams_in_bounded_chunks_and_result_keeps_tail():
+    executor = CommandExecutor(chunk_size=1000, tail_bytes=100)
+    chunks = []
+    executor.execute("c1", "python3 -c \"import sys; sys.stdout.write('x' * 5000 + 'end'); sys.stderr.write('oops')\"",
+                     on_output=lambda stream, offset, data: chunks.append((stream, offset, data)))
+    result = wait(executor, "c1")
+
+    stdout = [(offset, data) for stream, offset, data in chunks if stream == "stdout"]
+    assert max(len(data) for _, data in stdout) <= 1000
+    assert b"".join(data for _, data in stdout) == b"x" * 5000 + b"end"
+    assert [offset for offset, _ in stdout] == [sum(len(data) for _, data in stdout[:i]) for i in range(len(stdout))]
+    assert [data for stream, _, data in chunks if stream == "stderr"] == [b"oops"]
+
+    assert result["stdout"] == "x" * 97 + "end"
+    assert (result["stdout_bytes"], result["stderr"]) == (5003, "oops")
+
+def test_timeout_kills_the_process_group():
+    executor = CommandExecutor()
+    executor.execute("c1", "sh -c 'echo started; sleep 30'", timeout=0.5)
+    result = wait(executor, "c1")
+    assert (result["status"], result["exit_code"], result["stdout"]) == ("timeout", -1, "started\n")
+
+def test_timeout_applies_after_the_process_closes_its_output():
+    executor = CommandExecutor()
+    start = time.monotonic()
+    executor.execute("c1", "sh -c 'exec >/dev/null 2>&1; sleep 30'", timeout=0.5)
+    result = wait(executor, "c1")
+    assert (result["status"], result["exit_code"]) == ("timeout", -1)
+    assert time.monotonic() - start < 10
+
+def test_abort_kills_the_process_group():
+    executor = CommandExecutor()
+    executor.execute("c1", "sh -c 'sleep 30 & wait'")
+    assert executor.abort("c1")
+    result = wait(executor, "c1")
+    assert result["status"] == "completed" and result["exit_code"] != 0
+    assert result["execution_time"] < 10
+    assert not executor.abort("c1")
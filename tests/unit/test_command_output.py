@@ -0,0 +1,113 @@
+import random
+import threading
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
+
+from agent.main import Agent
+from common.output import OutputWindow, frame_data, output_frame
+from console.monitoring.output import OutputIndex
+from console.monitoring.service import MonitoringService
+
+def frames(agent_id, chunks, execution_id=None):
+    """Frames for (stream, data) chunks, plus the final one"""
+    offsets = {}
+    result = []
+    for seq, (stream, data) in enumerate(chunks):
+        offset = offsets.get(stream, 0)
+        result.append(output_frame(agent_id, "c1", seq, stream, offset, data, execution_id))
+        offsets[stream] = offset + len(data)
+    result.append(output_frame(agent_id, "c1", len(chunks), "stdout", offsets.get("stdout", 0), b"", execution_id, eof=True))
+    return result
+
+def test_frames_compress_and_round_trip():
+    text = b"GET / 200 1.2ms\n" * 1000
+    frame = output_frame("a1", "c1", 0, "stdout", 0, text)
+    assert frame["encoding"] == "deflate"
+    assert len(frame["data"]) < len(text) / 10
+    assert frame_data(frame) == text
+
+    noise = random.Random(0).randbytes(1000)
+    frame = output_frame("a1", "c1", 1, "stdout", 0, noise)
+    assert frame["encoding"] is None
+    assert frame_data(frame) == noise
+
+def test_out_of_order_frames_are_reassembled_per_agent():
+    index = OutputIndex(tail_bytes=1000)
+    a1 = frames("a1", [("stdout", b"one "), ("stderr", b"warn"), ("stdout", b"two "), ("stdout", b"three")], "e1")
+    a2 = frames("a2", [("stdout", b"other")])
+    for frame in [a1[2], a2[0], a1[0], a1[4], a2[1], a1[1], a1[3], a1[0]]:
+        index.add(frame)
+
+    output = index.get("c1")
+    assert output["a1"]["stdout"]["text"] == "one two three"
+    assert output["a1"]["stderr"]["text"] == "warn"
+    assert (output["a1"]["complete"], output["a1"]["execution_id"]) == (True, "e1")
+    assert output["a2"]["stdout"]["text"] == "other"
+
+    # Polling from the last end only returns what is new
+    assert index.get("c1", "a1", offset=4)["a1"]["stdout"]["text"] == "two three"
+    assert index.get("missing") is None
+
+def test_memory_is_bounded_and_lost_frames_are_skipped():
+    index = OutputIndex(max_commands=1, tail_bytes=10, max_pending=2)
+    chunks = frames("a1", [("stdout", b"%03d\n" % i) for i in range(100)])
+    del chunks[50]
+    for frame in chunks:
+        index.add(frame)
+
+    output = index.get("c1", "a1")["a1"]
+    assert output["stdout"]["text"] == "097\n098\n099\n"[-10:]
+    assert (output["stdout"]["end"], output["stdout"]["truncated"]) == (400, True)
+    assert (output["lost_frames"], output["stdout"]["missing_bytes"], output["complete"]) == (1, 4, True)
+
+    index.add(output_frame("a1", "c2", 0, "stdout", 0, b"x"))
+    assert index.get("c1") is None
+
+def test_service_collects_output():
+    service = MonitoringService(Mock())
+    for frame in frames("a1", [("stdout", b"hello")]):
+        service._handle_output("agent.a1.output", frame)
+    service._handle_output("agent.a1.output", {"bad": "frame"})
+    assert service.get_command_output("c1")["a1"]["stdout"]["text"] == "hello"
+
+def test_output_window_blocks_until_bytes_are_released():
+    window = OutputWindow(max_bytes=100, timeout=5.0)
+    assert window.acquire(80)
+    # An empty window takes an oversize frame rather than blocking forever
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(window.acquire(50)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    window.release(80)
+    waiter.join(5)
+    assert acquired == [True] and window.in_flight == 50
+
+    window.timeout = 0.1
+    assert not window.acquire(60)
+    assert window.dropped == 1 and window.in_flight == 50
+
+def test_agent_output_in_flight_is_bounded():
+    broker = Mock()
+    pending = []
+    broker.publish_async.side_effect = lambda **kwargs: pending.append(Future()) or pending[-1]
+    with patch("agent.main.MessageBroker", return_value=broker), patch("agent.main.TimeSynchronizer"):
+        agent = Agent("http://console", "amqp://localhost", output_max_in_flight=64 * 1024)
+    agent.output_window.timeout = 0.1
+    on_output, end_output = agent._output_stream("c1")
+
+    noise = random.Random(0).randbytes(16 * 1024)
+    for n in range(10):
+        on_output("stdout", n * len(noise), noise)
+    # The broker has not taken anything: later frames are dropped, not queued
+    assert agent.output_window.in_flight <= 64 * 1024
+    assert agent.output_window.dropped == 10 - len(pending)
+    end_output()
+    assert pending and broker.publish_async.call_args.kwargs["message"]["eof"]
+
+    for future in pending:
+        future.set_result(True)
+    assert agent.output_window.in_flight == 0
+    published = len(pending)
+    on_output("stdout", 10 * len(noise), noise)
+    assert len(pending) == published + 1
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from console.api.models.db_models import DBDroplet
+from console.api.routes import agents, metrics
+from console.database import get_db
+from console.monitoring.fleet import bucket_matrix, fleet_frame
+from console.monitoring.service import MonitoringService, get_monitoring_service
+from console.monitoring.store import MetricsStore
+
+@pytest.fixture
+def store():
+    # 10 agents, one sample a second for a minute; agent i runs at i*10% CPU
+    store = MetricsStore()
+    for second in range(60):
+        for i in range(10):
+            store.append(f"a{i}", 1000.0 + second, {"cpu_percent": i * 10.0 + (second % 2)})
+    return store
+
+def test_bucket_matrix_averages_each_series_per_step():
+    series = [
+        (np.array([0.0, 1.0, 5.0]), np.array([1.0, 3.0, 10.0])),
+        (np.array([6.0]), np.array([np.nan])),
+    ]
+
+    matrix = bucket_matrix(series, start=0.0, step=5.0, buckets=2)
+
+    assert matrix[0].tolist() == [2.0, 10.0]
+    assert np.isnan(matrix[1]).all()
+
+def test_fleet_frame_percentiles_match_numpy(store):
+    frame = fleet_frame(store, "cpu_percent", store.agents(), 1000.0, 1060.0, 10.0)
+
+    stats = frame.stats((50, 95))
+    assert frame.values.shape == (10, 6)
+    assert stats["count"].tolist() == [10] * 6
+    np.testing.assert_allclose(stats["p95"], np.percentile(frame.values, 95, axis=0))
+    np.testing.assert_allclose(stats["p50"], np.percentile(frame.values, 50, axis=0))
+
+def test_fleet_frame_histogram_top_and_groups(store):
+    frame = fleet_frame(store, "cpu_percent", store.agents(), 1000.0, 1060.0, 30.0)
+
+    edges, counts = frame.histogram(bins=2, value_range=(0.0, 100.0))
+    assert edges.tolist() == [0.0, 50.0, 100.0]
+    assert counts.tolist() == [[5, 5], [5, 5]]
+
+    assert [agent_id for agent_id, _ in frame.top(3)] == ["a9", "a8", "a7"]
+
+    groups = frame.group_by({"a0": "nyc1", "a1": "nyc1", "a9": "sfo3"})
+    assert set(groups) == {"nyc1", "sfo3", "unknown"}
+    assert groups["nyc1"]["count"].tolist() == [2, 2]
+    assert groups["sfo3"]["max"][0] == pytest.approx(90.5)
+
+def test_query_fleet_over_execution(store):
+    service = MonitoringService(messaging_service=object())
+    service.store = store
+    service.track_execution("e1", ["a1", "a2"], 1010.0, duration=20)
+
+    result = service.query_fleet("cpu_percent", step=10.0, execution_id="e1", top=1)
+
+    assert (result["start"], result["end"], result["agents"]) == (1010.0, 1030.0, 2)
+    assert result["stats"]["count"] == [2, 2]
+    assert result["top"][0]["agent_id"] == "a2"
+    assert service.query_fleet("cpu_percent", execution_id="missing") is None
+    with pytest.raises(ValueError):
+        service.query_fleet("cpu_percent", start=0.0, end=1e9, step=1.0)
+
+def test_fleet_route_groups_agents_by_their_droplets_region(test_db):
+    test_db.add(DBDroplet(id="droplet-1", name="lg-1", region="nyc1", size="s-1vcpu-1gb",
+                          ip_address="10.0.0.1", status="active", created_at=datetime.utcnow()))
+    test_db.commit()
+    monitoring = MonitoringService()
+    app = FastAPI()
+    app.include_router(agents.router, prefix="/agents")
+    app.include_router(metrics.router, prefix="/metrics")
+    app.dependency_overrides[get_db] = lambda: test_db
+    app.dependency_overrides[get_monitoring_service] = lambda: monitoring
+    client = TestClient(app)
+
+    # Agents report under their own random id, not the droplet's
+    for agent_id, ip_address in (("agent-uuid-1", "10.0.0.1"), ("agent-uuid-2", "10.0.0.2")):
+        response = client.post("/agents/register", json={"id": agent_id, "hostname": agent_id, "ip_address": ip_address})
+        assert response.status_code == 200
+        monitoring.store.append(agent_id, 1000.0, {"cpu_percent": 50.0})
+
+    response = client.get("/metrics/fleet", params={"start": 1000, "end": 1010, "group_by": "region"})
+    assert response.status_code == 200
+    groups = response.json()["groups"]
+    # The unprovisioned agent got a droplet of its own with an unknown region
+    assert set(groups) == {"nyc1", "unknown"}
+    assert groups["nyc1"]["count"] == [1]
@@ -0,0 +1,77 @@
+import json
+import math
+import random
+from unittest.mock import Mock
+
+import pytest
+
+from common.histogram import Histogram
+from common.latency import LatencyHistogram
+from console.monitoring.service import MonitoringService
+
+def exact_percentile(values, pct):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * pct / 100) - 1)]
+
+def test_percentiles_within_one_percent_over_wide_range():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(0, 2) for _ in range(50_000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for pct in (1, 50, 90, 99, 99.9):
+        assert histogram.percentile(pct) == pytest.approx(exact_percentile(values, pct), rel=0.01, abs=0.001)
+    assert histogram.percentile(100) == max(values)
+    assert histogram.summary()["count"] == 50_000
+
+def test_merge_is_exact_and_serialized_form_is_small():
+    rng = random.Random(1)
+    whole = Histogram(resolution=0.001)
+    parts = [Histogram(resolution=0.001) for _ in range(10)]
+    for i in range(100_000):
+        value = rng.expovariate(1 / (5 + i % 10))
+        whole.record(value)
+        parts[i % 10].record(value)
+
+    # Through the wire format, as agents send them
+    merged = Histogram.merged(Histogram.from_dict(json.loads(json.dumps(part.to_dict()))) for part in parts)
+    assert merged.counts == whole.counts
+    assert (merged.count, merged.min, merged.max) == (whole.count, whole.min, whole.max)
+    assert merged.total == pytest.approx(whole.total)
+    assert len(json.dumps(whole.to_dict())) < 4096
+
+    with pytest.raises(ValueError):
+        whole.merge(Histogram(resolution=1.0))
+    assert Histogram.merged([]) is None
+    assert Histogram.from_dict(Histogram().to_dict()).summary() == {"count": 0}
+
+def test_fleet_p99_merges_agents_instead_of_averaging():
+    service = MonitoringService(Mock())
+    fast, slow = LatencyHistogram(), LatencyHistogram()
+    for _ in range(990):
+        fast.record(1.0)
+    for _ in range(10):
+        slow.record(1000.0)
+    # A second from each agent, then their whole-run results
+    for agent_id, histogram in (("fast", fast), ("slow", slow)):
+        service._handle_metrics("metrics.load.x", {
+            "agent_id": agent_id, "timestamp": 100.5, "execution_id": "e1",
+            "metrics": {"load": {"rps": 1.0, "latency_histogram": histogram.to_dict()}}
+        })
+    assert service.load_store.latest("fast")["metrics"]["load"] == {"rps": 1.0}
+
+    latency = service.get_load_latency("e1", start=100, end=101)
+    assert latency["timeline"][0]["count"] == 1000
+    # Averaging the two agents' p99s would say about 500 ms
+    assert latency["latency"]["p99_ms"] == pytest.approx(1.0, rel=0.01)
+    assert latency["latency"]["p99.9_ms"] == pytest.approx(1000.0, rel=0.01)
+
+    for agent_id, histogram in (("fast", fast), ("slow", slow)):
+        service._handle_status(f"agent.{agent_id}.result", {
+            "agent_id": agent_id, "execution_id": "e1", "result": {"latency_histogram": histogram.to_dict()}
+        })
+    latency = service.get_load_latency("e1")
+    assert latency["finished_agents"] == ["fast", "slow"]
+    assert latency["latency"]["count"] == 1000
+    assert service.get_load_latency("missing") is None
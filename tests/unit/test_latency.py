@@ -0,0 +1,38 @@
+import pytest
+
+from common.latency import LatencyHistogram, LatencyTracker, SequenceStamper
+
+def test_histogram_percentiles_within_bucket_precision():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(float(value))
+
+    assert histogram.count == 1000
+    assert histogram.percentile(50) == pytest.approx(500, rel=0.1)
+    assert histogram.percentile(99) == pytest.approx(990, rel=0.1)
+    assert histogram.percentile(100) == 1000
+
+def test_tracker_records_latency_gaps_and_duplicates():
+    now = [100.0]
+    stamper = SequenceStamper(publisher_id="console", clock=lambda: now[0])
+    tracker = LatencyTracker(clock=lambda: now[0] + 0.25)
+
+    headers = [stamper.headers("do-control.commands", "a1") for _ in range(5)]
+    for h in (headers[0], headers[1], headers[1], headers[4]):
+        tracker.observe("do-control.commands", "a1", h)
+    tracker.observe("do-control.commands", "a1", None)
+
+    stats = tracker.snapshot()["do-control.commands"]["a1"]
+    assert stats["p50_ms"] == pytest.approx(250, rel=0.1)
+    assert stats["gaps"] == 2
+    assert stats["duplicates"] == 1
+    assert stats["unstamped"] == 1
+
+def test_summary_combines_keys_and_resets():
+    stamper = SequenceStamper(clock=lambda: 10.0)
+    tracker = LatencyTracker(clock=lambda: 10.001)
+    for key in ("agent.a1.status", "agent.a2.status"):
+        tracker.observe("do-control.status", key, stamper.headers("do-control.status", key))
+
+    assert tracker.summary(reset=True)["do-control.status"]["count"] == 2
+    assert tracker.summary() == {}
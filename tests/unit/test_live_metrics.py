@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from console.monitoring.live import LiveMetricsHub, merge_frames
+from console.monitoring.store import MetricsStore
+
+def sample(cpu, memory=50.0):
+    return {"cpu_percent": cpu, "memory_percent": memory}
+
+def test_subscribers_share_one_encoded_delta():
+    async def run():
+        store = MetricsStore()
+        store.append("a1", 100.0, sample(10.0))
+        store.append("a2", 100.0, sample(20.0))
+        hub = LiveMetricsHub(store)
+
+        first, second = hub.subscribe(1.0), hub.subscribe(1.1)
+        assert len(hub.groups) == 1
+        snapshot = json.loads(await first.next_frame())
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["agents"]["a2"]["metrics"] == {"cpu_percent": 20.0, "memory_percent": 50.0}
+        await second.next_frame()
+
+        store.append("a1", 101.0, sample(15.0))
+        hub.mark("a1")
+        hub.groups[1.0].tick()
+
+        first_text, second_text = await first.next_frame(), await second.next_frame()
+        assert first_text is second_text
+        delta = json.loads(first_text)
+        assert delta["type"] == "delta"
+        assert delta["agents"] == {"a1": {"timestamp": 101.0, "metrics": {"cpu_percent": 15.0}}}
+
+        # Nothing changed: no frame
+        assert hub.groups[1.0].tick() is None
+
+        hub.unsubscribe(first)
+        hub.unsubscribe(second)
+        assert hub.groups == {}
+
+    asyncio.run(run())
+
+def test_slow_subscriber_gets_merged_frame():
+    async def run():
+        store = MetricsStore()
+        hub = LiveMetricsHub(store)
+        subscriber = hub.subscribe(0.5)
+        group = subscriber.group
+
+        for i, agent_id in enumerate(["a1", "a2", "a1"]):
+            store.append(agent_id, 100.0 + i, sample(float(i), memory=float(i)))
+            hub.mark(agent_id)
+            group.tick()
+
+        frame = json.loads(await subscriber.next_frame())
+        assert subscriber.coalesced == 3
+        assert frame["type"] == "snapshot"
+        assert frame["seq"] == 3
+        assert frame["agents"]["a1"] == {"timestamp": 102.0, "metrics": {"cpu_percent": 2.0, "memory_percent": 2.0}}
+        assert frame["agents"]["a2"]["metrics"]["cpu_percent"] == 1.0
+        hub.close()
+
+    asyncio.run(run())
+
+def test_merge_frames_keeps_older_columns():
+    older = {"type": "delta", "seq": 1, "agents": {"a1": {"timestamp": 1.0, "metrics": {"x": 1, "y": 2}}}}
+    newer = {"type": "delta", "seq": 2, "agents": {"a1": {"timestamp": 2.0, "metrics": {"y": 3}}}}
+
+    merged = merge_frames(older, newer)
+
+    assert merged["seq"] == 2
+    assert merged["agents"]["a1"] == {"timestamp": 2.0, "metrics": {"x": 1, "y": 3}}
+    assert older["agents"]["a1"]["metrics"] == {"x": 1, "y": 2}
+
+def test_interval_is_clamped_and_nan_falls_back_to_default():
+    hub = LiveMetricsHub(MetricsStore())
+    assert hub.normalize_interval(0.01) == 0.25
+    assert hub.normalize_interval(float("inf")) == 60.0
+    assert hub.normalize_interval(float("nan")) == 1.0
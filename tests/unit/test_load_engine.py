@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent.executor.load import LoadEngine, RequestTemplate
+from common.histogram import Histogram
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        if self.path.startswith("/chunked"):
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n")
+            return
+        body = b"ok" if self.path != "/missing" else b"no"
+        self.send_response(200 if self.path != "/missing" else 404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.paths.append(body.decode())
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    Handler.paths = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_closed_loop_run_reuses_connections(server):
+    seconds = []
+    engine = LoadEngine.from_spec({
+        "requests": [
+            {"url": f"{server}/item/{{n}}", "weight": 2},
+            {"url": f"{server}/chunked"},
+            {"url": f"{server}/missing"},
+            {"url": f"{server}/submit", "method": "POST", "body": '{"id": {n}}'},
+        ],
+        "concurrency": 4,
+        "max_requests": 200,
+    }, on_second=seconds.append)
+    result = asyncio.run(engine.run())
+
+    assert (result["requests"], result["errors"]) == (200, 0)
+    # Weighted round-robin over five slots: item, item, chunked, missing, submit
+    assert result["statuses"] == {"200": 120, "404": 40, "204": 40}
+    assert result["connections"] == 4
+    assert result["bytes"] == 80 * 2 + 40 * 11 + 40 * 2
+    assert result["latency"]["count"] == 200
+    assert [second["requests"] for second in seconds] == [second["requests"] for second in result["timeline"]]
+    assert sum(Histogram.from_dict(second["latency_histogram"]).count for second in seconds) == 200
+    assert Histogram.from_dict(result["latency_histogram"]).count == 200
+    assert {"/item/0", "/item/1", '{"id": 4}', "/item/5"} <= set(Handler.paths)
+
+def test_open_loop_rate_and_errors(server):
+    engine = LoadEngine([RequestTemplate(f"{server}/")], concurrency=5, duration=1.0, rate=50)
+    result = asyncio.run(engine.run())
+    assert 45 <= result["requests"] <= 51
+    assert result["errors"] == 0
+
+    # Nothing listens on the port once the server is gone
+    unreachable = LoadEngine([RequestTemplate("http://127.0.0.1:9/")], concurrency=2, max_requests=4)
+    result = asyncio.run(unreachable.run())
+    assert (result["requests"], result["errors"]) == (0, 4)
+    assert result["error_types"] == {"ConnectionRefusedError": 4}
+
+def test_stop_ends_the_run_early(server):
+    engine = LoadEngine([RequestTemplate(f"{server}/")], concurrency=2, duration=30.0, rate=20)
+    threading.Timer(0.3, engine.stop).start()
+    result = asyncio.run(engine.run())
+    assert 0 < result["requests"] < 20
+
+    # A stop that arrives before the run starts still ends it
+    engine = LoadEngine([RequestTemplate(f"{server}/")], concurrency=2, duration=30.0)
+    engine.stop()
+    assert asyncio.run(engine.run())["requests"] == 0
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError):
+        RequestTemplate("ftp://example.com/")
+    with pytest.raises(KeyError):
+        LoadEngine.from_spec({"concurrency": 3})
+    for option in ({"concurrency": 0}, {"duration": 0}, {"duration": -5}, {"rate": 0}, {"rate": -1.5},
+                   {"max_requests": 0}, {"timeout": 0}):
+        with pytest.raises(ValueError):
+            LoadEngine.from_spec({"url": "http://127.0.0.1/", **option})
+    with pytest.raises(ValueError):
+        LoadEngine.from_spec({"url": "http://127.0.0.1/", "rate": "fast"})
@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pika
+import pytest
+
+from common.loopback import InMemoryBroker, topic_matches
+from common.messaging import MULTICAST_MAX_TARGETS, MULTICAST_ROUTING_KEY, TOPIC_POLICIES, TopicPolicy, TopicType
+
+@pytest.mark.parametrize("pattern,key,expected", [
+    ("#", "agent.a1.status", True),
+    ("agent.*.status", "agent.a1.status", True),
+    ("agent.*.status", "agent.a1.result", False),
+    ("agent.*", "agent.a1.status", False),
+    ("agent.#", "agent", True),
+    ("agent.#.result", "agent.a1.x.result", True),
+    ("broadcast", "broadcast", True),
+    ("broadcast", "a1", False),
+])
+def test_topic_matches(pattern, key, expected):
+    assert topic_matches(pattern, key) is expected
+
+@pytest.fixture
+def broker():
+    broker = InMemoryBroker()
+    yield broker
+    broker.close()
+
+def collect(broker, topic, group_id, binding_keys, expected, **kwargs):
+    received = []
+    done = threading.Event()
+
+    def callback(key, message):
+        received.append((key, message))
+        if len(received) == expected:
+            done.set()
+
+    broker.start_consuming_in_thread(topic, group_id, callback, binding_keys=binding_keys, **kwargs)
+    return received, done
+
+def test_direct_commands_reach_only_their_agent(broker):
+    a1, a1_done = collect(broker, TopicType.COMMANDS, "agent-a1", ["broadcast", "a1"], 2)
+    a2, a2_done = collect(broker, TopicType.COMMANDS, "agent-a2", ["broadcast", "a2"], 1)
+
+    assert broker.publish(TopicType.COMMANDS, "a1", {"command_type": "execute"})
+    assert broker.publish(TopicType.COMMANDS, "broadcast", {"command_type": "abort"})
+
+    assert a1_done.wait(2) and a2_done.wait(2)
+    assert [k for k, _ in a1] == ["a1", "broadcast"]
+    assert [k for k, _ in a2] == ["broadcast"]
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setitem(TOPIC_POLICIES, TopicType.STATUS.value,
+                        TopicPolicy(max_retries=2, retry_delay_ms=10))
+
+def test_failed_message_is_retried(broker, fast_retries):
+    attempts = []
+    done = threading.Event()
+
+    def callback(key, message):
+        attempts.append((key, message["n"]))
+        if len(attempts) == 1:
+            raise RuntimeError("transient")
+        done.set()
+
+    broker.start_consuming_in_thread(TopicType.STATUS, "console-status", callback,
+                                     binding_keys=["agent.*.status"])
+    broker.publish(TopicType.STATUS, "agent.a1.status", {"n": 1})
+
+    assert done.wait(2)
+    assert attempts == [("agent.a1.status", 1), ("agent.a1.status", 1)]
+
+def test_poison_message_is_dead_lettered_and_replayed(broker, fast_retries):
+    attempts = []
+    healthy = threading.Event()
+
+    def callback(key, message):
+        attempts.append(message["n"])
+        if not healthy.is_set():
+            raise ValueError("bad command")
+
+    broker.start_consuming_in_thread(TopicType.STATUS, "console-status", callback,
+                                     binding_keys=["agent.*.status"])
+    broker.publish(TopicType.STATUS, "agent.a1.status", {"n": 1})
+
+    deadline = time.time() + 2
+    while not broker.get_dead_letters(TopicType.STATUS) and time.time() < deadline:
+        time.sleep(0.01)
+
+    # One delivery plus two retries, then it stops
+    assert attempts == [1, 1, 1]
+    [letter] = broker.get_dead_letters(TopicType.STATUS)
+    assert letter["routing_key"] == "agent.a1.status"
+    assert letter["queue"] == "do-control.status.console-status"
+    assert letter["retries"] == 2
+    assert "bad command" in letter["error"]
+    assert letter["message"] == {"n": 1}
+
+    healthy.set()
+    assert broker.replay_dead_letters(TopicType.STATUS) == 1
+    deadline = time.time() + 2
+    while len(attempts) < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    assert attempts == [1, 1, 1, 1]
+    assert broker.get_dead_letters(TopicType.STATUS) == []
+
+def test_undecodable_message_is_dead_lettered_without_retries(broker, fast_retries):
+    broker.start_consuming_in_thread(TopicType.STATUS, "console-status", lambda key, message: None,
+                                     binding_keys=["agent.*.status"])
+    broker._route(TopicType.STATUS.value, "agent.a1.status",
+                  pika.BasicProperties(content_type="application/json"), b"{not json")
+
+    deadline = time.time() + 2
+    while not broker.get_dead_letters(TopicType.STATUS) and time.time() < deadline:
+        time.sleep(0.01)
+    [letter] = broker.get_dead_letters(TopicType.STATUS)
+    assert letter["retries"] == 0
+    assert letter["error"].startswith("decode")
+
+def test_multicast_reaches_only_named_agents(broker):
+    received = {}
+    done = threading.Event()
+
+    def consumer(agent_id):
+        def callback(key, message):
+            received.setdefault(agent_id, []).append(key)
+            if sum(len(keys) for keys in received.values()) == MULTICAST_MAX_TARGETS + 1:
+                done.set()
+        return callback
+
+    agents = [f"a{i}" for i in range(MULTICAST_MAX_TARGETS + 2)]
+    for agent_id in agents:
+        broker.start_consuming_in_thread(TopicType.COMMANDS, f"agent-{agent_id}", consumer(agent_id),
+                                         binding_keys=["broadcast", agent_id], multicast_id=agent_id)
+
+    # More targets than fit in one message: published in two chunks
+    assert broker.publish_multicast(TopicType.COMMANDS, agents[1:], {"command_type": "prepare"})
+
+    assert done.wait(5)
+    assert set(received) == set(agents[1:])
+    assert all(keys == [MULTICAST_ROUTING_KEY] for keys in received.values())
+
+def test_targeted_multicasts_are_not_counted_as_gaps(broker):
+    received = []
+    done = threading.Event()
+
+    def callback(key, message):
+        received.append(message)
+        if len(received) == 15:
+            done.set()
+
+    for agent_id in ("a1", "a2"):
+        broker.start_consuming_in_thread(TopicType.COMMANDS, f"agent-{agent_id}", callback,
+                                         binding_keys=["broadcast", agent_id], multicast_id=agent_id)
+
+    # Each agent only gets the multicasts that name it
+    for i in range(10):
+        assert broker.publish_multicast(TopicType.COMMANDS, ["a1"] if i % 2 else ["a2"], {"i": i})
+    for i in range(5):
+        assert broker.publish(TopicType.COMMANDS, "a1", {"i": i})
+
+    assert done.wait(5)
+    stats = broker.latency.snapshot()[TopicType.COMMANDS.value]
+    assert (stats[MULTICAST_ROUTING_KEY]["count"], stats[MULTICAST_ROUTING_KEY]["gaps"]) == (10, 0)
+    assert stats[MULTICAST_ROUTING_KEY]["duplicates"] == 0
+    assert (stats["a1"]["count"], stats["a1"]["gaps"]) == (5, 0)
+
+def test_worker_dispatch_delivers_everything(broker):
+    received, done = collect(broker, TopicType.METRICS, "console-metrics", ["metrics.system.*"], 100,
+                             workers=4, ordered=True)
+
+    for i in range(100):
+        broker.publish(TopicType.METRICS, f"metrics.system.a{i % 5}", {"i": i})
+
+    assert done.wait(2)
+    per_agent = {}
+    for key, message in received:
+        per_agent.setdefault(key, []).append(message["i"])
+    assert all(values == sorted(values) for values in per_agent.values())
@@ -0,0 +1,372 @@
+import os
+import pytest
+import pika
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from common.spool import OutboundSpool, ReconnectBackoff, _encode_record
+from common.messaging import ConsumerDispatcher, MessageBroker, PublisherPool, TopicType, get_topic_policy
+
+@pytest.fixture
+def mock_connection():
+    connection = Mock()
+    connection.is_closed = False
+    connection.is_open = True
+    channel = Mock()
+    channel.is_closed = False
+    connection.channel.return_value = channel
+    return connection
+
+def test_publisher_pool_resolves_futures(mock_connection):
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        pool = PublisherPool("amqp://localhost", size=1)
+        futures = [
+            pool.submit("do-control.status", f"agent.{i}.status", b"{}", pika.BasicProperties())
+            for i in range(10)
+        ]
+
+        assert all(f.result(timeout=5) is True for f in futures)
+        pool.close()
+
+    channel = mock_connection.channel.return_value
+    assert channel.basic_publish.call_count == 10
+    channel.tx_select.assert_not_called()
+
+def test_publisher_pool_waits_for_confirms(mock_connection):
+    channel = mock_connection.channel.return_value
+
+    def publish(**kwargs):
+        if kwargs["routing_key"] == "metrics.system.unbound":
+            raise pika.exceptions.UnroutableError([])
+    channel.basic_publish.side_effect = publish
+
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        pool = PublisherPool("amqp://localhost", size=1, confirms=True, batch_size=50)
+        futures = [
+            pool.submit("do-control.metrics", "metrics.system.a", b"{}", pika.BasicProperties())
+            for _ in range(20)
+        ]
+        unroutable = pool.submit("do-control.metrics", "metrics.system.unbound", b"{}", pika.BasicProperties())
+
+        assert all(f.result(timeout=5) is True for f in futures)
+        with pytest.raises(pika.exceptions.UnroutableError):
+            unroutable.result(timeout=5)
+        pool.close()
+
+    channel.confirm_delivery.assert_called_once()
+    channel.tx_select.assert_not_called()
+    assert channel.basic_publish.call_count == 21
+    assert all(c.kwargs["mandatory"] for c in channel.basic_publish.call_args_list)
+    # A returned message is not spooled for retry
+    assert pool.spooled() == 0
+
+def test_publisher_pool_keeps_order_per_routing_key(mock_connection):
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        pool = PublisherPool("amqp://localhost", size=4, batch_size=3)
+        futures = [
+            pool.submit("do-control.status", f"agent.{i % 5}.status", f"{i}".encode(), pika.BasicProperties())
+            for i in range(200)
+        ]
+        for f in futures:
+            f.result(timeout=5)
+        pool.close()
+
+    sent = {}
+    for c in mock_connection.channel.return_value.basic_publish.call_args_list:
+        sent.setdefault(c.kwargs["routing_key"], []).append(int(c.kwargs["body"]))
+    assert sent == {f"agent.{k}.status": list(range(k, 200, 5)) for k in range(5)}
+
+def test_publisher_pool_spools_only_what_the_broker_did_not_confirm(mock_connection):
+    channel = mock_connection.channel.return_value
+    published, dropped = [], []
+
+    def publish(**kwargs):
+        if kwargs["body"] == b"2" and not dropped:
+            dropped.append(kwargs["body"])
+            raise pika.exceptions.AMQPConnectionError("connection lost")
+        published.append(kwargs["body"])
+    channel.basic_publish.side_effect = publish
+
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        pool = PublisherPool("amqp://localhost", size=1, confirms=True, batch_size=10,
+                             backoff=ReconnectBackoff(base=0.01, maximum=0.05))
+        # Hold the worker until the whole batch is queued
+        mock_connection.channel.side_effect = lambda: (time.sleep(0.1), channel)[1]
+        futures = [
+            pool.submit("do-control.status", "agent.a.result", f"{i}".encode(), pika.BasicProperties())
+            for i in range(5)
+        ]
+        assert all(f.result(timeout=5) is True for f in futures)
+        deadline = time.time() + 5
+        while not (pool.online and pool.spooled() == 0) and time.time() < deadline:
+            time.sleep(0.01)
+        pool.close()
+
+    # 0 and 1 were confirmed before the connection dropped and are not sent twice
+    assert published == [b"0", b"1", b"2", b"3", b"4"]
+
+def test_publisher_pool_spools_while_broker_is_down(mock_connection):
+    channel = mock_connection.channel.return_value
+    channel.basic_publish.side_effect = pika.exceptions.AMQPConnectionError("down")
+
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        pool = PublisherPool("amqp://localhost", size=1, backoff=ReconnectBackoff(base=0.01, maximum=0.05))
+        futures = [
+            pool.submit("do-control.status", "agent.a.result", f"{i}".encode(), pika.BasicProperties())
+            for i in range(5)
+        ]
+
+        # Accepted by the spool without waiting for the broker
+        assert all(f.result(timeout=5) is True for f in futures)
+        assert not pool.online
+        assert pool.spooled() == 5
+
+        # Broker comes back: the spool is replayed in order
+        channel.basic_publish.reset_mock(side_effect=True)
+        deadline = time.time() + 5
+        while not pool.online and time.time() < deadline:
+            time.sleep(0.01)
+        pool.close()
+
+    assert pool.spooled() == 0
+    bodies = [c.kwargs["body"] for c in channel.basic_publish.call_args_list]
+    assert bodies == [b"0", b"1", b"2", b"3", b"4"]
+
+def test_publisher_pool_retries_messages_a_full_queue_refused(mock_connection):
+    channel = mock_connection.channel.return_value
+    published, refusals = [], [2]
+
+    def publish(**kwargs):
+        if kwargs["body"] == b"1" and refusals[0]:
+            refusals[0] -= 1
+            raise pika.exceptions.NackError([])
+        published.append(kwargs["body"])
+    channel.basic_publish.side_effect = publish
+
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection) as connect:
+        pool = PublisherPool("amqp://localhost", size=1, confirms=True,
+                             backoff=ReconnectBackoff(base=0.01, maximum=0.05))
+        futures = [
+            pool.submit("do-control.status", "agent.a.result", f"{i}".encode(), pika.BasicProperties())
+            for i in range(3)
+        ]
+        assert all(f.result(timeout=5) is True for f in futures)
+        deadline = time.time() + 5
+        while not (pool.online and pool.spooled() == 0) and time.time() < deadline:
+            time.sleep(0.01)
+        pool.close()
+
+    assert published == [b"0", b"1", b"2"]
+    # A nack is not a broken connection: the worker and the replay thread connect once each
+    assert connect.call_count <= 2
+
+def test_consumer_queue_binds_only_requested_keys(mock_connection):
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        broker = MessageBroker("amqp://localhost")
+        channel = Mock()
+
+        queue_name = broker._declare_consumer_queue(
+            channel, "do-control.commands", "agent-a1", ["broadcast", "a1"]
+        )
+        broker.close()
+
+    assert queue_name == "do-control.commands.agent-a1"
+    bound = [c.kwargs["routing_key"] for c in channel.queue_bind.call_args_list
+             if c.kwargs["exchange"] == "do-control.commands"]
+    assert bound == ["broadcast", "a1"]
+    channel.queue_unbind.assert_called_once_with(
+        queue=queue_name, exchange="do-control.commands", routing_key="#"
+    )
+
+def test_consumer_queue_declares_retry_and_dead_letter_queues(mock_connection):
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        broker = MessageBroker("amqp://localhost")
+        channel = Mock()
+        broker._declare_consumer_queue(channel, "do-control.commands", "agent-a1", ["a1"])
+        broker.close()
+
+    declared = {c.kwargs["queue"]: c.kwargs["arguments"] for c in channel.queue_declare.call_args_list}
+    retry = declared["do-control.commands.agent-a1.retry"]
+    assert retry["x-dead-letter-exchange"] == ""
+    assert retry["x-dead-letter-routing-key"] == "do-control.commands.agent-a1"
+    assert retry["x-message-ttl"] == get_topic_policy("do-control.commands").retry_delay_ms
+    # Per-process agent queues expire, and their retry queues with them
+    assert retry["x-expires"] == declared["do-control.commands.agent-a1"]["x-expires"]
+    assert "do-control.commands.dead-letter" in declared
+    channel.queue_bind.assert_any_call(
+        exchange="do-control.commands.dlx", queue="do-control.commands.dead-letter", routing_key="#"
+    )
+
+def test_failed_delivery_is_retried_then_dead_lettered(mock_connection):
+    with patch("common.messaging.pika.BlockingConnection", return_value=mock_connection):
+        broker = MessageBroker("amqp://localhost")
+        broker.close()
+
+    def fail(key, message):
+        raise ValueError("bad command")
+
+    body, content_type, encoding = broker.codec.encode({"command_type": "execute"})
+    properties = pika.BasicProperties(content_type=content_type, content_encoding=encoding, headers={})
+    queue_name = "do-control.commands.agent-a1"
+    policy = get_topic_policy("do-control.commands")
+
+    key = "a1"
+    for attempt in range(policy.max_retries):
+        exchange, key, body, properties = broker._handle_delivery(
+            fail, False, "do-control.commands", queue_name, key, properties, body
+        )
+        assert (exchange, key) == ("", queue_name + ".retry")
+        assert properties.headers["x-retry-count"] == attempt + 1
+        assert properties.headers["x-original-routing-key"] == "a1"
+        # The retry queue expires messages back to the consumer queue
+        key = queue_name
+
+    exchange, key, body, properties = broker._handle_delivery(
+        fail, False, "do-control.commands", queue_name, key, properties, body
+    )
+    assert (exchange, key) == ("do-control.commands.dlx", "a1")
+    assert "bad command" in properties.headers["x-error"]
+
+    # Retrying redeclares the expiring retry queue to renew its lease
+    channel = Mock()
+    broker._settle(channel, 6, ("", queue_name + ".retry", body, properties), {"x-expires": 1})
+    channel.queue_declare.assert_called_once_with(queue=queue_name + ".retry", durable=True,
+                                                  arguments={"x-expires": 1})
+
+    channel = Mock()
+    broker._settle(channel, 7, (exchange, key, body, properties), {"x-expires": 1})
+    channel.queue_declare.assert_not_called()
+    channel.basic_publish.assert_called_once()
+    channel.basic_ack.assert_called_once_with(delivery_tag=7)
+    channel.basic_nack.assert_not_called()
+
+def test_dispatcher_keeps_per_key_order_and_settles_on_connection_thread():
+    connection = Mock()
+    settled = []
+    connection.add_callback_threadsafe.side_effect = lambda fn: settled.append(fn)
+    dispatcher = ConsumerDispatcher(connection, workers=4, ordered=True)
+    seen = {"agent.a.status": [], "agent.b.status": []}
+    done = threading.Event()
+
+    def make_task(key, i):
+        def task():
+            seen[key].append(i)
+            dispatcher.settle(lambda: None)
+            if len(settled) == 200:
+                done.set()
+        return task
+
+    for i in range(100):
+        for key in seen:
+            dispatcher.submit(key, make_task(key, i))
+
+    assert done.wait(5)
+    dispatcher.shutdown()
+    assert seen["agent.a.status"] == list(range(100))
+    assert seen["agent.b.status"] == list(range(100))
+
+def test_topic_policies_shape_queues_and_delivery():
+    metrics = get_topic_policy(TopicType.METRICS.value)
+    status = get_topic_policy(TopicType.STATUS.value)
+
+    assert metrics.delivery_mode == 1
+    assert metrics.queue_arguments()["x-overflow"] == "drop-head"
+    assert "x-max-length" in metrics.queue_arguments()
+    assert status.delivery_mode == 2
+    assert status.queue_arguments()["x-queue-mode"] == "lazy"
+    # Results must not be pushed out by a backlog
+    assert status.queue_arguments()["x-overflow"] == "reject-publish"
+    assert get_topic_policy("unknown").queue_arguments() == {}
+
+def test_spool_pages_through_file_and_preserves_order(tmp_path):
+    path = str(tmp_path / "agent.spool")
+    spool = OutboundSpool(path, memory_limit=3)
+    properties = pika.BasicProperties(content_type="application/json", delivery_mode=2, headers={"x-seq": 1})
+    for i in range(10):
+        assert spool.append(("do-control.status", f"k{i}", f"{i}".encode(), properties))
+
+    drained = []
+    while len(spool):
+        records = spool.peek(4)
+        drained.extend(record[2] for record in records)
+        spool.pop(len(records))
+
+    assert drained == [f"{i}".encode() for i in range(10)]
+    assert records[-1][3].headers == {"x-seq": 1}
+    spool.close()
+
+def test_spool_survives_restart(tmp_path):
+    path = str(tmp_path / "agent.spool")
+    spool = OutboundSpool(path, memory_limit=2)
+    for i in range(5):
+        spool.append(("do-control.status", "agent.a.result", f"{i}".encode(), pika.BasicProperties()))
+    spool.close()
+
+    reopened = OutboundSpool(path, memory_limit=2)
+    assert len(reopened) == 5
+    assert [r[2] for r in reopened.peek(2)] == [b"0", b"1"]
+    reopened.pop(2)
+    reopened.close()
+
+    # Records already sent are dropped on close
+    assert [r[2] for r in OutboundSpool(path).peek(10)] == [b"2", b"3", b"4"]
+
+def test_spool_survives_being_killed(tmp_path):
+    path = str(tmp_path / "agent.spool")
+    spool = OutboundSpool(path)
+    for i in range(3):
+        spool.append(("do-control.status", "agent.a.result", f"{i}".encode(), pika.BasicProperties()))
+    spool.peek(1)
+    spool.pop(1)
+
+    # Never closed, as after SIGKILL: nothing is lost, and the record sent
+    # since the file was last emptied is sent again. The dead process's
+    # file lock goes with it
+    spool._file.close()
+    reopened = OutboundSpool(path)
+    assert [r[2] for r in reopened.peek(10)] == [b"0", b"1", b"2"]
+    reopened.close()
+
+def test_spool_drops_oldest_records_beyond_its_size_limit(tmp_path):
+    path = str(tmp_path / "agent.spool")
+    record = lambda i: ("do-control.status", "agent.a.result", f"{i:04}".encode() * 25, pika.BasicProperties())
+    frame = len(_encode_record(record(0)))
+    spool = OutboundSpool(path, memory_limit=2, max_bytes=frame * 10)
+
+    # A replay peeks the oldest records, then older ones are dropped for room
+    head = spool.head
+    for i in range(5):
+        spool.append(record(i))
+    in_flight = spool.peek(2)
+    for i in range(5, 100):
+        assert spool.append(record(i))
+        assert os.path.getsize(path) <= frame * 20
+
+    assert (len(spool), spool.dropped) == (10, 90)
+    spool.pop(len(in_flight), head)
+    assert len(spool) == 10
+    assert [r[2][:4] for r in spool.peek(2)] == [b"0090", b"0091"]
+    spool.close()
+    assert os.path.getsize(path) == frame * 10
+
+    memory = OutboundSpool(memory_limit=3)
+    for i in range(5):
+        assert memory.append(record(i))
+    assert [r[2][:4] for r in memory.peek(5)] == [b"0002", b"0003", b"0004"]
+    assert memory.dropped == 2
+
+def test_agents_on_one_host_get_their_own_spool_files(tmp_path):
+    path = str(tmp_path / "agent.spool")
+    first, second = OutboundSpool(path), OutboundSpool(path)
+    assert (first.path, second.path) == (path, path + ".1")
+    first.append(("do-control.status", "agent.a.result", b"a", pika.BasicProperties()))
+    second.append(("do-control.status", "agent.b.result", b"b", pika.BasicProperties()))
+    assert [r[2] for r in second.peek(10)] == [b"b"]
+    first.close()
+    second.close()
+
+    # A restarted agent takes the first free file and replays what was left there
+    restarted = OutboundSpool(path)
+    assert [r[2] for r in restarted.peek(10)] == [b"a"]
+    restarted.close()
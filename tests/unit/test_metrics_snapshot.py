@@ -0,0 +1,111 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+import numpy as np
+
+from console.monitoring.service import MonitoringService
+from console.monitoring.snapshot import SnapshotWriter, export_agent, restore_snapshot, write_snapshot
+from console.monitoring.store import MetricsStore
+
+def filled_store(now):
+    store = MetricsStore(capacity=100, retention_seconds=100, rollups=((10, 20),))
+    for second in range(150):
+        store.append("a1", now - 150 + second, {"cpu_percent": float(second), "network": {"bytes_sent": second * 2}})
+    store.append("a2", now - 5, {"cpu_percent": 1.0})
+    return store
+
+def test_snapshot_round_trip(tmp_path):
+    now = time.time()
+    path = str(tmp_path / "metrics.snapshot")
+    original = filled_store(now)
+    size = write_snapshot(original, path)
+    saved = open(path, "rb").read()
+
+    store = MetricsStore(capacity=100, retention_seconds=100, rollups=((10, 20),))
+    assert restore_snapshot(store, path, now=now) == 2
+    assert len(saved) == size
+
+    timestamps, columns = store.query("a1", now - 200)
+    expected_timestamps, expected_columns = original.query("a1", now - 200)
+    np.testing.assert_array_equal(timestamps, expected_timestamps)
+    np.testing.assert_array_equal(columns["network/bytes_sent"], expected_columns["network/bytes_sent"])
+    assert store.latest("a2") == original.latest("a2")
+
+    tier, original_tier = store.tiers["a1"][0], original.tiers["a1"][0]
+    assert tier.open_bucket == original_tier.open_bucket
+    np.testing.assert_array_equal(tier.range(0)[1]["cpu_percent"]["p95"], original_tier.range(0)[1]["cpu_percent"]["p95"])
+
+    # The restored store keeps going; the mapped file is copy-on-write
+    for second in range(150):
+        store.append("a1", now + second, {"cpu_percent": -1.0})
+    assert len(store.series["a1"]) == 100
+    assert store.latest("a1")["metrics"]["cpu_percent"] == -1.0
+    assert open(path, "rb").read() == saved
+
+def test_stale_or_missing_snapshot_is_ignored(tmp_path):
+    now = time.time()
+    path = str(tmp_path / "metrics.snapshot")
+    write_snapshot(filled_store(now), path)
+
+    store = MetricsStore(capacity=100, retention_seconds=100, rollups=((10, 20),))
+    assert restore_snapshot(store, path, now=now + 1000) == 0
+    assert restore_snapshot(store, str(tmp_path / "missing"), now=now) == 0
+    assert store.agents() == []
+
+def test_service_restores_on_start_and_saves_on_stop(tmp_path):
+    path = str(tmp_path / "metrics.snapshot")
+    messaging = Mock()
+    messaging.register_metrics_handler = AsyncMock()
+    messaging.register_status_handler = AsyncMock()
+    messaging.register_output_handler = AsyncMock()
+
+    async def run():
+        first = MonitoringService(messaging, snapshot_path=path, snapshot_interval=0)
+        await first.start()
+        first._handle_metrics("metrics.system.a1", {"agent_id": "a1", "timestamp": time.time(), "metrics": {"cpu_percent": 7.0}})
+        await first.stop()
+
+        second = MonitoringService(messaging, snapshot_path=path, snapshot_interval=0)
+        await second.start()
+        return second.get_live_metrics()
+
+    live = asyncio.run(run())
+    assert live["a1"]["metrics"]["cpu_percent"] == 7.0
+
+def test_aborted_writer_does_not_disturb_another(tmp_path):
+    now = time.time()
+    store = filled_store(now)
+    path = str(tmp_path / "metrics.snapshot")
+    (tmp_path / "metrics.snapshot.crashed.tmp").write_bytes(b"partial")
+
+    cancelled, final = SnapshotWriter(path), SnapshotWriter(path)
+    cancelled.add("a1", *export_agent(store, "a1"))
+    final.add("a1", *export_agent(store, "a1"))
+    cancelled.abort()
+    final.finish()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["metrics.snapshot", "metrics.snapshot.crashed.tmp"]
+    assert restore_snapshot(MetricsStore(capacity=100, retention_seconds=100, rollups=((10, 20),)), path, now=now) == 1
+
+def test_stop_during_periodic_snapshot_still_saves(tmp_path):
+    path = str(tmp_path / "metrics.snapshot")
+    (tmp_path / "metrics.snapshot.crashed.tmp").write_bytes(b"partial")
+    messaging = Mock()
+    messaging.register_metrics_handler = AsyncMock()
+    messaging.register_status_handler = AsyncMock()
+    messaging.register_output_handler = AsyncMock()
+
+    async def run():
+        service = MonitoringService(messaging, snapshot_path=path, snapshot_interval=0.001)
+        await service.start()
+        for i in range(200):
+            service._handle_metrics(f"metrics.system.a{i}", {"agent_id": f"a{i}", "timestamp": time.time(),
+                                                             "metrics": {"cpu_percent": 1.0}})
+        await asyncio.sleep(0.05)
+        await service.stop()
+
+    asyncio.run(run())
+    # Stale temporary files are cleared on start, and the last snapshot is complete
+    assert [p.name for p in tmp_path.iterdir()] == ["metrics.snapshot"]
+    assert restore_snapshot(MetricsStore(), path) == 200
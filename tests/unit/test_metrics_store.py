@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+import pytest
+
+from console.monitoring.store import AgentSeries, MetricsStore, flatten_metrics, unflatten_metrics
+
+def test_flatten_round_trip():
+    metrics = {
+        "cpu_percent": 37.5,
+        "network": {"bytes_sent": 18234512},
+        "time_sync": {"using_ntp": True, "sync_error": None},
+        "messaging": {"do-control.commands": {"p99_ms": 4.2}},
+    }
+
+    flat = flatten_metrics(metrics)
+
+    assert flat == {
+        "cpu_percent": 37.5,
+        "network/bytes_sent": 18234512.0,
+        "time_sync/using_ntp": 1.0,
+        "messaging/do-control.commands/p99_ms": 4.2,
+    }
+    assert unflatten_metrics(flat)["messaging"] == {"do-control.commands": {"p99_ms": 4.2}}
+
+@pytest.mark.parametrize("appended", [3, 5, 8, 13])
+def test_range_matches_a_linear_scan_across_wraparound(appended):
+    series = AgentSeries(capacity=5)
+    for t in range(appended):
+        series.append(float(t), {"cpu": t * 10.0})
+
+    kept = list(range(max(0, appended - 5), appended))
+    for since in range(-1, appended + 1):
+        for until in (None, since + 2):
+            timestamps, columns = series.range(since, until)
+            expected = [t for t in kept if t > since and (until is None or t <= until)]
+            assert timestamps.tolist() == expected
+            assert columns["cpu"].tolist() == [t * 10.0 for t in expected]
+
+def test_evict_before_and_out_of_order():
+    series = AgentSeries(capacity=8)
+    for t in range(6):
+        series.append(float(t), {"cpu": 1.0})
+
+    assert series.evict_before(3.5) == 4
+    assert series.range(-1)[0].tolist() == [4.0, 5.0]
+    assert not series.append(4.5, {"cpu": 1.0})
+    assert series.dropped == 1
+
+def test_new_and_missing_columns_read_nan():
+    series = AgentSeries(capacity=4)
+    series.append(1.0, {"cpu": 1.0})
+    series.append(2.0, {"cpu": 2.0, "mem": 50.0})
+    series.append(3.0, {"mem": 60.0})
+
+    _, columns = series.range(0)
+    assert np.isnan(columns["mem"][0]) and np.isnan(columns["cpu"][2])
+    timestamp, values = series.latest()
+    assert timestamp == 3.0 and values["mem"] == 60.0
+    assert math.isnan(values["cpu"])
+
+def test_store_evicts_by_retention_and_returns_nested_entries():
+    store = MetricsStore(capacity=100, retention_seconds=10)
+    for t in range(30):
+        store.append("a1", 1000.0 + t, {"cpu_percent": float(t), "network": {"bytes_recv": t}})
+
+    entries = store.entries("a1", since=0)
+    assert [e["timestamp"] for e in entries] == [1000.0 + t for t in range(19, 30)]
+    assert entries[-1]["metrics"] == {"cpu_percent": 29.0, "network": {"bytes_recv": 29.0}}
+    assert store.latest("a1")["timestamp"] == 1029.0
+    assert store.entries("missing", since=0) == []
+
+def test_rollup_buckets_summarize_raw_samples():
+    store = MetricsStore(capacity=1000, retention_seconds=1000, rollups=[(10, 100), (60, 100)])
+    for t in range(125):
+        store.append("a1", 1000.0 + t, {"cpu_percent": float(t % 10), "network": {"bytes_sent": t}})
+
+    tier10, tier60 = store.tiers["a1"]
+    entries = store.rollup_entries(tier10, since=0)
+    # 1000..1119 closed; the bucket holding the newest samples is still open
+    assert [e["timestamp"] for e in entries] == [1000.0 + 10 * i for i in range(12)]
+    cpu = entries[0]["metrics"]["cpu_percent"]
+    assert cpu["count"] == 10 and cpu["min"] == 0 and cpu["max"] == 9
+    assert cpu["mean"] == pytest.approx(4.5)
+    assert cpu["p50"] == pytest.approx(4.5) and cpu["p99"] == pytest.approx(8.91, rel=1e-3)
+    assert entries[0]["interval"] == 10
+    assert entries[3]["metrics"]["network"]["bytes_sent"]["max"] == 39
+
+    # 1000 is not on a minute boundary: buckets start at 960, 1020 and 1080
+    minute = store.rollup_entries(tier60, since=0)
+    assert [e["timestamp"] for e in minute] == [960.0, 1020.0]
+    assert minute[0]["metrics"]["cpu_percent"]["count"] == 20
+
+def test_select_tier_fits_the_point_budget():
+    store = MetricsStore(capacity=3600, retention_seconds=3600, rollups=[(10, 360 * 6), (60, 1440)])
+    for t in range(3600):
+        store.append("a1", float(t), {"cpu_percent": 1.0})
+
+    assert store.select_tier("a1", since=3299) is None
+    assert store.select_tier("a1", since=3299, max_points=300) is None
+    assert store.select_tier("a1", since=-1, max_points=1000).interval == 10
+    assert store.select_tier("a1", since=-1, max_points=100).interval == 60
+    # Older than the raw retention: only the tiers cover it
+    assert store.select_tier("a1", since=-7200).interval == 10
+
+def test_series_grows_to_capacity():
+    series = AgentSeries(capacity=200)
+    for t in range(150):
+        series.append(float(t), {"cpu": float(t)})
+    assert series.timestamps.size == 200
+    assert series.range(139)[1]["cpu"].tolist() == [float(t) for t in range(140, 150)]
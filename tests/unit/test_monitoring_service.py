@@ -0,0 +1,134 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from common.histogram import Histogram
+from console.monitoring.live import LiveGroup
+from console.monitoring.service import MonitoringService
+
+@pytest.fixture
+def mock_messaging_service():
+    mock = Mock()
+    mock.register_metrics_handler = AsyncMock()
+    mock.register_status_handler = AsyncMock()
+    mock.register_output_handler = AsyncMock()
+    return mock
+
+@pytest.fixture
+def monitoring_service(mock_messaging_service):
+    return MonitoringService(mock_messaging_service, retention_seconds=60)
+
+def metrics_message(agent_id, timestamp, cpu):
+    return {"agent_id": agent_id, "timestamp": timestamp, "metrics": {"cpu_percent": cpu}}
+
+def test_start_registers_one_consumer(monitoring_service, mock_messaging_service):
+    asyncio.run(monitoring_service.start())
+    asyncio.run(monitoring_service.start())
+
+    mock_messaging_service.register_metrics_handler.assert_awaited_once_with(monitoring_service._handle_metrics)
+    mock_messaging_service.register_status_handler.assert_awaited_once_with(monitoring_service._handle_status)
+    mock_messaging_service.register_output_handler.assert_awaited_once_with(monitoring_service._handle_output)
+
+def test_buffer_keeps_recent_metrics(monitoring_service):
+    now = time.time()
+    for i, age in enumerate([120, 50, 20, 5]):
+        monitoring_service._handle_metrics("metrics.system.a1", metrics_message("a1", now - age, i))
+    monitoring_service._handle_metrics("metrics.system.a2", metrics_message("a2", now - 90, 9))
+
+    # Older than the retention window relative to the newest sample
+    assert len(monitoring_service.store.series["a1"]) == 3
+    assert [m["metrics"]["cpu_percent"] for m in monitoring_service.get_agent_metrics("a1", 0.5)] == [2, 3]
+    assert monitoring_service.get_agent_metrics("missing") == []
+
+    live = monitoring_service.get_live_metrics(lookback_minutes=1)
+    assert list(live) == ["a1"]
+    assert live["a1"]["metrics"]["cpu_percent"] == 3
+
+def test_invalid_metrics_are_ignored(monitoring_service):
+    monitoring_service._handle_metrics("metrics.system.a1", {"agent_id": "a1"})
+    assert monitoring_service.store.agents() == []
+
+def test_load_stats_are_kept_apart_from_system_metrics(monitoring_service):
+    now = time.time()
+    monitoring_service._handle_metrics("metrics.system.a1", metrics_message("a1", now - 2, 40.0))
+    for t in (-1.5, -0.5):
+        monitoring_service._handle_metrics("metrics.load.a1", {
+            "agent_id": "a1", "command_id": "c1", "timestamp": now + t,
+            "metrics": {"load": {"rps": 100.0, "latency_histogram": Histogram().to_dict()}},
+        })
+    # A system sample older than the newest load second is still stored
+    monitoring_service._handle_metrics("metrics.system.a1", metrics_message("a1", now - 1, 50.0))
+
+    assert [m["metrics"]["cpu_percent"] for m in monitoring_service.get_agent_metrics("a1", 0.5)] == [40.0, 50.0]
+    assert monitoring_service.get_live_metrics()["a1"]["metrics"] == {"cpu_percent": 50.0}
+    load = monitoring_service.get_agent_metrics("a1", 0.5, load=True)
+    assert [m["metrics"] for m in load] == [{"load": {"rps": 100.0}}] * 2
+    fleet = monitoring_service.query_fleet("load/rps", now - 3, now, step=3)
+    assert fleet["stats"]["mean"] == [100.0]
+
+def test_idle_agents_are_evicted_everywhere(mock_messaging_service):
+    service = MonitoringService(mock_messaging_service, retention_seconds=60, agent_idle_seconds=600,
+                                eviction_interval=3600)
+    group = service.live.groups[1.0] = LiveGroup(service.store, 1.0)
+    now = time.time()
+    # The first check is an hour away
+    for agent_id, age in (("alive", 10), ("gone", 900)):
+        service._handle_metrics(f"metrics.system.{agent_id}", metrics_message(agent_id, now - age, 95.0))
+        service._handle_metrics(f"metrics.load.{agent_id}", {
+            "agent_id": agent_id, "command_id": "c1", "timestamp": now - age,
+            "metrics": {"load": {"rps": 1.0, "latency_histogram": Histogram().to_dict()}},
+        })
+        group.tick()
+    service.alerts.active[("gone", "cpu_saturated")] = {"agent_id": "gone"}
+
+    assert service.evict_idle_agents(now) == ["gone"]
+    assert service.store.agents() == ["alive"]
+    assert service.load_store.agents() == ["alive"]
+    assert set(service.alerts._states) == {"alive"}
+    assert service.alerts.active == {}
+    assert list(group.snapshot()["agents"]) == ["alive"]
+
+def test_execution_metrics_follow_agent_windows(monitoring_service):
+    start = time.time() - 50
+    monitoring_service.track_execution("e1", ["a1", "a2"], start, duration=30)
+    for t in range(-10, 45, 5):
+        monitoring_service._handle_metrics("metrics.system.a1", metrics_message("a1", start + t, 10.0))
+        monitoring_service._handle_metrics("metrics.system.a2", metrics_message("a2", start + t, 30.0))
+        monitoring_service._handle_metrics("metrics.system.a3", metrics_message("a3", start + t, 99.0))
+
+    # a1 starts late and finishes early; a2 never reports and keeps the schedule
+    monitoring_service._handle_status("agent.a1.status", {
+        "agent_id": "a1", "details": {"execution_id": "e1", "executing": True, "start_time": start + 10}
+    })
+    monitoring_service._handle_status("agent.a1.result", {
+        "agent_id": "a1", "execution_id": "e1", "timestamp": start + 20, "result": {}
+    })
+
+    metrics = monitoring_service.get_execution_metrics("e1")
+    assert set(metrics["agents"]) == {"a1", "a2"}
+    assert metrics["agents"]["a1"]["timestamps"] == [start + 15, start + 20]
+    assert metrics["agents"]["a2"]["timestamps"] == [start + t for t in (5, 10, 15, 20, 25, 30)]
+    assert (metrics["start"], metrics["end"]) == (start, start + 30)
+
+    fleet = metrics["fleet"]
+    assert fleet["step"] == 5
+    cpu = fleet["metrics"]["cpu_percent"]
+    assert max(cpu["agents"]) == 2
+    assert max(v for v in cpu["max"] if v is not None) == 30.0
+    assert 20.0 in cpu["mean"]
+    assert cpu["mean"][0] is None  # no samples in the first step
+
+    assert monitoring_service.get_execution_metrics("missing") is None
+
+def test_broadcast_execution_learns_members_from_status(monitoring_service):
+    start = time.time() - 20
+    monitoring_service.track_execution("e2", None, start, duration=None)
+    monitoring_service._handle_status("agent.a1.status", {
+        "agent_id": "a1", "details": {"execution_id": "e2", "execution_status": "error"}, "timestamp": start + 1
+    })
+    monitoring_service.finish_execution("e2", start + 5)
+
+    record = monitoring_service.executions.get("e2")
+    assert list(record.agents) == ["a1"]
+    assert record.agent_window("a1", time.time()) == (start, start + 1)
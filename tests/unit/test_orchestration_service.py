@@ -0,0 +1,153 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from datetime import datetime
+import json
+
+from agent.main import Agent
+from console.messaging.service import MessagingService
+from console.orchestration.service import DispatchError, NoTargetsError, OrchestrationService
+from console.api.models.db_models import DBDroplet, DBTestConfiguration
+from common.loopback import InMemoryBroker
+from common.models import ExecutionStatus
+
+@pytest.fixture
+def mock_messaging_service():
+    mock = Mock()
+    mock.send_command = AsyncMock(return_value=True)
+    mock.send_direct_command = AsyncMock(return_value=True)
+    mock.send_multicast_command = AsyncMock(return_value=True)
+    return mock
+
+@pytest.fixture
+def orchestration_service(test_db, mock_messaging_service):
+    with patch("console.orchestration.service.TimeSynchronizer") as time_sync:
+        time_sync.return_value.calculate_execution_time.return_value = 1700000005.0
+        yield OrchestrationService(test_db, mock_messaging_service)
+
+def add_test_config(test_db, target_droplets, without_agent=()):
+    for droplet_id in target_droplets:
+        test_db.add(DBDroplet(
+            id=droplet_id,
+            name=f"droplet-{droplet_id}",
+            region="nyc1",
+            size="s-1vcpu-1gb",
+            ip_address="10.0.0.1",
+            status="active",
+            created_at=datetime.utcnow(),
+            agent_id=None if droplet_id in without_agent else f"agent-{droplet_id}"
+        ))
+    test_db.add(DBTestConfiguration(
+        id="config-1",
+        name="smoke",
+        command="echo hello",
+        parameters=json.dumps({}),
+        target_droplets=json.dumps(target_droplets),
+        created_at=datetime.utcnow(),
+        created_by="tester"
+    ))
+    test_db.commit()
+
+def test_execute_test_multicasts_prepare_to_known_targets(orchestration_service, mock_messaging_service, test_db):
+    add_test_config(test_db, ["d1", "d2", "d3"], without_agent=["d3"])
+    test_db.query(DBTestConfiguration).filter_by(id="config-1").update(
+        {"target_droplets": json.dumps(["d1", "missing", "d3", "agent-d2"])}
+    )
+    test_db.commit()
+    orchestration_service._monitoring_service = Mock()
+
+    execution = asyncio.run(orchestration_service.execute_test("config-1"))
+
+    assert execution.status == ExecutionStatus.PREPARING
+    assert execution.dispatch_ms is not None
+    mock_messaging_service.send_direct_command.assert_not_awaited()
+    mock_messaging_service.send_multicast_command.assert_awaited_once()
+    # Agents listen under their own ids, not the droplets'
+    targets, command = mock_messaging_service.send_multicast_command.await_args.args
+    assert targets == ["agent-d1", "agent-d2"]
+    assert command["command_type"] == "prepare"
+    assert command["execution_time"] == 1700000005.0
+    orchestration_service.monitoring_service.track_execution.assert_called_once_with(
+        execution.id, ["agent-d1", "agent-d2"], 1700000005.0, None
+    )
+
+def test_execute_test_fails_when_dispatch_eats_the_lead(orchestration_service, mock_messaging_service, test_db):
+    add_test_config(test_db, ["d1"])
+
+    async def slow_multicast(targets, command):
+        await asyncio.sleep(0.05)
+        return True
+    mock_messaging_service.send_multicast_command.side_effect = slow_multicast
+
+    with patch("console.orchestration.service.settings") as settings:
+        settings.TEST_START_LEAD_MS = 40
+        settings.DISPATCH_BUDGET_FRACTION = 0.5
+        with pytest.raises(DispatchError):
+            asyncio.run(orchestration_service.execute_test("config-1"))
+
+    [execution] = orchestration_service.list_executions()
+    assert execution.status == ExecutionStatus.FAILED
+    targets, abort = mock_messaging_service.send_multicast_command.await_args.args
+    assert (targets, abort["command_type"]) == (["agent-d1"], "abort")
+
+def test_execute_test_unknown_config(orchestration_service):
+    with pytest.raises(ValueError):
+        asyncio.run(orchestration_service.execute_test("missing"))
+
+def test_execute_test_rejects_when_no_target_exists(orchestration_service, mock_messaging_service, test_db):
+    add_test_config(test_db, ["idle"], without_agent=["idle"])
+    test_db.query(DBTestConfiguration).filter_by(id="config-1").update(
+        {"target_droplets": json.dumps(["gone-1", "idle"])}
+    )
+    test_db.commit()
+
+    with pytest.raises(NoTargetsError):
+        asyncio.run(orchestration_service.execute_test("config-1"))
+    mock_messaging_service.send_multicast_command.assert_not_awaited()
+    assert orchestration_service.list_executions() == []
+
+class LoopbackConsoleBroker:
+    """The console's async broker interface on top of the in-process broker"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def publish(self, topic, key, message):
+        return self.broker.publish(topic, key, message)
+
+    async def publish_multicast(self, topic, targets, message):
+        return self.broker.publish_multicast(topic, targets, message)
+
+def test_targeted_execution_reaches_the_agents_on_its_droplets(test_db):
+    broker = InMemoryBroker()
+    prepared = {}
+    agents = []
+    for _ in range(3):
+        with patch("agent.main.MessageBroker", return_value=broker), patch("agent.main.TimeSynchronizer"):
+            agent = Agent("http://console", "amqp://localhost")
+        agent._send_status = Mock()
+        agent._prepare_execution = lambda command, agent=agent: prepared.setdefault(agent.id, command)
+        agent._setup_messaging()
+        agents.append(agent)
+    add_test_config(test_db, ["d1", "d2", "d3"])
+    # The droplets know their agents from registration
+    for droplet_id, agent in zip(("d1", "d2", "d3"), agents):
+        test_db.query(DBDroplet).filter_by(id=droplet_id).update({"agent_id": agent.id})
+    test_db.query(DBTestConfiguration).filter_by(id="config-1").update({"target_droplets": json.dumps(["d1", "d3"])})
+    test_db.commit()
+
+    with patch("console.orchestration.service.TimeSynchronizer") as time_sync:
+        time_sync.return_value.calculate_execution_time.return_value = 1700000005.0
+        service = OrchestrationService(test_db, MessagingService(LoopbackConsoleBroker(broker)), Mock())
+        execution = asyncio.run(service.execute_test("config-1"))
+
+    deadline = time.time() + 5
+    while len(prepared) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    # Give a stray delivery to d2's agent time to show up
+    time.sleep(0.05)
+    broker.close()
+
+    assert set(prepared) == {agents[0].id, agents[2].id}
+    assert all(command["execution_id"] == execution.id for command in prepared.values())
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from agent.sampler import CLOCK_TICKS, PAGE_SIZE, ProcSampler
+
+NET_DEV_HEADER = (
+    "Inter-|   Receive                                                |  Transmit\n"
+    " face |bytes    packets errs drop fifo frame compressed multicast|"
+    "bytes    packets errs drop fifo colls carrier compressed\n"
+)
+
+def write_proc(root, cpu, cores, eth0, tcp, process_ticks):
+    """A minimal /proc tree; rewritten in place so open handles see the new contents"""
+    (root / "net").mkdir(exist_ok=True)
+    (root / "self").mkdir(exist_ok=True)
+    lines = [f"cpu  {' '.join(map(str, cpu))} 0 0"]
+    lines += [f"cpu{index} {' '.join(map(str, ticks))} 0 0" for index, ticks in enumerate(cores)]
+    (root / "stat").write_text("\n".join(lines) + "\nintr 12345 0 0\nctxt 999\n")
+    (root / "meminfo").write_text(
+        "MemTotal:        1000 kB\nMemFree:          100 kB\nMemAvailable:     250 kB\n"
+        "Cached:           300 kB\nSwapTotal:        200 kB\nSwapFree:         150 kB\n"
+    )
+    rx_bytes, rx_packets, tx_bytes, tx_packets, rx_drops = eth0
+    (root / "net" / "dev").write_text(
+        NET_DEV_HEADER
+        + "    lo: 99999 99 0 0 0 0 0 0 99999 99 0 0 0 0 0 0\n"
+        + f"  eth0: {rx_bytes} {rx_packets} 0 {rx_drops} 0 0 0 0 {tx_bytes} {tx_packets} 0 0 0 0 0 0\n"
+    )
+    retrans, out_segs, established = tcp
+    (root / "net" / "snmp").write_text(
+        "Ip: Forwarding DefaultTTL\nIp: 1 64\n"
+        "Tcp: RtoAlgorithm CurrEstab OutSegs RetransSegs\n"
+        f"Tcp: 1 {established} {out_segs} {retrans}\n"
+    )
+    (root / "net" / "sockstat").write_text(
+        "sockets: used 10\nTCP: inuse 7 orphan 1 tw 30 alloc 9 mem 2\nUDP: inuse 3 mem 1\n"
+    )
+    # The command name may contain spaces and parentheses
+    fields = ["S"] + ["0"] * 10 + [str(process_ticks), "0"] + ["0"] * 4 + ["12"] + ["0"] * 3 + ["50"]
+    (root / "self" / "stat").write_text(f"42 (python (x) y) {' '.join(fields)}\n")
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_rates_and_percentages_between_samples(tmp_path):
+    clock = FakeClock()
+    write_proc(tmp_path, cpu=[100, 0, 100, 800, 0, 0, 0, 0], cores=[[50, 0, 50, 400, 0, 0, 0, 0]] * 2,
+               eth0=(1000, 10, 500, 5, 0), tcp=(10, 1000, 4), process_ticks=0)
+    sampler = ProcSampler(root=str(tmp_path), clock=clock)
+    assert ProcSampler.available(str(tmp_path))
+
+    clock.now += 0.5
+    write_proc(tmp_path, cpu=[200, 0, 100, 900, 0, 0, 0, 0],
+               cores=[[150, 0, 50, 400, 0, 0, 0, 0], [50, 0, 50, 500, 0, 0, 0, 0]],
+               eth0=(6000, 60, 1500, 15, 2), tcp=(15, 1100, 5), process_ticks=CLOCK_TICKS // 10)
+    sample = sampler.sample()
+    sampler.close()
+
+    assert sample["interval"] == 0.5
+    assert sample["cpu_percent"] == 50.0
+    assert sample["cpu"]["user"] == 50.0
+    assert sample["cpu"]["cores"] == {"0": 100.0, "1": 0.0}
+    assert sample["memory_percent"] == 75.0
+    assert sample["memory"]["swap_used_bytes"] == 50 * 1024
+
+    network = sample["network"]
+    assert (network["bytes_recv"], network["bytes_sent"]) == (6000, 1500)
+    assert network["rx_bytes_per_s"] == 10000.0
+    assert network["tx_packets_per_s"] == 20.0
+    assert network["rx_drops_per_s"] == 4.0
+    assert list(network["interfaces"]) == ["eth0"]
+
+    tcp = sample["tcp"]
+    assert tcp["retrans_segs_per_s"] == 10.0
+    assert tcp["retrans_percent"] == 5.0
+    assert (tcp["established"], tcp["tcp_inuse"], tcp["tcp_time_wait"], tcp["udp_inuse"]) == (5, 7, 30, 3)
+
+    assert sample["process"]["cpu_percent"] == pytest.approx(20.0, abs=1)
+    assert sample["process"]["threads"] == 12
+    assert sample["process"]["rss_bytes"] == 50 * PAGE_SIZE
+
+def test_new_interfaces_and_counter_resets_report_zero(tmp_path):
+    clock = FakeClock()
+    write_proc(tmp_path, cpu=[100] * 8, cores=[], eth0=(1000, 10, 500, 5, 0), tcp=(10, 1000, 4), process_ticks=0)
+    sampler = ProcSampler(root=str(tmp_path), clock=clock)
+
+    clock.now += 1
+    # The interface was recreated and its counters started over
+    write_proc(tmp_path, cpu=[100] * 8, cores=[], eth0=(10, 1, 5, 1, 0), tcp=(10, 1000, 4), process_ticks=0)
+    sample = sampler.sample()
+    assert sample["network"]["rx_bytes_per_s"] == 0.0
+    assert sample["cpu_percent"] == 0.0
+    assert sample["tcp"]["retrans_percent"] == 0.0
+    sampler.close()
+
+def test_reads_live_proc():
+    if not ProcSampler.available():
+        pytest.skip("no /proc on this host")
+    sampler = ProcSampler()
+    sample = sampler.sample()
+    sampler.close()
+    assert 0.0 <= sample["cpu_percent"] <= 100.0
+    assert 0.0 < sample["memory_percent"] < 100.0
+    assert sample["process"]["threads"] >= 1
+    assert sample["process"]["rss_bytes"] > 0
+    assert "lo" not in sample["network"]["interfaces"]
+
+def test_missing_proc_files_fail_cleanly(tmp_path):
+    write_proc(tmp_path, cpu=[100] * 8, cores=[], eth0=(0, 0, 0, 0, 0), tcp=(0, 0, 0), process_ticks=0)
+    os.remove(tmp_path / "self" / "stat")
+    assert not ProcSampler.available(str(tmp_path))
+    open_fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+    with pytest.raises(OSError):
+        ProcSampler(root=str(tmp_path))
+    # The files opened before the missing one are closed again
+    if open_fds is not None:
+        assert len(os.listdir("/proc/self/fd")) == open_fds
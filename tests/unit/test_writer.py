@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from common.spool import ReconnectBackoff
+from console.monitoring.writer import LineProtocolFileSink, TimeSeriesWriter, encode_line, metrics_to_line
+
+class RecordingSink:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.closed = False
+        self.written = threading.Event()
+
+    def write(self, lines):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("influxdb unavailable")
+        self.batches.append(list(lines))
+        self.written.set()
+
+    def close(self):
+        self.closed = True
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+def test_encode_line_escapes_and_uses_float_fields():
+    line = encode_line("agent metrics", {"agent_id": "a,1"}, {"cpu=percent": 3, "bad": float("nan")}, 1.5)
+    assert line == "agent\\ metrics,agent_id=a\\,1 cpu\\=percent=3.0 1500000000"
+    assert encode_line("m", {}, {"bad": float("inf")}, 1.0) is None
+
+def test_metrics_to_line_flattens_nested_metrics():
+    line = metrics_to_line("a1", 2.0, {"cpu_percent": 5.5, "network": {"bytes_sent": 10}, "note": "x"})
+    assert line == "agent_metrics,agent_id=a1 cpu_percent=5.5,network/bytes_sent=10.0 2000000000"
+
+def test_writer_flushes_full_batches_before_the_interval():
+    sink = RecordingSink()
+    writer = TimeSeriesWriter(sink, batch_size=3, flush_interval=60)
+    for i in range(6):
+        writer.submit("a1", float(i), {"cpu_percent": i})
+
+    assert wait_for(lambda: writer.flushed == 6)
+    assert [len(batch) for batch in sink.batches] == [3, 3]
+    writer.close()
+    assert sink.closed
+
+def test_writer_flushes_partial_batch_on_interval():
+    sink = RecordingSink()
+    writer = TimeSeriesWriter(sink, batch_size=100, flush_interval=0.05)
+    writer.submit("a1", 1.0, {"cpu_percent": 1})
+
+    assert sink.written.wait(2)
+    assert writer.stats()["flushed"] == 1
+    writer.close()
+
+def test_writer_retries_and_sheds_oldest_points_under_backpressure():
+    sink = RecordingSink(failures=2)
+    writer = TimeSeriesWriter(sink, batch_size=2, flush_interval=0.01, max_queued=3,
+                              backoff=ReconnectBackoff(base=0.05, maximum=0.05))
+    writer.submit("a1", 0.0, {"cpu_percent": 0})
+    writer.submit("a1", 1.0, {"cpu_percent": 1})
+    assert wait_for(lambda: writer.failed_flushes >= 1)
+
+    # The first batch is being retried; the queue only holds max_queued points
+    for i in range(2, 7):
+        writer.submit("a1", float(i), {"cpu_percent": i})
+
+    assert wait_for(lambda: writer.flushed == 5)
+    stats = writer.stats()
+    assert stats["failed_flushes"] == 2
+    assert stats["dropped"] == 2
+    assert stats["flush_latency"]["count"] == 3
+    flushed = [line.rsplit(" ", 1)[1] for batch in sink.batches for line in batch]
+    assert flushed == [str(i * 10**9) for i in (0, 1, 4, 5, 6)]
+    writer.close()
+
+def test_file_sink_appends_lines(tmp_path):
+    path = tmp_path / "metrics" / "points.lp"
+    writer = TimeSeriesWriter(LineProtocolFileSink(str(path)), batch_size=10, flush_interval=0.01)
+    writer.submit("a1", 1.0, {"cpu_percent": 1})
+    writer.submit("a2", 2.0, {"cpu_percent": 2})
+    writer.close()
+
+    assert path.read_text().splitlines() == [
+        "agent_metrics,agent_id=a1 cpu_percent=1.0 1000000000",
+        "agent_metrics,agent_id=a2 cpu_percent=2.0 2000000000",
+    ]